@@ -8,6 +8,7 @@ import torch.nn.functional as F
 from rl_main.main_constants import *
 
 from rl_main import rl_utils
+from rl_main.algorithms_rl.advantage import discounted_scan, normalize_advantages
 from rl_main.utils import print_torch
 
 Transition = namedtuple('Transition', ('state', 'action', 'next_state', 'adjusted_reward'))
@@ -50,8 +51,11 @@ class DQN_v0:
         self.logger = logger
         self.verbose = verbose
 
-        self.policy_model = rl_utils.get_rl_model(self.env).to(device)
-        self.target_model = rl_utils.get_rl_model(self.env).to(device)
+        self.vector_env = rl_utils.get_vector_environment(self.env, NUM_ENVS_PER_WORKER)
+
+        # the target model (worker_id -1) never loads a save file; it is copied from the policy model below
+        self.policy_model = rl_utils.get_rl_model(self.env, self.worker_id).to(device)
+        self.target_model = rl_utils.get_rl_model(self.env, -1).to(device)
 
         self.target_model.load_state_dict(self.policy_model.state_dict())
         self.target_model.eval()
@@ -67,25 +71,31 @@ class DQN_v0:
         self.model = self.policy_model
 
     def on_episode(self, episode):
-        state = self.env.reset()
+        # every env plays one episode; the score is their average
+        states = self.vector_env.reset()
 
-        done = False
         score = 0.0
 
-        while not done:
+        while self.vector_env.num_active_envs > 0:
             if self.env_render:
-                self.env.render()
+                self.vector_env.render()
+
+            actions = self.select_epsilon_greedy_actions(states)
 
-            action = self.select_epsilon_greedy_action(state)
+            env_indices, next_states, rewards, adjusted_rewards, dones, infos, _ = self.vector_env.step(
+                actions, auto_reset=False
+            )
 
-            next_state, reward, adjusted_reward, done, info = self.env.step(action)
+            # Store the transitions in memory
+            for i in range(len(env_indices)):
+                self.memory.push(states[i], actions[i:i + 1], next_states[i], adjusted_rewards[i])
 
-            # Store the transition in memory
-            self.memory.push(state, action, next_state, adjusted_reward)
+            # Move to the next states
+            if self.vector_env.num_active_envs > 0:
+                states = self.vector_env.states
+            score += float(rewards.sum())
 
-            # Move to the next state
-            state = next_state
-            score += reward
+        score /= self.vector_env.num_envs
 
         gradients, loss = self.train_net()
 
@@ -96,19 +106,32 @@ class DQN_v0:
         return gradients, loss, score
 
     # epsilon greedy policy
-    def select_epsilon_greedy_action(self, state):
-        sample = random.random()
+    def select_epsilon_greedy_actions(self, states):
+        """
+        Args:
+            states(numpy.ndarray): [N, ...] shape의 states입니다.
+
+        Returns:
+             [N, 1] shape의 actions를 반환합니다. greedy action들은 한 번의 batch forward로 구합니다.
+        """
+        num_states = len(states)
         epsilon_threshold = EPSILON_END + (EPSILON_START - EPSILON_END) * math.exp(-1. * self.steps_done / EPSILON_DECAY_RATE)
-        self.steps_done += 1
-        if sample > epsilon_threshold:
+        self.steps_done += num_states
+
+        is_random_action = [random.random() <= epsilon_threshold for _ in range(num_states)]
+        if all(is_random_action):
+            actions = torch.zeros([num_states, 1], device=device, dtype=torch.long)
+        else:
             with torch.no_grad():
                 # t.max(1) will return largest column value of each row.
                 # second column on max result is index of where max element was
                 # found, so we pick action with the larger expected reward.
-                action, _ = self.policy_model.act(state)
-                return action.unsqueeze(0)
-        else:
-            return torch.tensor([[random.randrange(self.env.n_actions)]], device=device, dtype=torch.long)
+                actions, _ = self.policy_model.act(torch.as_tensor(states, dtype=torch.float, device=device))
+
+        for i in range(num_states):
+            if is_random_action[i]:
+                actions[i, 0] = random.randrange(self.env.n_actions)
+        return actions
 
     def train_net(self):
         if len(self.memory) < DQN_BATCH_SIZE:
@@ -172,13 +195,10 @@ class DQN_v0:
         # print_torch("delta", delta)
         # print_torch("delta_0", delta[0])
 
-        advantage_batch = torch.zeros([DQN_BATCH_SIZE, 1], device=device)
-        advantage = 0.0
-        reverse_index_list = list(range(delta.size()[0]))[::-1]
-        for idx_t in reverse_index_list:
-            advantage = self.gamma * GAE_LAMBDA * advantage + delta[idx_t]
-            advantage_batch[idx_t] = advantage
-        advantage_batch = (advantage_batch - advantage_batch.mean()) / torch.max(advantage_batch.std(), torch.tensor(1e-6, dtype=torch.float))
+        # a final state ends the accumulation like an episode boundary
+        advantage_batch = normalize_advantages(
+            discounted_scan(delta, non_final_mask.unsqueeze(dim=1), self.gamma * GAE_LAMBDA)
+        )
         # print_torch("advantage_batch", advantage_batch)
 
         advantage_loss = advantage_batch.pow(2).mean()
@@ -197,12 +217,27 @@ class DQN_v0:
             param.grad.data.clamp_(-1, 1)
         self.optimizer.step()
 
-        gradients = self.policy_model.get_gradients_for_current_parameters()
+        gradients = self.policy_model.get_flat_gradients()
 
         return gradients, loss.item()
 
     def get_parameters(self):
-        return self.policy_model.get_parameters()
+        return self.policy_model.get_flat_parameters()
+
+    def get_training_state(self):
+        # the replay memory is not kept; it is refilled from the resumed epsilon schedule
+        return {
+            "model": self.policy_model.state_dict(),
+            "target_model": self.target_model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "steps_done": self.steps_done
+        }
+
+    def set_training_state(self, training_state):
+        self.policy_model.load_state_dict(training_state["model"])
+        self.target_model.load_state_dict(training_state["target_model"])
+        self.optimizer.load_state_dict(training_state["optimizer"])
+        self.steps_done = training_state["steps_done"]
 
     def transfer_process(self, parameters, soft_transfer, soft_transfer_tau):
         self.policy_model.transfer_process(parameters, soft_transfer, soft_transfer_tau)
\ No newline at end of file
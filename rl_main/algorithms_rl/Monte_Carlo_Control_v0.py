@@ -140,3 +140,12 @@ class Monte_Carlo_Control_v0:
         #self.print_q_table()
         return gradients, loss, score
 
+    def get_training_state(self):
+        return {
+            "Q": self.Q,
+            "epsilon": self.epsilon
+        }
+
+    def set_training_state(self, training_state):
+        self.Q = training_state["Q"]
+        self.epsilon = training_state["epsilon"]
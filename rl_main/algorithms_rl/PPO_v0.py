@@ -4,14 +4,101 @@ import sys
 import time
 
 import numpy as np
-import random
 import torch
 import torch.nn.functional as F
 
 from rl_main import rl_utils
+from rl_main.algorithms_rl.advantage import get_gae_advantages, normalize_advantages
 from rl_main.main_constants import device, PPO_K_EPOCH, GAE_LAMBDA, PPO_EPSILON_CLIP, \
     PPO_VALUE_LOSS_WEIGHT, PPO_ENTROPY_WEIGHT, TRAJECTORY_SAMPLING, TRAJECTORY_LIMIT_SIZE, TRAJECTORY_BATCH_SIZE, \
-    LEARNING_RATE, ENVIRONMENT_ID
+    LEARNING_RATE, ENVIRONMENT_ID, NUM_ENVS_PER_WORKER
+
+
+class RolloutBuffer:
+    """
+    PPO_v0가 num_envs개의 envs에서 모은 transition들을 미리 할당한 [capacity, num_envs, ...] tensors에 제자리에서 기록합니다.
+    transition들은 env별로 따로 쌓이며, tensors는 첫 transition의 shape으로 할당되고 용량이 모자라면 두 배로 늘립니다.
+    get()은 envs의 transition들을 env 순서대로 이어 붙여 반환하며, num_envs가 1이면 복사 없이 view들을 반환합니다.
+    """
+    def __init__(self, capacity, num_envs, device):
+        self.capacity = capacity
+        self.num_envs = num_envs
+        self.device = device
+        self.sizes = torch.zeros(num_envs, dtype=torch.long, device=device)
+
+        self.states = None
+        self.actions = None
+        self.rewards = None
+        self.log_probs = None
+        self.done_masks = None
+        self.values = None
+
+    def __len__(self):
+        return int(self.sizes.sum())
+
+    def allocate(self, capacity, state, action):
+        self.capacity = capacity
+        self.states = torch.zeros((capacity, self.num_envs) + tuple(state.shape), dtype=torch.float, device=self.device)
+        self.actions = torch.zeros((capacity, self.num_envs) + tuple(action.shape), dtype=action.dtype, device=self.device)
+        self.rewards = torch.zeros((capacity, self.num_envs, 1), dtype=torch.float, device=self.device)
+        self.log_probs = torch.zeros((capacity, self.num_envs, 1), dtype=torch.float, device=self.device)
+        self.done_masks = torch.zeros((capacity, self.num_envs, 1), dtype=torch.float, device=self.device)
+        self.values = torch.zeros((capacity, self.num_envs, 1), dtype=torch.float, device=self.device)
+
+    def grow(self):
+        names = ["states", "actions", "rewards", "log_probs", "done_masks", "values"]
+        old_tensors = [getattr(self, name) for name in names]
+        max_size = int(self.sizes.max())
+        self.allocate(self.capacity * 2, self.states[0, 0], self.actions[0, 0])
+        for name, old_tensor in zip(names, old_tensors):
+            getattr(self, name)[:max_size].copy_(old_tensor[:max_size])
+
+    def add(self, env_indices, states, actions, rewards, log_probs, dones, values):
+        """
+        env_indices의 각 env에 transition을 하나씩 추가합니다.
+
+        Args:
+            env_indices(list): transition들을 만든 envs의 index입니다. (중복 없음)
+            states: [len(env_indices), ...] shape의 states입니다. (numpy.ndarray 혹은 torch.Tensor)
+            actions(torch.Tensor): model.act가 반환한 [len(env_indices), ...] shape의 actions입니다.
+            rewards(numpy.ndarray): adjusted rewards입니다.
+            log_probs(torch.Tensor): actions의 [len(env_indices), 1] shape의 log probability입니다.
+            dones(numpy.ndarray): episode가 끝났는지 여부입니다.
+            values(torch.Tensor): states의 [len(env_indices), 1] shape의 critic value입니다.
+        """
+        states = torch.as_tensor(states, dtype=torch.float, device=self.device)
+        if self.states is None:
+            self.allocate(self.capacity, states[0], actions[0])
+
+        env_indices = torch.as_tensor(env_indices, dtype=torch.long, device=self.device)
+        rows = self.sizes[env_indices]
+        while int(rows.max()) >= self.capacity:
+            self.grow()
+
+        self.states[rows, env_indices] = states
+        self.actions[rows, env_indices] = actions.to(self.device)
+        self.rewards[rows, env_indices, 0] = torch.as_tensor(rewards, dtype=torch.float, device=self.device)
+        self.log_probs[rows, env_indices] = log_probs.to(self.device)
+        self.done_masks[rows, env_indices, 0] = 1.0 - torch.as_tensor(dones, dtype=torch.float, device=self.device)
+        self.values[rows, env_indices] = values.to(self.device)
+        self.sizes[env_indices] += 1
+
+    def get(self):
+        """
+        Returns:
+             PPO_v0.train_net()이 사용하는 (states, actions, rewards, done_masks, log_probs, values)를 반환합니다.
+             env마다의 transition들이 시간 순서대로 이어지므로, 각 env가 끝난 episode들만 담고 있으면 done mask로 env 사이가 끊어집니다.
+        """
+        tensors = [self.states, self.actions, self.rewards, self.done_masks, self.log_probs, self.values]
+        sizes = self.sizes.tolist()
+        if self.num_envs == 1:
+            return tuple(tensor[:sizes[0], 0] for tensor in tensors)
+        return tuple(
+            torch.cat([tensor[:sizes[env_idx], env_idx] for env_idx in range(self.num_envs)]) for tensor in tensors
+        )
+
+    def clear(self):
+        self.sizes.zero_()
 
 
 class PPO_v0:
@@ -25,7 +112,13 @@ class PPO_v0:
         # discount rate
         self.gamma = gamma
 
-        self.trajectory = []
+        self.vector_env = rl_utils.get_vector_environment(self.env, NUM_ENVS_PER_WORKER)
+
+        self.trajectory = RolloutBuffer(
+            capacity=2 * max(TRAJECTORY_LIMIT_SIZE, TRAJECTORY_BATCH_SIZE),
+            num_envs=self.vector_env.num_envs,
+            device=device
+        )
 
         # learning rate
         self.learning_rate = LEARNING_RATE
@@ -42,242 +135,199 @@ class PPO_v0:
         )
 
     def put_data(self, transition):
-        self.trajectory.append(transition)
+        self.trajectory.add(*transition)
 
-    def get_trajectory_data(self, sampling=False):
-        # print("Before - Trajectory Size: {0}".format(len(self.trajectory)))
+    def get_minibatch_indices(self, num_transitions):
+        """
+        한 epoch 동안 rollout 전체를 한 번씩 사용하도록 index를 섞어 minibatch들로 나눕니다.
+        TRAJECTORY_SAMPLING이면 TRAJECTORY_BATCH_SIZE개 내외의 고른 크기로 나누고, 아니면 rollout 전체를 하나의 minibatch로 사용합니다.
 
-        state_lst, action_lst, reward_lst, next_state_lst, prob_action_lst, done_mask_lst = [], [], [], [], [], []
-        if sampling:
-            sampling_index = random.randrange(0, len(self.trajectory) - TRAJECTORY_BATCH_SIZE + 1)
-            trajectory = self.trajectory[sampling_index : sampling_index + TRAJECTORY_BATCH_SIZE]
+        Returns:
+             minibatch별 index tensor들의 list를 반환합니다.
+        """
+        if TRAJECTORY_SAMPLING:
+            num_minibatches = max(1, num_transitions // TRAJECTORY_BATCH_SIZE)
         else:
-            trajectory = self.trajectory
-
-        for transition in trajectory:
-            s, a, r, s_prime, prob_a, done = transition
-
-            if type(s) is np.ndarray:
-                state_lst.append(s)
-            else:
-                state_lst.append(s.numpy())
-
-            action_lst.append(a)
-            reward_lst.append([r])
-
-            if type(s) is np.ndarray:
-                next_state_lst.append(s_prime)
-            else:
-                next_state_lst.append(s_prime.numpy())
-
-            prob_action_lst.append([prob_a])
-
-            done_mask = 0 if done else 1
-            done_mask_lst.append([done_mask])
-
-        state_lst = torch.tensor(state_lst, dtype=torch.float).to(device)
-        # action_lst = torch.tensor(action_lst).to(device)
-        action_lst = torch.cat(action_lst, 0).to(device)
-        reward_lst = torch.tensor(reward_lst).to(device)
-        next_state_lst = torch.tensor(next_state_lst, dtype=torch.float).to(device)
-        done_mask_lst = torch.tensor(done_mask_lst, dtype=torch.float).to(device)
-        prob_action_lst = torch.tensor(prob_action_lst).to(device)
-
-        # print("After - Trajectory Size: {0}".format(len(self.trajectory)))
-
-        # print("state_lst.size()", state_lst.size())
-        # print("action_lst.size()", action_lst.size())
-        # print("reward_lst.size()", reward_lst.size())
-        # print("next_state_lst.size()", next_state_lst.size())
-        # print("done_mask_lst.size()", done_mask_lst.size())
-        # print("prob_action_lst.size()", prob_action_lst.size())
-        return state_lst, action_lst, reward_lst, next_state_lst, done_mask_lst, prob_action_lst
+            num_minibatches = 1
+        return torch.chunk(torch.randperm(num_transitions, device=device), num_minibatches)
 
     def train_net(self):
+        state_lst, action_lst, reward_lst, done_mask_lst, prob_action_lst, state_values = self.trajectory.get()
 
-        state_lst, action_lst, reward_lst, next_state_lst, done_mask_lst, prob_action_lst = self.get_trajectory_data()
+        # the old values are the critic values recorded while acting; with them the critic targets and advantages
+        # are fixed for the rollout and shared by all PPO_K_EPOCH epochs
+        with torch.no_grad():
+            # every env's transitions are whole episodes, so the next state's value is the next row's value
+            # wherever the episode goes on (done_mask_lst zeroes it where the episode ended)
+            next_state_values = torch.cat([state_values[1:], torch.zeros_like(state_values[:1])])
 
-        loss_sum = 0.0
-        for i in range(PPO_K_EPOCH):
-            if TRAJECTORY_SAMPLING:
-                state_lst, action_lst, reward_lst, next_state_lst, done_mask_lst, prob_action_lst = self.get_trajectory_data(sampling=True)
-            else:
-                pass
-            # print("WORKER: {0} - PPO_K_EPOCH: {1}/{2} - state_lst: {3}".format(self.worker_id, i+1, PPO_K_EPOCH, state_lst.size()))
-
-
-            state_values = self.model.get_critic_value(state_lst)
-
-            # discount_r_lst = []
-            # discounted_reward = 0
-            # for r in reversed(reward_lst):
-            #     discounted_reward = r + (self.gamma * discounted_reward)
-            #     discount_r_lst.insert(0, discounted_reward)
-            # discount_r = torch.tensor(discount_r_lst, dtype=torch.float).to(device)
-            #
-            # # Normalizing the rewards:
-            # discount_r = (discount_r - discount_r.mean()) / (discount_r.std() + 1e-5)
-            # discount_r = discount_r.unsqueeze(dim=1)
-            #
-            # advantage = (discount_r - state_values).detach()
-
-            v_target = reward_lst + self.gamma * self.model.get_critic_value(next_state_lst) * done_mask_lst
-
-            delta = v_target - state_values
-            delta = delta.detach().numpy()
-
-            advantage_lst = []
-            advantage = 0.0
-            for i, delta_t in enumerate(delta[::-1]):
-                advantage = self.gamma * GAE_LAMBDA * done_mask_lst[i] * advantage + delta_t[0]
-                advantage_lst.append([advantage])
-            advantage_lst.reverse()
-            advantage_lst = torch.tensor(advantage_lst, device=device, dtype=torch.float)
-            advantage_lst = (advantage_lst - advantage.mean() + torch.tensor(1e-6, dtype=torch.float)) / torch.max(
-                advantage_lst.std(),
-                torch.tensor(1e-6, dtype=torch.float)
+            advantage_lst = get_gae_advantages(
+                reward_lst, state_values, next_state_values, done_mask_lst, self.gamma, GAE_LAMBDA
             )
+            v_target_lst = advantage_lst + state_values
+            advantage_lst = normalize_advantages(advantage_lst)
 
-            critic_loss = PPO_VALUE_LOSS_WEIGHT * F.smooth_l1_loss(input=state_values, target=v_target.detach())
-            # critic_loss = PPO_VALUE_LOSS_WEIGHT * F.smooth_l1_loss(input=state_values, target=discount_r.detach())
-
-            self.optimizer.zero_grad()
-            critic_loss.mean().backward()
-            self.optimizer.step()
-
-            _, new_prob_action_lst, dist_entropy = self.model.evaluate_for_other_actions(state_lst, action_lst)
-
-            ratio = torch.exp(new_prob_action_lst - prob_action_lst)  # a/b == exp(log(a)-log(b))
-            surr1 = ratio * advantage_lst
-            surr2 = torch.clamp(ratio, 1 - PPO_EPSILON_CLIP, 1 + PPO_EPSILON_CLIP) * advantage_lst
-
-            # loss = -torch.mean(torch.min(surr1, surr2)) + PPO_VALUE_LOSS_WEIGHT * torch.mean(
-            #     torch.mul(advantage_lst, advantage_lst)) - PPO_ENTROPY_WEIGHT * dist_entropy
-
-            actor_loss = - torch.min(surr1, surr2).to(device) - PPO_ENTROPY_WEIGHT * dist_entropy
-
-            self.optimizer.zero_grad()
-            actor_loss.mean().backward()
-            self.optimizer.step()
-
-            loss = critic_loss + actor_loss
-
-            # print("state_lst_mean: {0}".format(state_lst.mean()))
-            # print("next_state_lst_mean: {0}".format(next_state_lst.mean()))
-            # print("advantage_lst: {0}".format(advantage_lst[:3]))
-            # print("pi: {0}".format(pi[:3]))
-            # print("prob: {0}".format(new_prob_action_lst[:3]))
-            # print("prob_action_lst: {0}".format(prob_action_lst[:3]))
-            # print("new_prob_action_lst: {0}".format(new_prob_action_lst[:3]))
-            # print("ratio: {0}".format(ratio[:3]))
-            # print("surr1: {0}".format(surr1[:3]))
-            # print("surr2: {0}".format(surr2[:3]))
-            # print("entropy: {0}".format(entropy[:3]))
-            # print("self.model.v(state_lst): {0}".format(self.model.v(state_lst)[:3]))
-            # print("v_target: {0}".format(v_target[:3]))
-            # print("F.smooth_l1_loss(self.model.v(state_lst), v_target.detach()): {0}".format(F.smooth_l1_loss(self.model.v(state_lst), v_target.detach())))
-            # print("loss: {0}".format(loss[:3]))
-
-            # params = self.model.get_parameters()
-            # for layer in params:
-            #     for name in params[layer]:
-            #         print(layer, name, "params[layer][name]", params[layer][name])
-            #         break
-            #     break
-            #
-            # print("GRADIENT!!!")
-
-
-            # actor_fc_named_parameters = self.model.actor_fc_layer.named_parameters()
-            # critic_fc_named_parameters = self.model.critic_fc_layer.named_parameters()
-            # for name, param in actor_fc_named_parameters:
-            #     print("!!!!!!!!!!!!!! - 1 - actor", name)
-            #     print(param.grad)
-            # for name, param in critic_fc_named_parameters:
-            #     print("!!!!!!!!!!!!!! - 2 - critic", name)
-            #     print(param.grad)
-
-            # self.optimizer.zero_grad()
-            # loss.mean().backward()
-            # self.optimizer.step()
-
-            # actor_fc_named_parameters = self.model.actor_fc_layer.named_parameters()
-            # critic_fc_named_parameters = self.model.critic_fc_layer.named_parameters()
-            # for name, param in actor_fc_named_parameters:
-            #     print("!!!!!!!!!!!!!! - 3 - actor", name)
-            #     print(param.grad)
-            # for name, param in critic_fc_named_parameters:
-            #     print("!!!!!!!!!!!!!! - 4 - critic", name)
-            #     print(param.grad)
-
-            # self.optimizer.zero_grad()
-            # loss.mean().backward()
-            # self.optimize_step()
-
-            # grads = self.model.get_gradients_for_current_parameters()
-            # for layer in params:
-            #     for name in params[layer]:
-            #         print(layer, name, "grads[layer][name]", grads[layer][name])
-            #         break
-            #     break
-            #
-            #
-            #
-            # params = self.model.get_parameters()
-            # for layer in params:
-            #     for name in params[layer]:
-            #         print(layer, name, "params[layer][name]", params[layer][name])
-            #         break
-            #     break
-
-            loss_sum += loss.mean().item()
+        loss_sum = 0.0
+        num_updates = 0
+        for i in range(PPO_K_EPOCH):
+            for minibatch_indices in self.get_minibatch_indices(len(self.trajectory)):
+                states = state_lst[minibatch_indices]
+                actions = action_lst[minibatch_indices]
+                prob_actions = prob_action_lst[minibatch_indices]
+                advantages = advantage_lst[minibatch_indices]
+
+                # one forward gives both the critic values and the new log probabilities,
+                # and the combined loss is minimized with a single backward pass
+                minibatch_state_values, new_prob_action_lst, dist_entropy = self.model.evaluate_for_other_actions(
+                    states, actions
+                )
+
+                critic_loss = PPO_VALUE_LOSS_WEIGHT * F.smooth_l1_loss(
+                    input=minibatch_state_values, target=v_target_lst[minibatch_indices]
+                )
+
+                ratio = torch.exp(new_prob_action_lst - prob_actions)  # a/b == exp(log(a)-log(b))
+                surr1 = ratio * advantages
+                surr2 = torch.clamp(ratio, 1 - PPO_EPSILON_CLIP, 1 + PPO_EPSILON_CLIP) * advantages
+
+                actor_loss = - torch.min(surr1, surr2).to(device) - PPO_ENTROPY_WEIGHT * dist_entropy
+
+                loss = critic_loss + actor_loss
+
+                self.optimizer.zero_grad()
+                loss.mean().backward()
+                self.optimizer.step()
+
+                # print("state_lst_mean: {0}".format(state_lst.mean()))
+                # print("advantage_lst: {0}".format(advantage_lst[:3]))
+                # print("pi: {0}".format(pi[:3]))
+                # print("prob: {0}".format(new_prob_action_lst[:3]))
+                # print("prob_action_lst: {0}".format(prob_action_lst[:3]))
+                # print("new_prob_action_lst: {0}".format(new_prob_action_lst[:3]))
+                # print("ratio: {0}".format(ratio[:3]))
+                # print("surr1: {0}".format(surr1[:3]))
+                # print("surr2: {0}".format(surr2[:3]))
+                # print("entropy: {0}".format(entropy[:3]))
+                # print("self.model.v(state_lst): {0}".format(self.model.v(state_lst)[:3]))
+                # print("v_target: {0}".format(v_target[:3]))
+                # print("F.smooth_l1_loss(self.model.v(state_lst), v_target.detach()): {0}".format(F.smooth_l1_loss(self.model.v(state_lst), v_target.detach())))
+                # print("loss: {0}".format(loss[:3]))
+
+                # params = self.model.get_parameters()
+                # for layer in params:
+                #     for name in params[layer]:
+                #         print(layer, name, "params[layer][name]", params[layer][name])
+                #         break
+                #     break
+                #
+                # print("GRADIENT!!!")
+
+
+                # actor_fc_named_parameters = self.model.actor_fc_layer.named_parameters()
+                # critic_fc_named_parameters = self.model.critic_fc_layer.named_parameters()
+                # for name, param in actor_fc_named_parameters:
+                #     print("!!!!!!!!!!!!!! - 1 - actor", name)
+                #     print(param.grad)
+                # for name, param in critic_fc_named_parameters:
+                #     print("!!!!!!!!!!!!!! - 2 - critic", name)
+                #     print(param.grad)
+
+                # self.optimizer.zero_grad()
+                # loss.mean().backward()
+                # self.optimizer.step()
+
+                # actor_fc_named_parameters = self.model.actor_fc_layer.named_parameters()
+                # critic_fc_named_parameters = self.model.critic_fc_layer.named_parameters()
+                # for name, param in actor_fc_named_parameters:
+                #     print("!!!!!!!!!!!!!! - 3 - actor", name)
+                #     print(param.grad)
+                # for name, param in critic_fc_named_parameters:
+                #     print("!!!!!!!!!!!!!! - 4 - critic", name)
+                #     print(param.grad)
+
+                # self.optimizer.zero_grad()
+                # loss.mean().backward()
+                # self.optimize_step()
+
+                # grads = self.model.get_gradients_for_current_parameters()
+                # for layer in params:
+                #     for name in params[layer]:
+                #         print(layer, name, "grads[layer][name]", grads[layer][name])
+                #         break
+                #     break
+                #
+                #
+                #
+                # params = self.model.get_parameters()
+                # for layer in params:
+                #     for name in params[layer]:
+                #         print(layer, name, "params[layer][name]", params[layer][name])
+                #         break
+                #     break
+
+                loss_sum += loss.mean().item()
+                num_updates += 1
 
         self.trajectory.clear()
 
-        gradients = self.model.get_gradients_for_current_parameters()
-        return gradients, loss_sum / PPO_K_EPOCH
+        gradients = self.model.get_flat_gradients()
+        return gradients, loss_sum / num_updates
 
     def on_episode(self, episode):
 
         score = 0.0
-        number_of_reset_call = 0.0
 
         if TRAJECTORY_SAMPLING:
             max_trajectory_len = TRAJECTORY_LIMIT_SIZE
         else:
             max_trajectory_len = 0
 
-        while not len(self.trajectory) >= max_trajectory_len:
-            done = False
-            # state = self.env.reset() + (0.001 * np.random.randn(2) + self.avg_list[self.worker_id])
-            state = self.env.reset()
-            number_of_reset_call += 1.0
-            while not done:
-                #start_time = datetime.datetime.now()
-                if self.env_render:
-                    self.env.render()
-                action, prob = self.model.act(state)
-
-                # For Pendulum
-                # action = np.clip(action, -2.0000, 2.0000)
-
-                # For continuous Env noise
-                # action = action + np.random.normal(self.avg_list[self.worker_id], 0.005, 1)
-
-                next_state, reward, adjusted_reward, done, info = self.env.step(action)
-
-                if "dead" in info.keys():
-                    if info["dead"]:
-                        self.put_data((state, action, adjusted_reward, next_state, prob, info["dead"]))
-                else:
-                    self.put_data((state, action, adjusted_reward, next_state, prob, done))
+        # every env plays whole episodes: an env that finishes its episode starts a new one
+        # only while the trajectory is still shorter than max_trajectory_len
+        # state = self.env.reset() + (0.001 * np.random.randn(2) + self.avg_list[self.worker_id])
+        states = self.vector_env.reset()
+        number_of_reset_call = float(self.vector_env.num_envs)
+
+        while self.vector_env.num_active_envs > 0:
+            if self.env_render:
+                self.vector_env.render()
+            # one batched forward for all active envs; the log probabilities are stored as data only, so no graph is built
+            with torch.no_grad():
+                actions, probs, values = self.model.act_with_critic_value(
+                    torch.as_tensor(states, dtype=torch.float, device=device)
+                )
+
+            # For Pendulum
+            # action = np.clip(action, -2.0000, 2.0000)
+
+            # For continuous Env noise
+            # action = action + np.random.normal(self.avg_list[self.worker_id], 0.005, 1)
+
+            env_indices, next_states, rewards, adjusted_rewards, dones, infos, _ = self.vector_env.step(
+                actions, auto_reset=False
+            )
 
+            # with "dead" in info, only the transitions that end in death are stored, as done
+            is_stored = np.array(["dead" not in info or info["dead"] for info in infos], dtype=np.bool_)
+            stored_dones = np.array([info["dead"] if "dead" in info else done for info, done in zip(infos, dones)], dtype=np.bool_)
+            if is_stored.all():
+                self.put_data((env_indices, states, actions, adjusted_rewards, probs, stored_dones, values))
+            elif is_stored.any():
+                stored = np.flatnonzero(is_stored)
+                stored_tensor = torch.as_tensor(stored, dtype=torch.long, device=device)
+                self.put_data((
+                    [env_indices[i] for i in stored], states[stored], actions[stored_tensor], adjusted_rewards[stored],
+                    probs[stored_tensor], stored_dones[stored], values[stored_tensor]
+                ))
+
+            score += float(rewards.sum())
+
+            if len(self.trajectory) < max_trajectory_len:
+                number_of_reset_call += self.vector_env.reset_finished_envs()
+
+            if self.vector_env.num_active_envs > 0:
                 # state = next_state + (np.random.normal(self.avg_list[self.worker_id], 0.0005, 2))
-                state = next_state
-                score += reward
-                #elapsed_time = datetime.datetime.now() - start_time
-
-                #print(elapsed_time, " !!!")
+                states = self.vector_env.states
 
         avrg_score = score / number_of_reset_call
         self.scores[self.worker_id] = avrg_score
@@ -286,7 +336,19 @@ class PPO_v0:
         return gradients, loss, avrg_score
 
     def get_parameters(self):
-        return self.model.get_parameters()
+        return self.model.get_flat_parameters()
+
+    def get_training_state(self):
+        return {
+            "model": self.model.state_dict(),
+            "optimizer": self.optimizer.state_dict(),
+            "scores": self.scores
+        }
+
+    def set_training_state(self, training_state):
+        self.model.load_state_dict(training_state["model"])
+        self.optimizer.load_state_dict(training_state["optimizer"])
+        self.scores = training_state["scores"]
 
     def transfer_process(self, parameters, soft_transfer, soft_transfer_tau):
         self.model.transfer_process(parameters, soft_transfer, soft_transfer_tau, self.scores)
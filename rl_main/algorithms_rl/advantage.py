@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+import torch
+
+# steps per block of the reverse scan; a block is solved with one [SCAN_BLOCK_SIZE x SCAN_BLOCK_SIZE] matrix product per env
+SCAN_BLOCK_SIZE = 256
+
+
+def discounted_scan(values, masks, discount, bootstrap=None):
+    """
+    y_t = x_t + discount * m_t * y_(t+1), y_T = bootstrap 를 time 축으로 거꾸로 누적합니다.
+    m_t == 0 (done)이면 다음 step의 값이 이전 step으로 넘어가지 않으므로 episode 경계를 넘지 않습니다.
+    step마다 Python loop를 돌지 않고 SCAN_BLOCK_SIZE개의 step씩 할인 행렬을 곱하며, block 사이에서만 값을 넘깁니다.
+    x에 대해 미분 가능합니다.
+
+    Args:
+        values(torch.Tensor): [T, ...] shape의 x입니다. 두 번째 이후의 차원은 병렬 envs 등 서로 독립인 sequence들입니다.
+        masks(torch.Tensor): values와 같은 shape(혹은 broadcast 가능한 shape)의 done mask입니다. (done이면 0, 아니면 1)
+        discount(float): 할인율입니다.
+        bootstrap(torch.Tensor): 마지막 step 다음의 값 y_T입니다. None이면 0입니다.
+
+    Returns:
+         values와 같은 shape의 y를 반환합니다.
+    """
+    shape = values.shape
+    num_steps = shape[0]
+    x = values.reshape(num_steps, -1)
+    masks = masks.to(x.dtype).expand(shape).reshape(num_steps, -1)
+    num_sequences = x.size(1)
+
+    # ends[i] is the number of episode ends before step i; steps t < k share an episode iff ends[t] == ends[k]
+    ends = torch.cat([torch.zeros(1, num_sequences, dtype=x.dtype, device=x.device), torch.cumsum(1.0 - masks, dim=0)])
+
+    if bootstrap is None:
+        carry = torch.zeros(num_sequences, dtype=x.dtype, device=x.device)
+    else:
+        carry = torch.as_tensor(bootstrap, dtype=x.dtype, device=x.device).expand(shape[1:]).reshape(num_sequences)
+
+    blocks = []
+    for start in reversed(range(0, num_steps, SCAN_BLOCK_SIZE)):
+        end = min(start + SCAN_BLOCK_SIZE, num_steps)
+        length = end - start
+
+        steps = torch.arange(length, device=x.device)
+        offsets = steps.unsqueeze(0) - steps.unsqueeze(1)
+        powers = torch.pow(discount, offsets.clamp(min=0).to(x.dtype)) * (offsets >= 0).to(x.dtype)
+
+        block_ends = ends[start:end + 1].t()
+        is_same_episode = (block_ends[:, :length].unsqueeze(2) == block_ends[:, :length].unsqueeze(1)).to(x.dtype)
+
+        # weights[n, t, k]: discount^(k - t) when step k's value reaches step t of sequence n
+        weights = powers.unsqueeze(0) * is_same_episode
+        block = torch.einsum("ntk,kn->tn", weights, x[start:end])
+
+        carry_weights = torch.pow(discount, (length - steps).to(x.dtype)).unsqueeze(1) * \
+            (block_ends[:, :length] == block_ends[:, length:]).t().to(x.dtype)
+        block = block + carry_weights * carry
+
+        carry = block[0]
+        blocks.append(block)
+
+    return torch.cat(blocks[::-1]).reshape(shape)
+
+
+def get_gae_advantages(rewards, values, next_values, masks, gamma, gae_lambda):
+    """
+    GAE(lambda) advantage를 계산합니다.
+
+    Args:
+        rewards(torch.Tensor): [T, ...] shape의 rewards입니다.
+        values(torch.Tensor): 각 state의 critic value입니다.
+        next_values(torch.Tensor): 각 next state의 critic value입니다.
+        masks(torch.Tensor): done mask입니다. (done이면 0, 아니면 1)
+        gamma(float): 할인율입니다.
+        gae_lambda(float): GAE의 lambda입니다.
+
+    Returns:
+         rewards와 같은 shape의 advantage를 반환합니다. returns(critic target)는 advantage + values입니다.
+    """
+    deltas = rewards + gamma * next_values * masks - values
+    return discounted_scan(deltas, masks, gamma * gae_lambda)
+
+
+def get_discounted_returns(rewards, masks, gamma, bootstrap_value=None):
+    """
+    Returns:
+         episode 경계에서 끊기는 할인된 누적 reward를 반환합니다. 마지막 step이 끝나지 않은 episode이면 bootstrap_value에서 이어집니다.
+    """
+    return discounted_scan(rewards, masks, gamma, bootstrap_value)
+
+
+def normalize_advantages(advantages):
+    if advantages.numel() < 2:
+        return advantages - advantages.mean()
+    return (advantages - advantages.mean()) / torch.max(
+        advantages.std(), torch.tensor(1e-6, dtype=advantages.dtype, device=advantages.device)
+    )
@@ -0,0 +1,138 @@
+# -*- coding:utf-8 -*-
+import logging
+import math
+import threading
+
+import numpy as np
+
+from rl_main.main_constants import *
+from rl_main.chief_workers.codec import encode_msg
+
+
+def get_num_aggregators():
+    return int(math.ceil(NUM_WORKERS / WORKERS_PER_AGGREGATOR))
+
+
+def get_aggregator_id(worker_id):
+    return worker_id // WORKERS_PER_AGGREGATOR
+
+
+def get_aggregator_topic(aggregator_id):
+    return "{0}/{1}".format(MQTT_TOPIC_EPISODE_DETAIL, aggregator_id)
+
+
+class Aggregator:
+    """
+    같은 host의 workers와 chief 사이에서 EPISODE_DETAIL 메세지들을 모으는 aggregator입니다.
+    한 episode에 대해 담당 workers의 메세지가 모두 도착하면 (혹은 SYNC_ROUND_DEADLINE이 지나면)
+    gradients를 ActorCriticModel.accumulate_gradients로 합산하여, contributor 수 및 workers별 loss, score와 함께
+    하나의 메세지로 chief에게 보냅니다. SUCCESS/FAIL 메세지는 workers가 chief에게 직접 보냅니다.
+    """
+    def __init__(self, logger, aggregator_id, rl_model, aggregator_mqtt_client):
+        self.logger = logger
+        self.aggregator_id = aggregator_id
+        self.model = rl_model
+        self.aggregator_mqtt_client = aggregator_mqtt_client
+
+        self.worker_ids = [
+            worker_id for worker_id in range(NUM_WORKERS) if get_aggregator_id(worker_id) == aggregator_id
+        ]
+        self.done_worker_ids = set()
+
+        self.messages_received_from_workers = {}
+        self.last_forwarded_episode = -1
+
+        self.lock = threading.RLock()
+        self.deadline_timer = None
+
+    def is_all_workers_done(self):
+        return len(self.done_worker_ids) == len(self.worker_ids)
+
+    def process_message(self, topic, msg_payload):
+        with self.lock:
+            worker_id = msg_payload['worker_id']
+
+            if topic in (MQTT_TOPIC_SUCCESS_DONE, MQTT_TOPIC_FAIL_DONE):
+                if worker_id in self.worker_ids:
+                    self.done_worker_ids.add(worker_id)
+            elif msg_payload['episode'] <= self.last_forwarded_episode:
+                # the chief decides whether a late message is folded into its current round or dropped
+                self.forward(msg_payload['episode'], [msg_payload])
+            else:
+                if msg_payload['episode'] not in self.messages_received_from_workers:
+                    self.messages_received_from_workers[msg_payload['episode']] = {}
+                self.messages_received_from_workers[msg_payload['episode']][worker_id] = msg_payload
+                self.start_deadline()
+
+            self.forward_complete_episodes()
+
+    def forward_complete_episodes(self):
+        active_worker_ids = set(self.worker_ids) - self.done_worker_ids
+        for episode in sorted(self.messages_received_from_workers):
+            received_worker_ids = set(self.messages_received_from_workers[episode])
+            if received_worker_ids >= active_worker_ids:
+                self.forward(episode, list(self.messages_received_from_workers.pop(episode).values()))
+
+        if len(self.messages_received_from_workers) == 0:
+            self.cancel_deadline()
+
+    def start_deadline(self):
+        if SYNC_ROUND_DEADLINE is None or self.deadline_timer is not None:
+            return
+
+        self.deadline_timer = threading.Timer(SYNC_ROUND_DEADLINE, self.on_deadline)
+        self.deadline_timer.daemon = True
+        self.deadline_timer.start()
+
+    def cancel_deadline(self):
+        if self.deadline_timer is not None:
+            self.deadline_timer.cancel()
+            self.deadline_timer = None
+
+    def on_deadline(self):
+        with self.lock:
+            self.deadline_timer = None
+            for episode in sorted(self.messages_received_from_workers):
+                self.forward(episode, list(self.messages_received_from_workers.pop(episode).values()))
+
+    def forward(self, episode, msg_payloads):
+        msg_payloads = sorted(msg_payloads, key=lambda msg_payload: msg_payload['worker_id'])
+
+        aggregated_msg = {
+            "aggregator_id": self.aggregator_id,
+            "episode": episode,
+            "worker_ids": np.asarray([msg_payload['worker_id'] for msg_payload in msg_payloads], dtype=np.int32),
+            "losses": np.asarray([msg_payload['loss'] for msg_payload in msg_payloads], dtype=np.float64),
+            "scores": np.asarray([msg_payload['score'] for msg_payload in msg_payloads], dtype=np.float64)
+        }
+
+        if MODE_PARAMETERS_TRANSFER:
+            aggregated_msg["parameters_versions"] = np.asarray(
+                [msg_payload.get('parameters_version', -1) for msg_payload in msg_payloads], dtype=np.int64
+            )
+
+        num_contributors = 0
+        if MODE_GRADIENTS_UPDATE:
+            for msg_payload in msg_payloads:
+                if msg_payload.get('gradients') is not None:
+                    self.model.accumulate_gradients(msg_payload['gradients'])
+                    num_contributors += 1
+
+            aggregated_msg["gradients"] = self.model.avg_flat_gradients
+            aggregated_msg["num_contributors"] = num_contributors
+
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "[SEND] TOPIC: %s, PAYLOAD: 'episode': %s, 'worker_ids': %s, 'num_contributors': %s",
+                MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL, episode, [msg_payload['worker_id'] for msg_payload in msg_payloads], num_contributors
+            )
+
+        aggregated_msg = encode_msg(MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL, aggregated_msg)
+        self.aggregator_mqtt_client.publish(
+            topic=MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL, payload=aggregated_msg, qos=0, retain=False
+        )
+
+        if MODE_GRADIENTS_UPDATE:
+            self.model.reset_average_gradients()
+
+        self.last_forwarded_episode = max(self.last_forwarded_episode, episode)
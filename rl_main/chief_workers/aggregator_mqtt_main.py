@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+import logging
+import time
+import sys, os
+
+idx = os.getcwd().index("{0}rl".format(os.sep))
+PROJECT_HOME = os.getcwd()[:idx+1] + "rl{0}".format(os.sep)
+sys.path.append(PROJECT_HOME)
+
+from rl_main import rl_utils
+from rl_main.chief_workers.aggregator import Aggregator, get_aggregator_topic
+from rl_main.chief_workers.codec import decode_msg
+from rl_main.main_constants import *
+
+from rl_main.logger import get_logger
+
+aggregator_id = int(sys.argv[1])
+logger = get_logger("aggregator_{0}".format(aggregator_id))
+
+env = rl_utils.get_environment()
+rl_model = rl_utils.get_rl_model(env, -1)
+
+aggregator = Aggregator(logger=logger, aggregator_id=aggregator_id, rl_model=rl_model, aggregator_mqtt_client=None)
+
+
+def on_aggregator_connect(client, userdata, flags, rc):
+    msg = "Aggregator {0} is successfully connected with broker@{1}".format(aggregator_id, MQTT_SERVER)
+    logger.info(msg)
+    client.subscribe(get_aggregator_topic(aggregator_id))
+    client.subscribe(MQTT_TOPIC_SUCCESS_DONE)
+    client.subscribe(MQTT_TOPIC_FAIL_DONE)
+    print(msg)
+
+
+def on_aggregator_log(mqttc, obj, level, string):
+    print(string)
+
+
+def on_aggregator_message(client, userdata, msg):
+    msg_payload = decode_msg(msg.payload)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(
+            "[RECV] TOPIC: %s, PAYLOAD: 'episode': %s, 'worker_id': %s, 'loss': %s, 'score': %s",
+            msg.topic, msg_payload['episode'], msg_payload['worker_id'], msg_payload['loss'], msg_payload['score']
+        )
+
+    if msg.topic == get_aggregator_topic(aggregator_id):
+        aggregator.process_message(MQTT_TOPIC_EPISODE_DETAIL, msg_payload)
+    else:
+        aggregator.process_message(msg.topic, msg_payload)
+
+
+if __name__ == "__main__":
+    aggregator_mqtt_client = rl_utils.get_transport_client("dist_trans_aggregator_{0}".format(aggregator_id))
+    aggregator.aggregator_mqtt_client = aggregator_mqtt_client
+
+    aggregator_mqtt_client.on_connect = on_aggregator_connect
+    aggregator_mqtt_client.on_message = on_aggregator_message
+    if MQTT_LOG:
+        aggregator_mqtt_client.on_log = on_aggregator_log
+
+    aggregator_mqtt_client.connect(MQTT_SERVER, MQTT_PORT, keepalive=3600)
+
+    aggregator_mqtt_client.loop_start()
+
+    while True:
+        try:
+            time.sleep(1)
+            if aggregator.is_all_workers_done():
+                aggregator_mqtt_client.loop_stop()
+                # releases this client's reader slots in the local transport rings
+                aggregator_mqtt_client.disconnect()
+                break
+        except KeyboardInterrupt as error:
+            print("=== {0:>8} is aborted by keyboard interrupt".format('Aggregator {0}'.format(aggregator_id)))
+            break
@@ -0,0 +1,38 @@
+# -*- coding:utf-8 -*-
+import threading
+import time
+
+
+class EpisodeBarrier:
+    """
+    MQTT callback thread가 갱신하는 episode 값을 기다리는 barrier입니다.
+    값이 갱신되는 즉시 기다리던 thread를 깨우므로 polling(sleep) 없이 동기화합니다.
+    """
+    def __init__(self, value=-1):
+        self.value = value
+        self.condition = threading.Condition()
+
+    def set(self, value):
+        with self.condition:
+            self.value = value
+            self.condition.notify_all()
+
+    def wait_until(self, target, timeout=None):
+        """
+        Args:
+            target(int): 기다릴 episode 값입니다. self.value >= target이 되면 반환합니다.
+            timeout(float): 최대 대기 시간(초)입니다. None이면 무한히 기다립니다.
+
+        Returns:
+             target에 도달하면 True, timeout이 지나면 False를 반환합니다.
+        """
+        with self.condition:
+            return self.condition.wait_for(lambda: self.value >= target, timeout=timeout)
+
+    def wait_until_with_report(self, target, report_interval, report):
+        """
+        report_interval초마다 report(target, elapsed_seconds)를 호출하면서 target에 도달할 때까지 기다립니다.
+        """
+        start_time = time.perf_counter()
+        while not self.wait_until(target, timeout=report_interval):
+            report(target, time.perf_counter() - start_time)
@@ -1,28 +1,48 @@
 # -*- coding:utf-8 -*-
-import pickle
-import zlib
-
 from rl_main.main_constants import *
-from rl_main.utils import exp_moving_average
+from rl_main.utils import ExpMovingAverage
+from rl_main.chief_workers.codec import encode_msg
+from rl_main.chief_workers.parameters_transfer import ParametersHistory
 import rl_main.rl_utils as rl_utils
 
-import matplotlib.pyplot as plt
+from rl_main.chief_workers.graph_renderer import GraphRenderer
+from rl_main.chief_workers.results_writer import ResultsWriter
+from rl_main.models.checkpoint import CheckpointManager, TRAINING_STATE_FORMAT, load_checkpoint, is_training_state, \
+    is_lockstep_resume
+
+from matplotlib.figure import Figure
 from matplotlib import gridspec
-import csv
+import logging
+import math
+import threading
 
+import numpy as np
 from collections import deque
 
 
 class Chief:
-    def __init__(self, logger, env, rl_model):
+    def __init__(self, logger, env, rl_model, resume_episode=None):
         self.logger = logger
         self.env = env
 
         self.messages_received_from_workers = {}
+        self.late_messages = []
+
+        # the MQTT thread and the round deadline timer both complete rounds
+        self.lock = threading.RLock()
+        self.round_deadline_timer = None
+        self.round_deadline_passed = False
+        self.num_contributors = 0
+
+        # guards the histories read by the graph renderer thread
+        self.metrics_lock = threading.Lock()
 
         self.NUM_DONE_WORKERS = 0
+        self.done_worker_ids = set()
         self.scores = {}
         self.losses = {}
+        self.score_emas = {}
+        self.loss_emas = {}
 
         self.score_over_recent_100_episodes = {}
         self.loss_over_recent_100_episodes = {}
@@ -40,96 +60,286 @@ class Chief:
 
         self.model = rl_model
 
+        self.parameters_history = ParametersHistory()
+        self.worker_parameters_version = {}
+
         for worker_id in range(NUM_WORKERS):
             self.scores[worker_id] = []
             self.losses[worker_id] = []
+            self.score_emas[worker_id] = ExpMovingAverage(EMA_WINDOW)
+            self.loss_emas[worker_id] = ExpMovingAverage(EMA_WINDOW)
 
             self.success_done_episode[worker_id] = []
             self.success_done_score[worker_id] = []
 
+            self.worker_parameters_version[worker_id] = -1
+
             self.score_over_recent_100_episodes[worker_id] = deque(maxlen=self.env.WIN_AND_LEARN_FINISH_CONTINUOUS_EPISODES)
             self.loss_over_recent_100_episodes[worker_id] = deque(maxlen=self.env.WIN_AND_LEARN_FINISH_CONTINUOUS_EPISODES)
 
+        self.graph_renderer = GraphRenderer(
+            self.get_graph_snapshot, self.draw_graph, os.path.join(PROJECT_HOME, "graphs", "loss_score.png")
+        )
+
+        self.results_writer = ResultsWriter(
+            os.path.join(PROJECT_HOME, "save_results", "outputs.csv"),
+            os.path.join(PROJECT_HOME, "save_results", "outputs.npy") if RESULTS_NPY_LOG else None
+        )
+
+        if not MODEL_SAVE:
+            self.checkpoint_manager = None
+        elif is_lockstep_resume():
+            # saved on the same rounds as the workers
+            self.checkpoint_manager = CheckpointManager("chief")
+        else:
+            # num_messages grows with every worker message and the state holds the whole histories,
+            # so the chief saves by time instead of on every message
+            self.checkpoint_manager = CheckpointManager(
+                "chief", interval_episodes=None, interval_seconds=MODEL_SAVE_CHIEF_INTERVAL_SECONDS
+            )
+        if resume_episode is not None:
+            self.resume(resume_episode)
+
     def update_loss_score(self, msg_payload):
         worker_id = msg_payload['worker_id']
         loss = msg_payload['loss']
         score = msg_payload['score']
-        self.losses[worker_id].append(loss)
-        self.scores[worker_id].append(score)
+        with self.metrics_lock:
+            self.losses[worker_id].append(loss)
+            self.scores[worker_id].append(score)
+            self.loss_emas[worker_id].append(loss)
+            self.score_emas[worker_id].append(score)
         self.loss_over_recent_100_episodes[worker_id].append(loss)
         self.score_over_recent_100_episodes[worker_id].append(score)
 
     def save_graph(self):
-        plt.clf()
+        # only marks the graph as stale; GraphRenderer draws it on its own thread at most every GRAPH_SAVE_INTERVAL seconds
+        self.graph_renderer.request()
+
+    def get_graph_snapshot(self):
+        with self.metrics_lock:
+            return {
+                "losses": {worker_id: list(self.losses[worker_id]) for worker_id in range(NUM_WORKERS)},
+                "scores": {worker_id: list(self.scores[worker_id]) for worker_id in range(NUM_WORKERS)},
+                "ema_losses": {worker_id: self.loss_emas[worker_id].get_series() for worker_id in range(NUM_WORKERS)},
+                "ema_scores": {worker_id: self.score_emas[worker_id].get_series() for worker_id in range(NUM_WORKERS)},
+                "success_done_episode": {worker_id: list(self.success_done_episode[worker_id]) for worker_id in range(NUM_WORKERS)},
+                "success_done_score": {worker_id: list(self.success_done_score[worker_id]) for worker_id in range(NUM_WORKERS)}
+            }
 
-        fig = plt.figure(figsize=(30, 2 * NUM_WORKERS))
+    def draw_graph(self, snapshot):
+        losses = snapshot["losses"]
+        scores = snapshot["scores"]
+
+        fig = Figure(figsize=(30, 2 * NUM_WORKERS))
         gs = gridspec.GridSpec(
             nrows=NUM_WORKERS,  # row 몇 개
             ncols=2,  # col 몇 개
+            figure=fig,
             width_ratios=[5, 5],
             hspace=0.2
         )
 
         max_episodes = 1
         for worker_id in range(NUM_WORKERS):
-            if len(self.scores[worker_id]) > max_episodes:
-                max_episodes = len(self.scores[worker_id])
+            if len(scores[worker_id]) > max_episodes:
+                max_episodes = len(scores[worker_id])
 
         ax = {}
         for row in range(NUM_WORKERS):
             ax[row] = {}
             for col in range(2):
-                ax[row][col] = plt.subplot(gs[row * 2 + col])
+                ax[row][col] = fig.add_subplot(gs[row * 2 + col])
                 ax[row][col].set_xlim([0, max_episodes])
                 ax[row][col].tick_params(axis='both', which='major', labelsize=10)
 
         for worker_id in range(NUM_WORKERS):
             ax[worker_id][0].plot(
-                range(len(self.losses[worker_id])),
-                self.losses[worker_id],
+                range(len(losses[worker_id])),
+                losses[worker_id],
                 c='blue'
             )
             ax[worker_id][0].plot(
-                range(len(self.losses[worker_id])),
-                exp_moving_average(self.losses[worker_id], EMA_WINDOW),
+                range(len(losses[worker_id])),
+                snapshot["ema_losses"][worker_id],
                 c='green'
             )
 
             ax[worker_id][1].plot(
-                range(len(self.scores[worker_id])),
-                self.scores[worker_id],
+                range(len(scores[worker_id])),
+                scores[worker_id],
                 c='blue'
             )
             ax[worker_id][1].plot(
-                range(len(self.scores[worker_id])),
-                exp_moving_average(self.scores[worker_id], EMA_WINDOW),
+                range(len(scores[worker_id])),
+                snapshot["ema_scores"][worker_id],
                 c='green'
             )
 
             ax[worker_id][1].scatter(
-                self.success_done_episode[worker_id],
-                self.success_done_score[worker_id],
+                snapshot["success_done_episode"][worker_id],
+                snapshot["success_done_score"][worker_id],
                 marker="*",
                 s=70,
                 c='red'
             )
 
-        plt.savefig(os.path.join(PROJECT_HOME, "graphs", "loss_score.png"))
-        plt.close('all')
+        return fig
 
     def save_results(self, worker_id, loss, ema_loss, score, ema_score):
-        save_dir = PROJECT_HOME + "save_results/outputs.csv"
-        f = open(save_dir, 'a', encoding='utf-8', newline='')
-        wr = csv.writer(f)
-        wr.writerow([self.episode_chief, worker_id, loss, ema_loss, score, ema_score])
-        f.close()
+        self.results_writer.write_row([self.episode_chief, worker_id, loss, ema_loss, score, ema_score])
+
+    def close(self):
+        self.graph_renderer.stop()
+        self.results_writer.close()
+        if self.checkpoint_manager is not None:
+            self.save_checkpoint(force=True)
+            self.checkpoint_manager.close()
+
+    def get_training_state(self):
+        return {
+            "format": TRAINING_STATE_FORMAT,
+            "model": self.model.state_dict(),
+            "episode_chief": self.episode_chief,
+            "num_messages": self.num_messages,
+            "NUM_DONE_WORKERS": self.NUM_DONE_WORKERS,
+            "done_worker_ids": self.done_worker_ids,
+            "scores": self.scores,
+            "losses": self.losses,
+            "score_emas": self.score_emas,
+            "loss_emas": self.loss_emas,
+            "score_over_recent_100_episodes": self.score_over_recent_100_episodes,
+            "loss_over_recent_100_episodes": self.loss_over_recent_100_episodes,
+            "success_done_episode": self.success_done_episode,
+            "success_done_score": self.success_done_score,
+            "global_max_ema_score": self.global_max_ema_score,
+            "global_min_ema_loss": self.global_min_ema_loss,
+            "worker_parameters_version": self.worker_parameters_version,
+            "parameters_history": self.parameters_history
+        }
+
+    def save_checkpoint(self, force=False):
+        # the last completed round in the synchronous modes, the last processed message otherwise
+        episode = self.episode_chief - 1 if MODE_SYNCHRONIZATION else self.num_messages - 1
+        if episode >= 0:
+            # in lockstep an off-cadence save would push out a checkpoint that the workers can rewind to
+            self.checkpoint_manager.save(episode, self.get_training_state, force=force and not is_lockstep_resume())
+
+    def resume(self, resume_episode):
+        """
+        main.py가 정한 resume_episode까지의 chief 상태를 불러옵니다.
+        is_lockstep_resume()이면 workers와 같은 라운드에서 이어지도록 episode_chief를 resume_episode + 1로 맞추고, 그 외에는 최신 상태를 불러옵니다.
+
+        Args:
+            resume_episode(int): 모든 workers가 함께 이어서 학습할 마지막 완료 episode입니다.
+        """
+        is_lockstep = is_lockstep_resume()
+        filename, training_state = load_checkpoint(
+            "chief", max_episode=resume_episode if is_lockstep else None, map_location=device
+        )
+
+        if is_training_state(training_state):
+            self.model.load_state_dict(training_state["model"])
+            self.episode_chief = training_state["episode_chief"]
+            self.num_messages = training_state["num_messages"]
+            self.NUM_DONE_WORKERS = training_state["NUM_DONE_WORKERS"]
+            self.done_worker_ids = training_state["done_worker_ids"]
+            self.scores = training_state["scores"]
+            self.losses = training_state["losses"]
+            self.score_emas = training_state["score_emas"]
+            self.loss_emas = training_state["loss_emas"]
+            self.score_over_recent_100_episodes = training_state["score_over_recent_100_episodes"]
+            self.loss_over_recent_100_episodes = training_state["loss_over_recent_100_episodes"]
+            self.success_done_episode = training_state["success_done_episode"]
+            self.success_done_score = training_state["success_done_score"]
+            self.global_max_ema_score = training_state["global_max_ema_score"]
+            self.global_min_ema_loss = training_state["global_min_ema_loss"]
+            self.worker_parameters_version = training_state["worker_parameters_version"]
+            self.parameters_history = training_state["parameters_history"]
+            log_msg = "Chief - Resumed from {0} (episode_chief {1})".format(filename, self.episode_chief)
+        else:
+            log_msg = "Chief - No training state to resume from: histories start over"
+
+        if is_lockstep:
+            self.episode_chief = resume_episode + 1
+
+        self.logger.info(log_msg)
+        print(log_msg)
+
+    def unpack_aggregated_msg(self, msg_payload):
+        """
+        Args:
+            msg_payload(dict): aggregator가 보낸 메세지로, workers의 loss, score와 gradients의 합을 담고 있습니다.
+
+        Returns:
+             workers별 EPISODE_DETAIL 메세지 목록을 반환합니다. gradients의 합과 contributor 수는 첫 번째 메세지에만 포함됩니다.
+        """
+        worker_msg_payloads = []
+        for idx, worker_id in enumerate(msg_payload['worker_ids'].tolist()):
+            worker_msg_payload = {
+                "worker_id": worker_id,
+                "episode": msg_payload['episode'],
+                "loss": float(msg_payload['losses'][idx]),
+                "score": float(msg_payload['scores'][idx])
+            }
+
+            if "parameters_versions" in msg_payload:
+                worker_msg_payload["parameters_version"] = int(msg_payload['parameters_versions'][idx])
+
+            worker_msg_payloads.append(worker_msg_payload)
+
+        if MODE_GRADIENTS_UPDATE and msg_payload['num_contributors'] > 0 and len(worker_msg_payloads) > 0:
+            worker_msg_payloads[0]["gradients"] = msg_payload['gradients']
+            worker_msg_payloads[0]["num_contributors"] = msg_payload['num_contributors']
+
+        return worker_msg_payloads
+
+    def unpack_batched_msg(self, msg_payload):
+        """
+        Args:
+            msg_payload(dict): worker가 여러 episodes를 모아서 보낸 메세지입니다.
+
+        Returns:
+             episode 순서대로 EPISODE_DETAIL 메세지 목록을 반환합니다. gradients의 합과 contributor 수는 마지막 메세지에만 포함됩니다.
+        """
+        episode_msg_payloads = []
+        for idx, episode in enumerate(msg_payload['episodes'].tolist()):
+            episode_msg_payloads.append({
+                "worker_id": msg_payload['worker_id'],
+                "episode": episode,
+                "loss": float(msg_payload['losses'][idx]),
+                "score": float(msg_payload['scores'][idx])
+            })
+
+        if "parameters_version" in msg_payload:
+            episode_msg_payloads[-1]["parameters_version"] = msg_payload['parameters_version']
+
+        if "gradients" in msg_payload:
+            episode_msg_payloads[-1]["gradients"] = msg_payload['gradients']
+            episode_msg_payloads[-1]["num_contributors"] = msg_payload['num_contributors']
+
+        return episode_msg_payloads
+
+    def get_staleness_weight(self, msg_payload):
+        # the worker computed its gradients on top of update 'episode_chief';
+        # every update published since then makes its contribution one step staler.
+        staleness = max(0, self.episode_chief - 1 - msg_payload['episode_chief'])
+        return 1.0 / (1.0 + staleness)
 
     def process_message(self, topic, msg_payload):
         self.update_loss_score(msg_payload)
         self.save_graph()
 
-        if topic == MQTT_TOPIC_EPISODE_DETAIL and MODE_GRADIENTS_UPDATE:
-            self.model.accumulate_gradients(msg_payload['gradients'])
+        if "parameters_version" in msg_payload:
+            self.worker_parameters_version[msg_payload['worker_id']] = msg_payload['parameters_version']
+
+        if topic == MQTT_TOPIC_EPISODE_DETAIL and MODE_GRADIENTS_UPDATE and 'gradients' in msg_payload:
+            if MODE_BOUNDED_STALENESS:
+                self.model.accumulate_gradients(msg_payload['gradients'], self.get_staleness_weight(msg_payload))
+            else:
+                self.model.accumulate_gradients(msg_payload['gradients'])
+            # an aggregator sends the sum of several workers' gradients
+            self.num_contributors += msg_payload.get('num_contributors', 1)
             # if msg_payload['episode'] == 0:
             #     self.model.accumulate_gradients(msg_payload['gradients'])
             # else:
@@ -138,13 +348,16 @@ class Chief:
             #                                         msg_payload['worker_id'], msg_payload['episode'])
 
         elif topic == MQTT_TOPIC_SUCCESS_DONE:
-            self.success_done_episode[msg_payload['worker_id']].append(msg_payload['episode'])
-            self.success_done_score[msg_payload['worker_id']].append(msg_payload['score'])
+            with self.metrics_lock:
+                self.success_done_episode[msg_payload['worker_id']].append(msg_payload['episode'])
+                self.success_done_score[msg_payload['worker_id']].append(msg_payload['score'])
 
+            self.done_worker_ids.add(msg_payload['worker_id'])
             self.NUM_DONE_WORKERS += 1
             print("BROKER CHECK! - num_of_done_workers:", self.NUM_DONE_WORKERS)
 
         elif topic == MQTT_TOPIC_FAIL_DONE:
+            self.done_worker_ids.add(msg_payload['worker_id'])
             self.NUM_DONE_WORKERS += 1
             print("BROKER CHECK! - num_of_done_workers:", self.NUM_DONE_WORKERS)
 
@@ -152,51 +365,67 @@ class Chief:
             pass
 
     def get_transfer_ack_msg(self, parameters_transferred):
-        log_msg = "[SEND] TOPIC: {0}, PAYLOAD: 'episode': {1}".format(
-            MQTT_TOPIC_TRANSFER_ACK,
-            self.episode_chief
-        )
-
         transfer_msg = {
             "episode_chief": self.episode_chief
         }
 
         if MODE_PARAMETERS_TRANSFER:
-            log_msg += ", 'parameters_length': {0}\n".format(
-                len(parameters_transferred)
+            acknowledged_versions = [
+                self.worker_parameters_version[worker_id] for worker_id in range(NUM_WORKERS)
+                if worker_id not in self.done_worker_ids
+            ]
+
+            transfer_msg.update(
+                self.parameters_history.make_transfer_msg(parameters_transferred, acknowledged_versions)
             )
 
-            transfer_msg = {
-                "episode_chief": self.episode_chief,
-                "parameters": parameters_transferred
-            }
-        else:
-            log_msg += ", No Transfer\n"
+        if self.logger.isEnabledFor(logging.INFO):
+            log_msg = "[SEND] TOPIC: %s, PAYLOAD: 'episode': %s"
+            log_args = [MQTT_TOPIC_TRANSFER_ACK, self.episode_chief]
 
-        self.logger.info(log_msg)
+            if not MODE_PARAMETERS_TRANSFER:
+                log_msg += ", No Transfer\n"
+            elif "parameters_delta" in transfer_msg:
+                log_msg += ", 'parameters_version': %s, 'parameters_base_version': %s, 'parameters_delta_length': %s\n"
+                log_args += [
+                    transfer_msg["parameters_version"],
+                    transfer_msg["parameters_base_version"],
+                    len(transfer_msg["parameters_delta"])
+                ]
+            else:
+                log_msg += ", 'parameters_version': %s, 'parameters_length': %s\n"
+                log_args += [transfer_msg["parameters_version"], len(transfer_msg["parameters"])]
+
+            self.logger.info(log_msg, *log_args)
 
-        transfer_msg = pickle.dumps(transfer_msg, protocol=-1)
-        transfer_msg = zlib.compress(transfer_msg)
+        transfer_msg = encode_msg(MQTT_TOPIC_TRANSFER_ACK, transfer_msg)
 
         if MODE_GRADIENTS_UPDATE:
             self.model.reset_average_gradients()
             self.model.reset_weighted_gradients()
+            self.num_contributors = 0
 
         return transfer_msg
 
-    def get_update_ack_msg(self, msg_payload):
-        if MODE_GRADIENTS_UPDATE:
-            log_msg = "[SEND] TOPIC: {0}, PAYLOAD: 'episode': {1}, 'global_avg_grad_length': {2}\n".format(
-                MQTT_TOPIC_UPDATE_ACK,
-                self.episode_chief,
-                len(self.model.avg_gradients)
-            )
+    def get_update_ack_msg(self, msg_payload, num_contributors=None, ring_members=None):
+        if num_contributors is None:
+            # workers that missed the round deadline did not contribute to the accumulated gradients
+            num_contributors = max(1, self.num_contributors)
 
-            self.model.get_average_gradients(NUM_WORKERS - self.NUM_DONE_WORKERS)
+        if MODE_GRADIENTS_UPDATE and MODE_RING_ALLREDUCE:
+            # workers average their gradients among themselves; the chief only tells them who takes part
+            ring_members = np.asarray(sorted(ring_members if ring_members is not None else []), dtype=np.int32)
 
             grad_update_msg = {
                 "episode_chief": self.episode_chief,
-                "avg_gradients": self.model.avg_gradients
+                "ring_members": ring_members
+            }
+        elif MODE_GRADIENTS_UPDATE:
+            self.model.get_average_gradients(num_contributors)
+
+            grad_update_msg = {
+                "episode_chief": self.episode_chief,
+                "avg_gradients": self.model.avg_flat_gradients
             }
             ## weighted_gradients sharing
             # self.model.get_score_weighted_gradients(NUM_WORKERS - self.NUM_DONE_WORKERS, self.score_over_recent_100_episodes, msg_payload['gradients'], msg_payload['worker_id'])
@@ -215,22 +444,101 @@ class Chief:
             #         "avg_gradients": self.model.weighted_gradients
             #     }
         else:
-            log_msg = "[SEND] TOPIC: {0}, PAYLOAD: 'episode': {1}\n".format(
-                MQTT_TOPIC_UPDATE_ACK,
-                self.episode_chief
-            )
-
             grad_update_msg = {
                 "episode_chief": self.episode_chief
             }
 
-        self.logger.info(log_msg)
+        if MODE_BOUNDED_STALENESS:
+            # lets the worker that sent this message know how far ahead of the chief it is
+            grad_update_msg["worker_id"] = msg_payload["worker_id"]
+            grad_update_msg["episode"] = msg_payload["episode"]
+
+        if self.logger.isEnabledFor(logging.INFO):
+            log_msg = "[SEND] TOPIC: %s, PAYLOAD: 'episode': %s"
+            log_args = [MQTT_TOPIC_UPDATE_ACK, self.episode_chief]
+
+            if MODE_GRADIENTS_UPDATE and MODE_RING_ALLREDUCE:
+                log_msg += ", 'ring_members': %s"
+                log_args.append(ring_members.tolist())
+            elif MODE_GRADIENTS_UPDATE:
+                log_msg += ", 'global_avg_grad_length': %s"
+                log_args.append(len(self.model.avg_flat_gradients))
+
+            self.logger.info(log_msg + "\n", *log_args)
 
-        grad_update_msg = pickle.dumps(grad_update_msg, protocol=-1)
-        grad_update_msg = zlib.compress(grad_update_msg)
+        grad_update_msg = encode_msg(MQTT_TOPIC_UPDATE_ACK, grad_update_msg)
 
         if MODE_GRADIENTS_UPDATE:
             self.model.reset_average_gradients()
             self.model.reset_weighted_gradients()
+            self.num_contributors = 0
 
         return grad_update_msg
+
+    def get_quorum_size(self):
+        return max(1, int(math.ceil(SYNC_QUORUM_FRACTION * (NUM_WORKERS - self.NUM_DONE_WORKERS))))
+
+    def is_round_complete(self):
+        """
+        Returns:
+             모든 active workers의 메세지가 도착했거나, 라운드 마감 시간이 지났고 quorum 이상의 메세지가 도착했으면 True를 반환합니다.
+        """
+        num_received = len(self.messages_received_from_workers.get(self.episode_chief, {}))
+        if num_received == 0:
+            return False
+
+        if num_received >= NUM_WORKERS - self.NUM_DONE_WORKERS:
+            return True
+
+        return self.round_deadline_passed and num_received >= self.get_quorum_size()
+
+    def start_round_deadline(self, on_round_deadline):
+        if SYNC_ROUND_DEADLINE is None or self.round_deadline_timer is not None:
+            return
+
+        self.round_deadline_timer = threading.Timer(SYNC_ROUND_DEADLINE, on_round_deadline, args=(self.episode_chief,))
+        self.round_deadline_timer.daemon = True
+        self.round_deadline_timer.start()
+
+    def finish_round(self):
+        if self.round_deadline_timer is not None:
+            self.round_deadline_timer.cancel()
+            self.round_deadline_timer = None
+        self.round_deadline_passed = False
+        self.episode_chief += 1
+
+        if self.checkpoint_manager is not None:
+            self.save_checkpoint()
+
+    def add_late_message(self, topic, msg_payload):
+        """
+        이미 마감된 라운드에 대한 메세지를 처리합니다.
+        SUCCESS/FAIL 메세지는 해당 worker가 더 이상 메세지를 보내지 않으므로 현재 라운드에 포함시키고,
+        gradients는 SYNC_FOLD_LATE_MESSAGES에 따라 다음 라운드에 합산하거나 버립니다.
+        """
+        worker_id = msg_payload['worker_id']
+
+        if topic in (MQTT_TOPIC_SUCCESS_DONE, MQTT_TOPIC_FAIL_DONE):
+            if self.episode_chief not in self.messages_received_from_workers:
+                self.messages_received_from_workers[self.episode_chief] = {}
+            self.messages_received_from_workers[self.episode_chief][worker_id] = (topic, msg_payload)
+        elif SYNC_FOLD_LATE_MESSAGES:
+            self.late_messages.append((topic, msg_payload))
+        else:
+            self.update_loss_score(msg_payload)
+            self.save_results(
+                worker_id,
+                msg_payload['loss'],
+                np.mean(self.loss_over_recent_100_episodes[worker_id]),
+                msg_payload['score'],
+                np.mean(self.score_over_recent_100_episodes[worker_id])
+            )
+            self.logger.info(
+                "Dropped late gradients of worker %s for episode %s (episode_chief: %s)",
+                worker_id, msg_payload['episode'], self.episode_chief
+            )
+
+    def pop_late_messages(self):
+        late_messages = self.late_messages
+        self.late_messages = []
+        return late_messages
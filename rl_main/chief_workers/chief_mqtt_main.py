@@ -1,8 +1,7 @@
 # -*- coding:utf-8 -*-
-import pickle
 import sys
+import logging
 import time
-import zlib
 import sys, os
 
 idx = os.getcwd().index("{0}rl".format(os.sep))
@@ -11,18 +10,23 @@ sys.path.append(PROJECT_HOME)
 
 from rl_main import utils, rl_utils
 from rl_main.chief_workers.chief import Chief
+from rl_main.chief_workers.codec import decode_msg
 from rl_main.main_constants import *
 
-import paho.mqtt.client as mqtt
 from rl_main.logger import get_logger
 import numpy as np
 
+utils.check_configuration()
+
 logger = get_logger("chief")
 
 env = rl_utils.get_environment()
 rl_model = rl_utils.get_rl_model(env, -1)
 
-chief = Chief(logger=logger, env=env, rl_model=rl_model)
+# given by main.py when RESUME
+resume_episode = int(sys.argv[1]) if len(sys.argv) > 1 else None
+
+chief = Chief(logger=logger, env=env, rl_model=rl_model, resume_episode=resume_episode)
 
 
 def on_chief_connect(client, userdata, flags, rc):
@@ -31,6 +35,8 @@ def on_chief_connect(client, userdata, flags, rc):
     client.subscribe(MQTT_TOPIC_EPISODE_DETAIL)
     client.subscribe(MQTT_TOPIC_SUCCESS_DONE)
     client.subscribe(MQTT_TOPIC_FAIL_DONE)
+    if WORKERS_PER_AGGREGATOR > 0:
+        client.subscribe(MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL)
     print(msg)
 
 
@@ -39,85 +45,193 @@ def on_chief_log(mqttc, obj, level, string):
 
 
 def on_chief_message(client, userdata, msg):
-    msg_payload = zlib.decompress(msg.payload)
-    msg_payload = pickle.loads(msg_payload)
-    log_msg = "[RECV] TOPIC: {0}, PAYLOAD: 'episode': {1}, 'worker_id': {2}, 'loss': {3}, 'score': {4}".format(
-        msg.topic,
-        msg_payload['episode'],
-        msg_payload['worker_id'],
-        msg_payload['loss'],
-        msg_payload['score']
-    )
-
-    if MODE_PARAMETERS_TRANSFER and msg.topic == MQTT_TOPIC_SUCCESS_DONE:
-        log_msg += ", 'parameters_length': {0}".format(len(msg_payload['parameters']))
-    elif MODE_GRADIENTS_UPDATE and msg.topic == MQTT_TOPIC_EPISODE_DETAIL:
-        log_msg += ", 'gradients_length': {0}".format(len(msg_payload['gradients']))
-    elif msg.topic == MQTT_TOPIC_FAIL_DONE:
-        pass
+    msg_payload = decode_msg(msg.payload)
+
+    if msg.topic == MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL:
+        if logger.isEnabledFor(logging.INFO):
+            log_msg = "[RECV] TOPIC: %s, PAYLOAD: 'episode': %s, 'aggregator_id': %s, 'worker_ids': %s"
+            log_args = [msg.topic, msg_payload['episode'], msg_payload['aggregator_id'], msg_payload['worker_ids'].tolist()]
+
+            if MODE_GRADIENTS_UPDATE:
+                log_msg += ", 'num_contributors': %s"
+                log_args.append(msg_payload['num_contributors'])
+
+            logger.info(log_msg, *log_args)
+
+        for worker_msg_payload in chief.unpack_aggregated_msg(msg_payload):
+            process_worker_message(MQTT_TOPIC_EPISODE_DETAIL, worker_msg_payload)
+        return
+
+    if logger.isEnabledFor(logging.INFO):
+        log_msg = "[RECV] TOPIC: %s, PAYLOAD: 'episode': %s, 'worker_id': %s, 'loss': %s, 'score': %s"
+        log_args = [msg.topic, msg_payload['episode'], msg_payload['worker_id'], msg_payload['loss'], msg_payload['score']]
+
+        if MODE_PARAMETERS_TRANSFER and msg.topic == MQTT_TOPIC_SUCCESS_DONE:
+            log_msg += ", 'parameters_length': %s"
+            log_args.append(len(msg_payload['parameters']))
+        elif MODE_GRADIENTS_UPDATE and msg.topic == MQTT_TOPIC_EPISODE_DETAIL and 'gradients' in msg_payload:
+            log_msg += ", 'gradients_length': %s"
+            log_args.append(len(msg_payload['gradients']))
+
+        if msg.topic == MQTT_TOPIC_EPISODE_DETAIL and 'episodes' in msg_payload:
+            log_msg += ", 'batched_episodes': %s"
+            log_args.append(len(msg_payload['episodes']))
+
+        logger.info(log_msg, *log_args)
+
+    if msg.topic == MQTT_TOPIC_EPISODE_DETAIL and 'episodes' in msg_payload:
+        for episode_msg_payload in chief.unpack_batched_msg(msg_payload):
+            process_worker_message(MQTT_TOPIC_EPISODE_DETAIL, episode_msg_payload)
     else:
-        pass
-
-    logger.info(log_msg)
-
-    if MODE_SYNCHRONIZATION:
-        if msg_payload['episode'] not in chief.messages_received_from_workers:
-            chief.messages_received_from_workers[msg_payload['episode']] = {}
-
-        chief.messages_received_from_workers[msg_payload['episode']][msg_payload["worker_id"]] = (msg.topic, msg_payload)
-
-        if len(chief.messages_received_from_workers[chief.episode_chief]) == NUM_WORKERS - chief.NUM_DONE_WORKERS:
-            is_include_topic_success_done = False
-            parameters_transferred = None
-            worker_score_str = ""
-            for worker_id in range(NUM_WORKERS):
-                if worker_id in chief.messages_received_from_workers[chief.episode_chief]:
-                    topic, msg_payload = chief.messages_received_from_workers[chief.episode_chief][worker_id]
-                    chief.process_message(topic=topic, msg_payload=msg_payload)
-
-                    worker_score_str += "W{0}[{1:5.2f}/{2:5.2f}] ".format(
-                        worker_id,
-                        chief.messages_received_from_workers[chief.episode_chief][worker_id][1]['score'],
-                        np.mean(chief.score_over_recent_100_episodes[worker_id])
-                    )
-
-                    chief.save_results(
-                        worker_id,
-                        chief.messages_received_from_workers[chief.episode_chief][worker_id][1]['loss'],
-                        np.mean(chief.loss_over_recent_100_episodes[worker_id]),
-                        chief.messages_received_from_workers[chief.episode_chief][worker_id][1]['score'],
-                        np.mean(chief.score_over_recent_100_episodes[worker_id])
-                    )
-
-                    if topic == MQTT_TOPIC_SUCCESS_DONE:
-                        is_include_topic_success_done = True
-                        if MODE_PARAMETERS_TRANSFER:
-                            parameters_transferred = msg_payload["parameters"]
-
-            if is_include_topic_success_done:
-                transfer_msg = chief.get_transfer_ack_msg(parameters_transferred)
-                chief_mqtt_client.publish(topic=MQTT_TOPIC_TRANSFER_ACK, payload=transfer_msg, qos=0, retain=False)
+        process_worker_message(msg.topic, msg_payload)
+
+
+def process_worker_message(topic, msg_payload):
+    if MODE_SYNCHRONIZATION and MODE_BOUNDED_STALENESS:
+        worker_id = msg_payload['worker_id']
+        staleness_weight = chief.get_staleness_weight(msg_payload)
+        chief.process_message(topic=topic, msg_payload=msg_payload)
+
+        chief.save_results(
+            worker_id,
+            msg_payload['loss'],
+            np.mean(chief.loss_over_recent_100_episodes[worker_id]),
+            msg_payload['score'],
+            np.mean(chief.score_over_recent_100_episodes[worker_id])
+        )
+
+        if topic == MQTT_TOPIC_SUCCESS_DONE:
+            parameters_transferred = msg_payload["parameters"] if MODE_PARAMETERS_TRANSFER else None
+            transfer_msg = chief.get_transfer_ack_msg(parameters_transferred)
+            chief_mqtt_client.publish(topic=MQTT_TOPIC_TRANSFER_ACK, payload=transfer_msg, qos=0, retain=False)
+        elif topic == MQTT_TOPIC_EPISODE_DETAIL:
+            # gradients are already weighted by staleness, so the update is not averaged over workers
+            grad_update_msg = chief.get_update_ack_msg(msg_payload=msg_payload, num_contributors=1)
+            chief_mqtt_client.publish(topic=MQTT_TOPIC_UPDATE_ACK, payload=grad_update_msg, qos=0, retain=False)
+        else:
+            return
+
+        print("episode_chief:{0:3d} - W{1}[{2:5.2f}/{3:5.2f}] episode: {4}, staleness weight: {5:4.2f}".format(
+            chief.episode_chief,
+            worker_id,
+            msg_payload['score'],
+            np.mean(chief.score_over_recent_100_episodes[worker_id]),
+            msg_payload['episode'],
+            staleness_weight
+        ))
+        chief.episode_chief += 1
+
+        if chief.checkpoint_manager is not None:
+            chief.save_checkpoint()
+
+    elif MODE_SYNCHRONIZATION:
+        with chief.lock:
+            if msg_payload['episode'] < chief.episode_chief:
+                chief.add_late_message(topic, msg_payload)
             else:
-                grad_update_msg = chief.get_update_ack_msg(msg_payload=msg_payload)
-                chief_mqtt_client.publish(topic=MQTT_TOPIC_UPDATE_ACK, payload=grad_update_msg, qos=0, retain=False)
+                if msg_payload['episode'] not in chief.messages_received_from_workers:
+                    chief.messages_received_from_workers[msg_payload['episode']] = {}
 
-            chief.messages_received_from_workers[chief.episode_chief].clear()
+                chief.messages_received_from_workers[msg_payload['episode']][msg_payload["worker_id"]] = (topic, msg_payload)
 
-            chief.save_graph()
+            if chief.episode_chief in chief.messages_received_from_workers:
+                chief.start_round_deadline(on_round_deadline)
 
-            print("episode_chief:{0:3d} - {1}\n".format(chief.episode_chief, worker_score_str))
-            chief.episode_chief += 1
+            if chief.is_round_complete():
+                complete_round()
     else:
-        chief. process_message(msg.topic, msg_payload)
-
-        if chief.num_messages == 0 or chief.num_messages % 200 == 0:
-            chief.save_graph()
+        chief. process_message(topic, msg_payload)
 
         chief.num_messages += 1
 
+        if chief.checkpoint_manager is not None:
+            chief.save_checkpoint()
+
+
+def on_round_deadline(episode_chief):
+    with chief.lock:
+        if episode_chief != chief.episode_chief:
+            return
+
+        chief.round_deadline_passed = True
+        if chief.is_round_complete():
+            complete_round()
+        else:
+            logger.info("Round {0} passed its deadline with {1} of quorum {2} messages".format(
+                episode_chief,
+                len(chief.messages_received_from_workers.get(episode_chief, {})),
+                chief.get_quorum_size()
+            ))
+
+
+def complete_round():
+    """
+    chief.episode_chief 라운드에 도착한 메세지들과 이전 라운드에 늦게 도착한 gradients를 처리하고,
+    Transfer_Ack 혹은 Update_Ack을 발행한 후 다음 라운드로 넘어갑니다. chief.lock을 가진 상태에서 호출해야 합니다.
+    """
+    round_messages = chief.messages_received_from_workers.pop(chief.episode_chief, {})
+    num_active_workers = NUM_WORKERS - chief.NUM_DONE_WORKERS
+
+    is_include_topic_success_done = False
+    parameters_transferred = None
+    worker_score_str = ""
+    msg_payload = None
+
+    for topic, late_msg_payload in chief.pop_late_messages():
+        chief.process_message(topic=topic, msg_payload=late_msg_payload)
+
+        worker_id = late_msg_payload['worker_id']
+        chief.save_results(
+            worker_id,
+            late_msg_payload['loss'],
+            np.mean(chief.loss_over_recent_100_episodes[worker_id]),
+            late_msg_payload['score'],
+            np.mean(chief.score_over_recent_100_episodes[worker_id])
+        )
+
+    for worker_id in range(NUM_WORKERS):
+        if worker_id in round_messages:
+            topic, msg_payload = round_messages[worker_id]
+            chief.process_message(topic=topic, msg_payload=msg_payload)
+
+            worker_score_str += "W{0}[{1:5.2f}/{2:5.2f}] ".format(
+                worker_id,
+                msg_payload['score'],
+                np.mean(chief.score_over_recent_100_episodes[worker_id])
+            )
+
+            chief.save_results(
+                worker_id,
+                msg_payload['loss'],
+                np.mean(chief.loss_over_recent_100_episodes[worker_id]),
+                msg_payload['score'],
+                np.mean(chief.score_over_recent_100_episodes[worker_id])
+            )
+
+            if topic == MQTT_TOPIC_SUCCESS_DONE:
+                is_include_topic_success_done = True
+                if MODE_PARAMETERS_TRANSFER:
+                    parameters_transferred = msg_payload["parameters"]
+
+    if is_include_topic_success_done:
+        transfer_msg = chief.get_transfer_ack_msg(parameters_transferred)
+        chief_mqtt_client.publish(topic=MQTT_TOPIC_TRANSFER_ACK, payload=transfer_msg, qos=0, retain=False)
+    else:
+        ring_members = [
+            worker_id for worker_id, (topic, _) in round_messages.items() if topic == MQTT_TOPIC_EPISODE_DETAIL
+        ]
+        grad_update_msg = chief.get_update_ack_msg(msg_payload=msg_payload, ring_members=ring_members)
+        chief_mqtt_client.publish(topic=MQTT_TOPIC_UPDATE_ACK, payload=grad_update_msg, qos=0, retain=False)
+
+    if len(round_messages) < num_active_workers:
+        worker_score_str += "(closed at deadline with {0} of {1} workers)".format(len(round_messages), num_active_workers)
+
+    print("episode_chief:{0:3d} - {1}\n".format(chief.episode_chief, worker_score_str))
+    chief.finish_round()
+
 
 if __name__ == "__main__":
-    chief_mqtt_client = mqtt.Client("dist_trans_chief")
+    chief_mqtt_client = rl_utils.get_transport_client("dist_trans_chief")
 
     chief_mqtt_client.on_connect = on_chief_connect
     chief_mqtt_client.on_message = on_chief_message
@@ -133,6 +247,15 @@ if __name__ == "__main__":
             time.sleep(1)
             if chief.NUM_DONE_WORKERS == NUM_WORKERS:
                 chief_mqtt_client.loop_stop()
+                # releases this client's reader slots in the local transport rings
+                chief_mqtt_client.disconnect()
+                chief.close()
                 break
         except KeyboardInterrupt as error:
             print("=== {0:>8} is aborted by keyboard interrupt".format('Chief'))
+            # buffered result rows and the last checkpoint are written before exiting
+            chief_mqtt_client.loop_stop()
+            # releases this client's reader slots in the local transport rings
+            chief_mqtt_client.disconnect()
+            chief.close()
+            break
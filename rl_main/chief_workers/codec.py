@@ -0,0 +1,320 @@
+# -*- coding:utf-8 -*-
+import pickle
+import struct
+import warnings
+import zlib
+
+import numpy as np
+
+from rl_main.main_constants import *
+
+MAGIC = b"RLMQ"
+VERSION = 1
+
+# magic, version, codec id, topic kind, compression id, header field mask, padding,
+# worker_id, episode, episode_chief, number of body fields, loss, score
+HEADER = struct.Struct("<4sBBBBB7xiiiIdd")
+
+HEADER_INT_FIELDS = ("worker_id", "episode", "episode_chief")
+HEADER_FLOAT_FIELDS = ("loss", "score")
+HEADER_FIELDS = HEADER_INT_FIELDS + HEADER_FLOAT_FIELDS
+
+TOPIC_KINDS = {
+    MQTT_TOPIC_EPISODE_DETAIL: 1,
+    MQTT_TOPIC_SUCCESS_DONE: 2,
+    MQTT_TOPIC_FAIL_DONE: 3,
+    MQTT_TOPIC_TRANSFER_ACK: 4,
+    MQTT_TOPIC_UPDATE_ACK: 5,
+    MQTT_TOPIC_ACK: 6,
+    MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL: 7
+}
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+
+# name length, field kind, dtype code, number of dimensions
+FIELD = struct.Struct("<HBBB")
+FIELD_KIND_TORCH = 0
+FIELD_KIND_NUMPY = 1
+FIELD_KIND_INT = 2
+FIELD_KIND_FLOAT = 3
+FIELD_KIND_BOOL = 4
+
+DTYPES = [
+    np.dtype("<f4"), np.dtype("<f2"), np.dtype("<f8"),
+    np.dtype("i1"), np.dtype("<i2"), np.dtype("<i4"), np.dtype("<i8"),
+    np.dtype("u1"), np.dtype("?")
+]
+DTYPE_CODES = {dtype: code for code, dtype in enumerate(DTYPES)}
+
+ALIGNMENT = 8
+
+
+class PickleCodec:
+    """
+    기존 방식의 pickle + zlib 코덱입니다. 임의의 python 객체를 담을 수 있지만, 신뢰할 수 없는 payload에는 사용하면 안됩니다.
+    """
+    codec_id = 0
+
+    def encode_body(self, msg):
+        return [pickle.dumps(msg, protocol=-1)], 0
+
+    def decode_body(self, header, body):
+        if not MQTT_ACCEPT_PICKLE_MESSAGES:
+            raise ValueError("pickle payloads are rejected by MQTT_ACCEPT_PICKLE_MESSAGES")
+        return pickle.loads(body)
+
+
+class BinaryCodec:
+    """
+    헤더 이후에 (이름, dtype, shape, raw little-endian bytes) 필드들을 차례로 기록하는 코덱입니다.
+    중첩된 dict는 "gradients/actor/0.weight"와 같이 '/'로 이어진 이름으로 펼쳐서 기록합니다.
+    복원 시 numpy.frombuffer/torch.from_numpy를 사용하므로 tensor는 payload를 복사하지 않습니다.
+    """
+    codec_id = 1
+
+    def encode_body(self, msg):
+        chunks = []
+        num_fields = 0
+        offset = 0
+        for name, value in self.flatten_fields(msg):
+            if isinstance(value, torch.Tensor):
+                kind = FIELD_KIND_TORCH
+                array = value.detach().cpu().contiguous().numpy()
+            elif isinstance(value, np.ndarray):
+                kind = FIELD_KIND_NUMPY
+                array = np.ascontiguousarray(value)
+            elif isinstance(value, (bool, np.bool_)):
+                kind = FIELD_KIND_BOOL
+                array = np.asarray(value, dtype=np.bool_)
+            elif isinstance(value, (int, np.integer)):
+                kind = FIELD_KIND_INT
+                array = np.asarray(value, dtype=np.int64)
+            elif isinstance(value, (float, np.floating)):
+                kind = FIELD_KIND_FLOAT
+                array = np.asarray(value, dtype=np.float64)
+            else:
+                raise TypeError("field '{0}' of type {1} is not supported by BinaryCodec".format(name, type(value)))
+
+            dtype = array.dtype.newbyteorder("<") if array.dtype.byteorder == ">" else array.dtype
+            if dtype not in DTYPE_CODES:
+                raise TypeError("field '{0}' has unsupported dtype {1}".format(name, array.dtype))
+            array = array.astype(dtype, copy=False)
+
+            encoded_name = name.encode("utf-8")
+            field_header = FIELD.pack(len(encoded_name), kind, DTYPE_CODES[dtype], array.ndim) + encoded_name + \
+                struct.pack("<{0}I".format(array.ndim), *array.shape)
+            padding = -(offset + len(field_header)) % ALIGNMENT
+            field_header += b"\x00" * padding
+
+            chunks.append(field_header)
+            chunks.append(memoryview(array).cast("B") if array.ndim > 0 else array.tobytes())
+            offset += len(field_header) + array.nbytes
+            padding = -offset % ALIGNMENT
+            if padding:
+                chunks.append(b"\x00" * padding)
+                offset += padding
+            num_fields += 1
+
+        return chunks, num_fields
+
+    def decode_body(self, header, body):
+        msg = {}
+        offset = 0
+        for _ in range(header["num_fields"]):
+            name_length, kind, dtype_code, ndim = FIELD.unpack_from(body, offset)
+            offset += FIELD.size
+            name = bytes(body[offset:offset + name_length]).decode("utf-8")
+            offset += name_length
+            shape = struct.unpack_from("<{0}I".format(ndim), body, offset)
+            offset += 4 * ndim
+            offset += -offset % ALIGNMENT
+
+            dtype = DTYPES[dtype_code]
+            count = int(np.prod(shape)) if ndim > 0 else 1
+            array = np.frombuffer(body, dtype=dtype, count=count, offset=offset).reshape(shape)
+            offset += count * dtype.itemsize
+            offset += -offset % ALIGNMENT
+
+            if kind == FIELD_KIND_TORCH:
+                # tensor는 수신한 (read-only) payload와 메모리를 공유하므로, 이 호출에서만 경고를 끕니다.
+                with warnings.catch_warnings():
+                    warnings.filterwarnings("ignore", message="The given NumPy array is not writable")
+                    value = torch.from_numpy(array)
+            elif kind == FIELD_KIND_NUMPY:
+                value = array
+            else:
+                value = array[()].item()
+
+            self.insert_field(msg, name, value)
+
+        return msg
+
+    @staticmethod
+    def flatten_fields(msg, prefix=""):
+        for key, value in msg.items():
+            name = prefix + str(key)
+            if isinstance(value, dict):
+                for item in BinaryCodec.flatten_fields(value, prefix=name + "/"):
+                    yield item
+            else:
+                yield name, value
+
+    @staticmethod
+    def insert_field(msg, name, value):
+        keys = name.split("/")
+        for key in keys[:-1]:
+            msg = msg.setdefault(key, {})
+        msg[keys[-1]] = value
+
+
+CODECS = {
+    PickleCodec.codec_id: PickleCodec(),
+    BinaryCodec.codec_id: BinaryCodec()
+}
+
+
+def get_codec():
+    if MQTT_MESSAGE_CODEC == MessageCodecName.PICKLE:
+        codec = CODECS[PickleCodec.codec_id]
+    elif MQTT_MESSAGE_CODEC == MessageCodecName.BINARY:
+        codec = CODECS[BinaryCodec.codec_id]
+    else:
+        codec = None
+    return codec
+
+
+def get_compression_level():
+    if MQTT_COMPRESSION == CompressionName.NONE:
+        level = None
+    elif MQTT_COMPRESSION == CompressionName.FAST:
+        level = 1
+    elif MQTT_COMPRESSION == CompressionName.DENSE:
+        level = MQTT_COMPRESSION_DENSE_LEVEL
+    else:
+        level = None
+    return level
+
+
+def compress_body(chunks):
+    level = get_compression_level()
+    body_length = sum(len(chunk) for chunk in chunks)
+
+    if level is None or body_length < MQTT_COMPRESSION_THRESHOLD:
+        return chunks, COMPRESSION_NONE
+
+    compressor = zlib.compressobj(level)
+    compressed_chunks = [compressor.compress(chunk) for chunk in chunks]
+    compressed_chunks.append(compressor.flush())
+    if sum(len(chunk) for chunk in compressed_chunks) >= body_length:
+        # float32 gradients are mostly incompressible; the raw body is cheaper to decode.
+        return chunks, COMPRESSION_NONE
+
+    return compressed_chunks, COMPRESSION_ZLIB
+
+
+def decompress_body(body, compression):
+    if compression == COMPRESSION_NONE:
+        return body
+    elif compression == COMPRESSION_ZLIB:
+        return zlib.decompress(body)
+    else:
+        raise ValueError("unknown compression id: {0}".format(compression))
+
+
+def split_header_fields(msg):
+    header_values = {}
+    body_msg = {}
+    for key, value in msg.items():
+        if key in HEADER_INT_FIELDS and isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+            header_values[key] = int(value)
+        elif key in HEADER_FLOAT_FIELDS and isinstance(value, (int, float, np.integer, np.floating)):
+            header_values[key] = float(value)
+        else:
+            body_msg[key] = value
+    return header_values, body_msg
+
+
+def encode_msg(topic, msg):
+    """
+    Args:
+        topic(str): 메세지를 발행할 MQTT topic입니다.
+        msg(dict): worker_id, episode, episode_chief, loss, score는 고정 헤더에, 나머지는 body에 기록됩니다.
+            body는 MQTT_COMPRESSION 정책에 따라 압축되며, 사용된 압축 방식은 헤더에 기록됩니다.
+
+    Returns:
+         MQTT payload로 사용할 bytes를 반환합니다.
+    """
+    codec = get_codec()
+    header_values, body_msg = split_header_fields(msg)
+
+    try:
+        chunks, num_fields = codec.encode_body(body_msg)
+    except TypeError:
+        # BinaryCodec이 표현할 수 없는 값이 포함된 경우 기존 pickle 경로로 보냅니다.
+        codec = CODECS[PickleCodec.codec_id]
+        chunks, num_fields = codec.encode_body(body_msg)
+
+    chunks, compression = compress_body(chunks)
+
+    header_field_mask = 0
+    for idx, field in enumerate(HEADER_FIELDS):
+        if field in header_values:
+            header_field_mask |= 1 << idx
+
+    header = HEADER.pack(
+        MAGIC, VERSION, codec.codec_id, TOPIC_KINDS.get(topic, 0), compression, header_field_mask,
+        header_values.get("worker_id", -1),
+        header_values.get("episode", -1),
+        header_values.get("episode_chief", -1),
+        num_fields,
+        header_values.get("loss", 0.0),
+        header_values.get("score", 0.0)
+    )
+
+    return b"".join([header] + chunks)
+
+
+def decode_header(payload):
+    magic, version, codec_id, topic_kind, compression, header_field_mask, worker_id, episode, episode_chief, \
+        num_fields, loss, score = HEADER.unpack_from(payload, 0)
+
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("payload is not a version {0} RLMQ message".format(VERSION))
+
+    values = {
+        "worker_id": worker_id,
+        "episode": episode,
+        "episode_chief": episode_chief,
+        "loss": loss,
+        "score": score
+    }
+
+    return {
+        "codec_id": codec_id,
+        "topic_kind": topic_kind,
+        "compression": compression,
+        "num_fields": num_fields,
+        "fields": {field: values[field] for idx, field in enumerate(HEADER_FIELDS) if header_field_mask & (1 << idx)}
+    }
+
+
+def decode_msg(payload):
+    """
+    Args:
+        payload(bytes): encode_msg로 만들어진 payload 혹은 헤더가 없는 기존 pickle + zlib payload입니다.
+
+    Returns:
+         복원된 메세지 dict를 반환합니다.
+    """
+    if payload[:len(MAGIC)] != MAGIC:
+        if not MQTT_ACCEPT_PICKLE_MESSAGES:
+            raise ValueError("legacy pickle payloads are rejected by MQTT_ACCEPT_PICKLE_MESSAGES")
+        return pickle.loads(zlib.decompress(payload))
+
+    header = decode_header(payload)
+    body = decompress_body(memoryview(payload)[HEADER.size:], header["compression"])
+
+    msg = CODECS[header["codec_id"]].decode_body(header, body)
+    msg.update(header["fields"])
+    return msg
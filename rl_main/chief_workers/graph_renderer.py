@@ -0,0 +1,74 @@
+# -*- coding:utf-8 -*-
+import os
+import threading
+import time
+import traceback
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from rl_main.main_constants import *
+
+
+class GraphRenderer:
+    """
+    chief의 메세지 처리 thread 대신 별도의 thread에서 graph를 그립니다.
+    request()는 다시 그려야 한다는 표시만 남기고 바로 반환하며, 실제 그리기는 GRAPH_SAVE_INTERVAL초에 최대 한 번,
+    get_snapshot()이 반환한 metrics의 복사본으로 수행됩니다. pyplot의 전역 상태를 쓰지 않도록 draw()는 Figure를 반환해야 합니다.
+    """
+    def __init__(self, get_snapshot, draw, file_path):
+        self.get_snapshot = get_snapshot
+        self.draw = draw
+        self.file_path = file_path
+
+        self.condition = threading.Condition()
+        self.is_requested = False
+        self.is_stopped = False
+        self.last_render_time = 0.0
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def request(self):
+        with self.condition:
+            self.is_requested = True
+            self.condition.notify_all()
+
+    def stop(self):
+        """
+        아직 그려지지 않은 요청이 있으면 마지막으로 한 번 그린 후 thread를 종료합니다.
+        """
+        with self.condition:
+            self.is_stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.is_requested or self.is_stopped)
+                if not self.is_requested:
+                    return
+
+                remaining_time = self.last_render_time + GRAPH_SAVE_INTERVAL - time.time()
+                if remaining_time > 0:
+                    # requests arriving meanwhile are served by this single rendering
+                    self.condition.wait_for(lambda: self.is_stopped, timeout=remaining_time)
+
+                self.is_requested = False
+
+            self.last_render_time = time.time()
+            self.render()
+
+    def render(self):
+        try:
+            fig = self.draw(self.get_snapshot())
+            FigureCanvasAgg(fig)
+
+            # write to a temporary file first so that readers never see a half-written png
+            temp_file_path = os.path.join(
+                os.path.dirname(self.file_path), ".{0}.tmp.png".format(os.path.basename(self.file_path))
+            )
+            fig.savefig(temp_file_path)
+            os.replace(temp_file_path, self.file_path)
+        except Exception:
+            traceback.print_exc()
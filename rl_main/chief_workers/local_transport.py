@@ -0,0 +1,367 @@
+# -*- coding:utf-8 -*-
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the MQTT transport is available
+    fcntl = None
+
+from rl_main.main_constants import *
+
+# write position, capacity
+RING_HEADER = struct.Struct("<QQ")
+# pid of the subscribing process (0: free slot), read position
+READER_SLOT = struct.Struct("<QQ")
+RING_MAX_SUBSCRIBERS = 128
+READER_TABLE_OFFSET = 64
+RING_DATA_OFFSET = READER_TABLE_OFFSET + RING_MAX_SUBSCRIBERS * READER_SLOT.size
+RECORD_HEADER = struct.Struct("<I")
+
+LocalMessage = namedtuple("LocalMessage", ["topic", "payload"])
+
+
+def get_registry_dir():
+    return os.path.join(tempfile.gettempdir(), "{0}_local_transport".format(LOCAL_TRANSPORT_NAMESPACE))
+
+
+def get_shared_memory_name(topic):
+    return "{0}_{1}".format(LOCAL_TRANSPORT_NAMESPACE, topic.replace("/", "_"))
+
+
+def is_process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def open_untracked_shared_memory(name, create=False, size=0):
+    # the rings outlive the process that created them, so the resource tracker must not unlink them at exit;
+    # unlink_local_transport() removes them
+    if sys.version_info >= (3, 13):
+        return SharedMemory(name=name, create=create, size=size, track=False)
+
+    # older interpreters always register with the resource tracker, which knows POSIX shared memory by its
+    # "/"-prefixed name (fcntl makes this transport POSIX only)
+    shared_memory = SharedMemory(name=name, create=create, size=size)
+    resource_tracker.unregister("/" + shared_memory.name, "shared_memory")
+    return shared_memory
+
+
+class TopicRing:
+    """
+    하나의 topic에 발행된 payload들을 (길이, bytes) 레코드로 차례로 기록하는 shared memory ring buffer입니다.
+    write position은 계속 증가하며, 각 subscriber는 자신이 읽은 위치를 ring의 reader slot에 기록합니다.
+    publisher는 가장 느린 subscriber가 아직 읽지 않은 레코드를 덮어쓰지 않도록 공간이 생길 때까지 기다리며,
+    LOCAL_TRANSPORT_PUBLISH_TIMEOUT초가 지나도 공간이 생기지 않으면 예외를 발생시킵니다.
+    종료된 process의 reader slot은 publisher가 기다리는 동안 해제합니다.
+    여러 process의 publisher와 subscriber는 topic별 lock 파일에 대한 fcntl.flock으로 동기화됩니다.
+    """
+    def __init__(self, topic):
+        self.topic = topic
+        self.thread_lock = threading.Lock()
+
+        rings_dir = os.path.join(get_registry_dir(), "rings")
+        os.makedirs(rings_dir, exist_ok=True)
+        self.lock_file = open(os.path.join(rings_dir, "{0}.lock".format(get_shared_memory_name(topic))), "a+")
+
+        with self.locked(fcntl.LOCK_EX):
+            try:
+                self.shared_memory = open_untracked_shared_memory(
+                    get_shared_memory_name(topic), create=True, size=RING_DATA_OFFSET + LOCAL_TRANSPORT_RING_SIZE
+                )
+                RING_HEADER.pack_into(self.shared_memory.buf, 0, 0, LOCAL_TRANSPORT_RING_SIZE)
+            except FileExistsError:
+                self.shared_memory = open_untracked_shared_memory(get_shared_memory_name(topic))
+
+        self.buf = self.shared_memory.buf
+        _, self.capacity = RING_HEADER.unpack_from(self.buf, 0)
+
+    @contextmanager
+    def locked(self, operation):
+        # flock does not exclude threads sharing the lock file, so threads of this process take thread_lock first
+        with self.thread_lock:
+            fcntl.flock(self.lock_file, operation)
+            try:
+                yield
+            finally:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+
+    def add_reader(self):
+        """
+        Returns:
+             (reader slot, 시작 위치)를 반환합니다. MQTT의 retained가 아닌 메세지처럼, 지금부터 발행되는 메세지만 읽습니다.
+        """
+        with self.locked(fcntl.LOCK_EX):
+            write_position, _ = RING_HEADER.unpack_from(self.buf, 0)
+            for slot in range(RING_MAX_SUBSCRIBERS):
+                pid, _ = READER_SLOT.unpack_from(self.buf, READER_TABLE_OFFSET + slot * READER_SLOT.size)
+                if pid == 0:
+                    READER_SLOT.pack_into(self.buf, READER_TABLE_OFFSET + slot * READER_SLOT.size, os.getpid(), write_position)
+                    return slot, write_position
+        raise RuntimeError("topic '{0}' already has {1} subscribers".format(self.topic, RING_MAX_SUBSCRIBERS))
+
+    def remove_reader(self, slot):
+        with self.locked(fcntl.LOCK_EX):
+            READER_SLOT.pack_into(self.buf, READER_TABLE_OFFSET + slot * READER_SLOT.size, 0, 0)
+
+    def get_slowest_read_position(self, write_position, free_dead_readers=False):
+        # called with the exclusive lock held
+        slowest_position = write_position
+        for slot in range(RING_MAX_SUBSCRIBERS):
+            offset = READER_TABLE_OFFSET + slot * READER_SLOT.size
+            pid, position = READER_SLOT.unpack_from(self.buf, offset)
+            if pid == 0:
+                continue
+            if free_dead_readers and not is_process_alive(pid):
+                READER_SLOT.pack_into(self.buf, offset, 0, 0)
+                continue
+            slowest_position = min(slowest_position, position)
+        return slowest_position
+
+    def copy_in(self, position, data):
+        data = memoryview(data).cast("B")
+        start = position % self.capacity
+        first = min(len(data), self.capacity - start)
+        self.buf[RING_DATA_OFFSET + start:RING_DATA_OFFSET + start + first] = data[:first]
+        if first < len(data):
+            self.buf[RING_DATA_OFFSET:RING_DATA_OFFSET + len(data) - first] = data[first:]
+
+    def copy_out(self, position, length):
+        start = position % self.capacity
+        first = min(length, self.capacity - start)
+        data = bytes(self.buf[RING_DATA_OFFSET + start:RING_DATA_OFFSET + start + first])
+        if first < length:
+            data += bytes(self.buf[RING_DATA_OFFSET:RING_DATA_OFFSET + length - first])
+        return data
+
+    def write(self, payload):
+        record_length = RECORD_HEADER.size + len(payload)
+        if record_length > self.capacity:
+            raise ValueError("payload of {0} bytes does not fit the {1} bytes ring of topic '{2}'".format(
+                len(payload), self.capacity, self.topic
+            ))
+
+        deadline = None
+        wait_interval = 0.001
+        while True:
+            with self.locked(fcntl.LOCK_EX):
+                write_position, capacity = RING_HEADER.unpack_from(self.buf, 0)
+                slowest_position = self.get_slowest_read_position(write_position, free_dead_readers=deadline is not None)
+                if write_position + record_length - slowest_position <= capacity:
+                    self.copy_in(write_position, RECORD_HEADER.pack(len(payload)))
+                    self.copy_in(write_position + RECORD_HEADER.size, payload)
+                    RING_HEADER.pack_into(self.buf, 0, write_position + record_length, capacity)
+                    return
+
+            # the slowest subscriber has not read a ring's worth of messages yet
+            if deadline is None:
+                deadline = time.time() + LOCAL_TRANSPORT_PUBLISH_TIMEOUT
+            elif time.time() > deadline:
+                raise RuntimeError("a subscriber of topic '{0}' has not read for {1} seconds and the ring is full".format(
+                    self.topic, LOCAL_TRANSPORT_PUBLISH_TIMEOUT
+                ))
+            time.sleep(wait_interval)
+            wait_interval = min(wait_interval * 2, 0.05)
+
+    def read(self, slot, position):
+        """
+        Args:
+            slot(int): subscriber의 reader slot입니다.
+            position(int): subscriber가 마지막으로 읽은 위치입니다.
+
+        Returns:
+             (payload 목록, 새로운 위치)를 반환합니다. 새로운 위치는 reader slot에도 기록되어 publisher가 그만큼의 공간을 다시 사용합니다.
+        """
+        payloads = []
+        # each subscriber writes only its own slot, and publishers read the slots with the exclusive lock
+        with self.locked(fcntl.LOCK_SH):
+            write_position, _ = RING_HEADER.unpack_from(self.buf, 0)
+            pid, _ = READER_SLOT.unpack_from(self.buf, READER_TABLE_OFFSET + slot * READER_SLOT.size)
+            if pid != os.getpid() or write_position - position > self.capacity:
+                raise RuntimeError("reader slot {0} of topic '{1}' was released and messages were overwritten".format(
+                    slot, self.topic
+                ))
+
+            while position < write_position:
+                length, = RECORD_HEADER.unpack(self.copy_out(position, RECORD_HEADER.size))
+                payloads.append(self.copy_out(position + RECORD_HEADER.size, length))
+                position += RECORD_HEADER.size + length
+
+            READER_SLOT.pack_into(self.buf, READER_TABLE_OFFSET + slot * READER_SLOT.size, pid, position)
+
+        return payloads, position
+
+    def close(self):
+        self.buf = None
+        self.shared_memory.close()
+        self.lock_file.close()
+
+
+class LocalTransportClient:
+    """
+    chief와 workers가 한 host에서 실행될 때 MQTT broker 대신 사용하는 transport입니다.
+    paho.mqtt.client.Client 중 Chief와 Worker가 사용하는 부분(connect, subscribe, publish, loop_start, loop_stop,
+    on_connect, on_message, on_log)과 같은 interface를 가집니다.
+    payload는 topic별 shared memory ring에 기록되고, 구독 중인 clients에게는 Unix datagram socket으로 알림만 보냅니다.
+    """
+    def __init__(self, client_id):
+        if fcntl is None or not hasattr(socket, "AF_UNIX"):
+            raise NotImplementedError("TransportName.LOCAL requires a POSIX platform")
+
+        self.client_id = client_id
+        self.on_connect = None
+        self.on_message = None
+        self.on_log = None
+
+        self.rings = {}
+        self.rings_lock = threading.Lock()
+        self.subscriptions = {}
+        self.reader_slots = {}
+
+        self.socket = None
+        self.socket_path = os.path.join(get_registry_dir(), "sockets", "{0}.sock".format(client_id))
+        self.loop_thread = None
+        self.is_running = False
+
+    def log(self, string):
+        if self.on_log is not None:
+            self.on_log(self, None, 0, string)
+
+    def get_ring(self, topic):
+        with self.rings_lock:
+            if topic not in self.rings:
+                self.rings[topic] = TopicRing(topic)
+            return self.rings[topic]
+
+    def get_topic_dir(self, topic):
+        return os.path.join(get_registry_dir(), "topics", topic.replace("/", "_"))
+
+    def connect(self, host=None, port=None, keepalive=None):
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.socket.bind(self.socket_path)
+        self.socket.settimeout(LOCAL_TRANSPORT_POLL_INTERVAL)
+        self.log("{0} bound {1}".format(self.client_id, self.socket_path))
+        return 0
+
+    def subscribe(self, topic, qos=0):
+        if topic in self.subscriptions:
+            return 0, 0
+
+        ring = self.get_ring(topic)
+        # like MQTT without retained messages, a new subscriber only receives what is published from now on
+        self.reader_slots[topic], self.subscriptions[topic] = ring.add_reader()
+
+        topic_dir = self.get_topic_dir(topic)
+        os.makedirs(topic_dir, exist_ok=True)
+        open(os.path.join(topic_dir, self.client_id), "w").close()
+        return 0, 0
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.get_ring(topic).write(payload)
+        self.notify_subscribers(topic)
+        return 0, 0
+
+    def notify_subscribers(self, topic):
+        topic_dir = self.get_topic_dir(topic)
+        if not os.path.isdir(topic_dir):
+            return
+
+        notify_socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        notify_socket.setblocking(False)
+        try:
+            for client_id in os.listdir(topic_dir):
+                try:
+                    notify_socket.sendto(b"\x00", os.path.join(get_registry_dir(), "sockets", "{0}.sock".format(client_id)))
+                except (BlockingIOError, ConnectionRefusedError, FileNotFoundError):
+                    # a full queue already wakes the subscriber up; a stopped subscriber reads nothing anymore
+                    pass
+        finally:
+            notify_socket.close()
+
+    def dispatch_messages(self):
+        for topic, position in list(self.subscriptions.items()):
+            payloads, self.subscriptions[topic] = self.rings[topic].read(self.reader_slots[topic], position)
+
+            for payload in payloads:
+                if self.on_message is not None:
+                    self.on_message(self, None, LocalMessage(topic, payload))
+
+    def loop_forever(self):
+        if self.on_connect is not None:
+            self.on_connect(self, None, {}, 0)
+
+        while self.is_running:
+            try:
+                self.socket.recv(64)
+            except socket.timeout:
+                pass
+            self.dispatch_messages()
+
+    def loop_start(self):
+        self.is_running = True
+        self.loop_thread = threading.Thread(target=self.loop_forever, daemon=True)
+        self.loop_thread.start()
+
+    def loop_stop(self):
+        self.is_running = False
+        if self.loop_thread is not None and self.loop_thread is not threading.current_thread():
+            self.loop_thread.join()
+        self.loop_thread = None
+
+    def disconnect(self):
+        self.loop_stop()
+
+        for topic in self.subscriptions:
+            subscriber_file = os.path.join(self.get_topic_dir(topic), self.client_id)
+            if os.path.exists(subscriber_file):
+                os.remove(subscriber_file)
+            self.rings[topic].remove_reader(self.reader_slots[topic])
+        self.subscriptions = {}
+        self.reader_slots = {}
+
+        if self.socket is not None:
+            self.socket.close()
+            self.socket = None
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+        for ring in self.rings.values():
+            ring.close()
+        self.rings = {}
+
+
+def unlink_local_transport():
+    """
+    이전 실행에서 남은 shared memory rings와 subscriber 정보를 삭제합니다. chief와 workers가 실행 중이 아닐 때 호출해야 합니다.
+    """
+    registry_dir = get_registry_dir()
+    rings_dir = os.path.join(registry_dir, "rings")
+    if os.path.isdir(rings_dir):
+        for lock_file_name in os.listdir(rings_dir):
+            try:
+                shared_memory = SharedMemory(name=os.path.splitext(lock_file_name)[0])
+            except FileNotFoundError:
+                continue
+            shared_memory.close()
+            shared_memory.unlink()
+
+    shutil.rmtree(registry_dir, ignore_errors=True)
@@ -0,0 +1,76 @@
+# -*- coding:utf-8 -*-
+from collections import OrderedDict
+
+from rl_main.main_constants import *
+
+
+class ParametersHistory:
+    """
+    Transfer_Ack으로 broadcast된 flat parameter들을 version별로 최근 PARAMETERS_TRANSFER_HISTORY개만큼 보관합니다.
+    chief는 workers가 확인(ack)한 version을 기준으로 delta를 만들고, worker는 같은 기준 version에 delta를 더해서 복원합니다.
+    양쪽 모두 복원된 값을 저장하므로 fp16 delta를 사용해도 chief와 worker의 기준 parameter는 항상 같습니다.
+    """
+    def __init__(self):
+        self.snapshots = OrderedDict()
+        self.latest_version = -1
+
+    def store(self, version, parameters):
+        self.snapshots[version] = parameters.detach().cpu().clone()
+        self.latest_version = version
+        while len(self.snapshots) > PARAMETERS_TRANSFER_HISTORY:
+            self.snapshots.popitem(last=False)
+
+    def make_transfer_msg(self, parameters, acknowledged_versions):
+        """
+        Args:
+            parameters(torch.Tensor): 새로 broadcast할 flat parameter입니다.
+            acknowledged_versions(list): 아직 학습 중인 workers가 마지막으로 확인한 version 목록입니다.
+
+        Returns:
+             transfer 메세지에 추가할 dict를 반환합니다.
+        """
+        parameters = parameters.detach().cpu()
+        version = self.latest_version + 1
+
+        base_version = min(acknowledged_versions) if len(acknowledged_versions) > 0 else -1
+
+        if PARAMETERS_TRANSFER_DELTA and base_version in self.snapshots:
+            delta = parameters - self.snapshots[base_version]
+            if PARAMETERS_TRANSFER_DELTA_FP16:
+                delta = delta.half()
+            self.store(version, self.snapshots[base_version] + delta.float())
+            transfer_msg = {
+                "parameters_version": version,
+                "parameters_base_version": base_version,
+                "parameters_delta": delta
+            }
+        else:
+            # 너무 오래된 version을 가진 worker가 있으면 전체 parameter를 보냅니다.
+            self.store(version, parameters)
+            transfer_msg = {
+                "parameters_version": version,
+                "parameters": parameters
+            }
+
+        return transfer_msg
+
+    def restore_from_transfer_msg(self, msg_payload):
+        """
+        Returns:
+             복원된 flat parameter를 반환합니다. 기준 version을 가지고 있지 않으면 None을 반환하고,
+             latest_version을 -1로 되돌려 chief가 다음 transfer에서 전체 parameter를 보내도록 합니다.
+        """
+        version = msg_payload["parameters_version"]
+
+        if "parameters" in msg_payload:
+            parameters = msg_payload["parameters"]
+        else:
+            base_version = msg_payload["parameters_base_version"]
+            if base_version not in self.snapshots:
+                # the worker reports latest_version as its acknowledged version, and -1 is never a delta base
+                self.latest_version = -1
+                return None
+            parameters = self.snapshots[base_version] + msg_payload["parameters_delta"].float()
+
+        self.store(version, parameters)
+        return self.snapshots[version]
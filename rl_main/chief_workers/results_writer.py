@@ -0,0 +1,113 @@
+# -*- coding:utf-8 -*-
+import atexit
+import csv
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from rl_main.main_constants import *
+
+RESULTS_DTYPE = np.dtype([
+    ("episode_chief", "<i8"),
+    ("worker_id", "<i8"),
+    ("loss", "<f8"),
+    ("ema_loss", "<f8"),
+    ("score", "<f8"),
+    ("ema_score", "<f8")
+])
+
+NPY_MAGIC = b"\x93NUMPY\x01\x00"
+NPY_HEADER_SIZE = 256
+
+
+class NpyAppendLog:
+    """
+    행을 계속 덧붙일 수 있는 .npy 파일입니다. 헤더를 NPY_HEADER_SIZE bytes로 고정해 두고,
+    행을 추가할 때마다 헤더의 shape만 다시 기록하므로 numpy.load로 언제든지 읽을 수 있습니다.
+    """
+    def __init__(self, file_path, dtype):
+        self.file_path = file_path
+        self.dtype = np.dtype(dtype)
+
+        if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+            self.file = open(file_path, "r+b")
+            np.lib.format.read_magic(self.file)
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(self.file)
+            if self.file.tell() != NPY_HEADER_SIZE or dtype != self.dtype or fortran_order or len(shape) != 1:
+                raise ValueError("{0} is not an append log of {1}".format(file_path, self.dtype))
+            self.num_rows = shape[0]
+        else:
+            self.file = open(file_path, "w+b")
+            self.num_rows = 0
+            self.write_header()
+
+    def write_header(self):
+        header = "{{'descr': {0!r}, 'fortran_order': False, 'shape': ({1},), }}".format(
+            np.lib.format.dtype_to_descr(self.dtype), self.num_rows
+        )
+        header = header.ljust(NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - 1) + "\n"
+        self.file.seek(0)
+        self.file.write(NPY_MAGIC + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+    def append(self, rows):
+        array = np.asarray(rows, dtype=self.dtype)
+        self.file.seek(NPY_HEADER_SIZE + self.num_rows * self.dtype.itemsize)
+        self.file.write(array.tobytes())
+        self.num_rows += len(array)
+        self.write_header()
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class ResultsWriter:
+    """
+    Chief.save_results의 행들을 모아서 기록합니다. 파일은 열어둔 채로 유지하며,
+    RESULTS_FLUSH_ROWS개의 행이 모이거나 마지막 기록 후 RESULTS_FLUSH_INTERVAL초가 지나면, 그리고 close() 시에 기록합니다.
+    RESULTS_NPY_LOG이면 같은 행들을 .npy append log에도 기록합니다.
+    close()가 호출되지 않고 process가 종료되더라도 모아둔 행들은 atexit에서 기록합니다.
+    """
+    def __init__(self, csv_file_path, npy_file_path=None):
+        self.csv_file = open(csv_file_path, 'a', encoding='utf-8', newline='')
+        self.csv_writer = csv.writer(self.csv_file)
+        self.npy_log = NpyAppendLog(npy_file_path, RESULTS_DTYPE) if npy_file_path is not None else None
+
+        self.lock = threading.Lock()
+        self.rows = []
+        self.last_flush_time = time.time()
+
+        atexit.register(self.close)
+
+    def write_row(self, row):
+        with self.lock:
+            self.rows.append(row)
+            if len(self.rows) >= RESULTS_FLUSH_ROWS or time.time() - self.last_flush_time >= RESULTS_FLUSH_INTERVAL:
+                self.flush_rows()
+
+    def flush(self):
+        with self.lock:
+            self.flush_rows()
+
+    def flush_rows(self):
+        if len(self.rows) > 0:
+            self.csv_writer.writerows(self.rows)
+            self.csv_file.flush()
+
+            if self.npy_log is not None:
+                self.npy_log.append([tuple(row) for row in self.rows])
+
+            self.rows = []
+        self.last_flush_time = time.time()
+
+    def close(self):
+        with self.lock:
+            if self.csv_file.closed:
+                return
+            self.flush_rows()
+            self.csv_file.close()
+            if self.npy_log is not None:
+                self.npy_log.close()
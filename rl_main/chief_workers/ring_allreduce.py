@@ -0,0 +1,102 @@
+# -*- coding:utf-8 -*-
+import threading
+import time
+
+from rl_main.main_constants import *
+from rl_main.chief_workers.codec import encode_msg
+
+
+def get_ring_topic(worker_id):
+    return "{0}/{1}".format(MQTT_TOPIC_RING_ALLREDUCE, worker_id)
+
+
+class RingAllReduce:
+    """
+    chief를 거치지 않고 workers끼리 flat gradient를 평균내는 ring all-reduce입니다.
+    chief는 Update_Ack의 ring_members로 이번 라운드에 참여할 workers만 알려주고,
+    각 worker는 gradient를 len(ring_members)개의 chunk로 나누어 reduce-scatter와 all-gather를 차례로 수행합니다.
+    worker 하나가 주고받는 양은 2 * (n - 1) / n * gradient 크기로, workers 수와 거의 무관합니다.
+    """
+    def __init__(self, logger, worker_id, worker_mqtt_client):
+        self.logger = logger
+        self.worker_id = worker_id
+        self.worker_mqtt_client = worker_mqtt_client
+
+        self.condition = threading.Condition()
+        self.ring_members = {}
+        self.received_chunks = {}
+
+    def set_ring_members(self, episode_chief, ring_members):
+        with self.condition:
+            self.ring_members[episode_chief] = [int(worker_id) for worker_id in ring_members]
+
+    def receive_chunk(self, msg_payload):
+        with self.condition:
+            self.received_chunks[(msg_payload["episode_chief"], msg_payload["step"])] = msg_payload["chunk"]
+            self.condition.notify_all()
+
+    def send_chunk(self, peer_id, episode_chief, step, chunk):
+        topic = get_ring_topic(peer_id)
+        msg = encode_msg(topic, {
+            "worker_id": self.worker_id,
+            "episode_chief": episode_chief,
+            "step": step,
+            "chunk": chunk
+        })
+        self.worker_mqtt_client.publish(topic=topic, payload=msg, qos=0, retain=False)
+
+    def wait_chunk(self, episode_chief, step):
+        key = (episode_chief, step)
+        start_time = time.time()
+        with self.condition:
+            while not self.condition.wait_for(lambda: key in self.received_chunks, timeout=SYNC_BARRIER_REPORT_INTERVAL):
+                log_msg = "Worker {0} - still waiting for ring all-reduce step {1} of episode_chief {2} ({3:.1f} seconds)".format(
+                    self.worker_id, step, episode_chief, time.time() - start_time
+                )
+                self.logger.warning(log_msg)
+                print(log_msg)
+            return self.received_chunks.pop(key)
+
+    def all_reduce(self, episode_chief, flat_gradients):
+        """
+        Args:
+            episode_chief(int): chief가 ring_members를 보낸 라운드입니다.
+            flat_gradients(torch.Tensor): 이번 episode에서 계산한 flat gradient입니다.
+
+        Returns:
+             ring_members 전체의 평균 gradient를 반환합니다. 이 worker가 해당 라운드의 ring에 없으면 None을 반환합니다.
+        """
+        with self.condition:
+            ring_members = self.ring_members.pop(episode_chief, None)
+            for key in [key for key in self.ring_members if key < episode_chief]:
+                del self.ring_members[key]
+            for key in [key for key in self.received_chunks if key[0] < episode_chief]:
+                del self.received_chunks[key]
+
+        if ring_members is None or self.worker_id not in ring_members:
+            return None
+
+        num_members = len(ring_members)
+        if num_members == 1:
+            return flat_gradients
+
+        rank = ring_members.index(self.worker_id)
+        next_peer_id = ring_members[(rank + 1) % num_members]
+
+        buffer = flat_gradients.detach().clone()
+        boundaries = [len(buffer) * idx // num_members for idx in range(num_members + 1)]
+        chunks = [buffer[boundaries[idx]:boundaries[idx + 1]] for idx in range(num_members)]
+
+        # reduce-scatter: after n - 1 steps chunk (rank + 1) % n holds the sum over all members
+        for step in range(num_members - 1):
+            self.send_chunk(next_peer_id, episode_chief, step, chunks[(rank - step) % num_members])
+            chunks[(rank - step - 1) % num_members] += self.wait_chunk(episode_chief, step).to(buffer.device)
+
+        # all-gather: pass the summed chunks around the ring once more
+        for step in range(num_members - 1):
+            all_gather_step = num_members - 1 + step
+            self.send_chunk(next_peer_id, episode_chief, all_gather_step, chunks[(rank + 1 - step) % num_members])
+            chunks[(rank - step) % num_members].copy_(self.wait_chunk(episode_chief, all_gather_step))
+
+        buffer /= num_members
+        return buffer
@@ -1,21 +1,26 @@
 # -*- coding:utf-8 -*-
-import glob
-import pickle
-import time
-import zlib
+import logging
 from collections import deque
 
 import numpy as np
 
 from rl_main.main_constants import *
-from rl_main.utils import exp_moving_average
+from rl_main.utils import ExpMovingAverage
+from rl_main.chief_workers.barrier import EpisodeBarrier
+from rl_main.chief_workers.codec import encode_msg
+from rl_main.chief_workers.parameters_transfer import ParametersHistory
+from rl_main.chief_workers.ring_allreduce import RingAllReduce
+from rl_main.chief_workers.aggregator import get_aggregator_id, get_aggregator_topic
+from rl_main.models.checkpoint import CheckpointManager, TRAINING_STATE_FORMAT, load_checkpoint, is_training_state, \
+    is_lockstep_resume, get_rng_states, set_rng_states
+from rl_main.models.gradient_compression import get_gradient_compressor
 import rl_main.rl_utils as rl_utils
 
 env = rl_utils.get_environment(owner="worker")
 
 
 class Worker:
-    def __init__(self, logger, worker_id, worker_mqtt_client):
+    def __init__(self, logger, worker_id, worker_mqtt_client, resume_episode=None):
         self.worker_id = worker_id
         self.worker_mqtt_client = worker_mqtt_client
 
@@ -26,53 +31,224 @@ class Worker:
         self.global_max_ema_score = 0
         self.global_min_ema_loss = 1000000000
 
-        self.local_scores = []
-        self.local_losses = []
+        self.local_score_ema = ExpMovingAverage(EMA_WINDOW)
+        self.local_loss_ema = ExpMovingAverage(EMA_WINDOW)
 
         self.score_dequeue = deque(maxlen=env.WIN_AND_LEARN_FINISH_CONTINUOUS_EPISODES)
         self.loss_dequeue = deque(maxlen=env.WIN_AND_LEARN_FINISH_CONTINUOUS_EPISODES)
 
-        self.episode_chief = -1
+        self.episode_chief_barrier = EpisodeBarrier(-1)
+        self.acked_episode_barrier = EpisodeBarrier(-1)
+        self.pending_processes = deque()
+        # episode_chief of the last update or transfer applied to the model; the barrier value may be ahead of it
+        self.applied_episode_chief = -1
 
         self.is_success_or_fail_done = False
         self.logger = logger
 
-    def update_process(self, avg_gradients):
+        self.parameters_history = ParametersHistory()
+
+        if MODE_GRADIENTS_UPDATE and not MODE_RING_ALLREDUCE:
+            self.gradient_compressor = get_gradient_compressor(getattr(self.rl_algorithm, "model", None))
+        else:
+            self.gradient_compressor = None
+
+        self.ring_allreduce = RingAllReduce(logger, worker_id, worker_mqtt_client)
+
+        self.is_batching_episodes = not MODE_SYNCHRONIZATION and WORKERS_PER_AGGREGATOR == 0 and EPISODE_MESSAGE_BATCH_SIZE > 1
+        self.episode_batch = []
+        self.episode_batch_gradients = None
+
+        self.checkpoint_manager = CheckpointManager(worker_id) if MODEL_SAVE else None
+
+        self.start_episode = 0
+        if resume_episode is not None:
+            self.resume(resume_episode)
+
+    @property
+    def episode_chief(self):
+        return self.episode_chief_barrier.value
+
+    @episode_chief.setter
+    def episode_chief(self, episode_chief):
+        self.episode_chief_barrier.set(episode_chief)
+
+    @property
+    def acked_episode(self):
+        return self.acked_episode_barrier.value
+
+    @acked_episode.setter
+    def acked_episode(self, episode):
+        self.acked_episode_barrier.set(episode)
+
+    def report_barrier_waiting(self, episode, elapsed_seconds):
+        log_msg = "Worker {0} - still waiting for the chief's ack of episode {1} ({2:.1f} seconds)".format(
+            self.worker_id,
+            episode,
+            elapsed_seconds
+        )
+        self.logger.warning(log_msg)
+        print(log_msg)
+
+    def update_process(self, avg_gradients, episode_chief):
+        # called on the MQTT thread while on_episode may be running (a round can close before this worker's episode ends),
+        # so the update is applied by start_train between episodes
+        self.pending_processes.append((self.apply_update, avg_gradients, episode_chief))
+
+    def apply_update(self, avg_gradients):
         self.rl_algorithm.model.set_gradients_to_current_parameters(avg_gradients)
         self.rl_algorithm.optimizer.step()
 
-    def transfer_process(self, parameters):
+    def apply_pending_processes(self):
+        while len(self.pending_processes) > 0:
+            process, argument, episode_chief = self.pending_processes.popleft()
+            process(argument)
+            self.applied_episode_chief = max(self.applied_episode_chief, episode_chief)
+
+    def transfer_process(self, msg_payload):
+        parameters = self.parameters_history.restore_from_transfer_msg(msg_payload)
+        if parameters is None:
+            # the next episode message reports version -1, so the chief sends the full parameters next time
+            self.logger.warning(
+                "Worker %s - skip transfer: base version %s is no longer kept, requesting the full parameters",
+                self.worker_id, msg_payload["parameters_base_version"]
+            )
+            return
+
+        self.pending_processes.append((self.apply_transfer, parameters, msg_payload["episode_chief"]))
+
+    def apply_transfer(self, parameters):
         self.rl_algorithm.transfer_process(parameters, SOFT_TRANSFER, SOFT_TRANSFER_TAU)
 
+    def add_to_episode_batch(self, episode_msg):
+        gradients = episode_msg.pop("gradients", None)
+        if gradients is not None:
+            if self.episode_batch_gradients is None:
+                self.episode_batch_gradients = gradients.clone()
+            else:
+                self.episode_batch_gradients += gradients
+
+        self.episode_batch.append(episode_msg)
+        if len(self.episode_batch) >= EPISODE_MESSAGE_BATCH_SIZE:
+            self.flush_episode_batch()
+
+    def flush_episode_batch(self):
+        """
+        모아둔 episodes를 하나의 Episode_Detail 메세지로 보냅니다. episode, loss, score는 마지막 episode의 값이고,
+        episodes, losses, scores에 모든 episodes의 값이, gradients에 그 합과 num_contributors가 담깁니다.
+        """
+        if len(self.episode_batch) == 0:
+            return
+
+        last_episode_msg = self.episode_batch[-1]
+        batched_msg = {
+            "worker_id": self.worker_id,
+            "episode": last_episode_msg["episode"],
+            "loss": last_episode_msg["loss"],
+            "score": last_episode_msg["score"],
+            "episodes": np.asarray([episode_msg["episode"] for episode_msg in self.episode_batch], dtype=np.int64),
+            "losses": np.asarray([episode_msg["loss"] for episode_msg in self.episode_batch], dtype=np.float64),
+            "scores": np.asarray([episode_msg["score"] for episode_msg in self.episode_batch], dtype=np.float64)
+        }
+
+        if "parameters_version" in last_episode_msg:
+            batched_msg["parameters_version"] = last_episode_msg["parameters_version"]
+
+        if self.episode_batch_gradients is not None:
+            batched_msg["gradients"] = self.episode_batch_gradients
+            batched_msg["num_contributors"] = len(self.episode_batch)
+
+        self.episode_batch = []
+        self.episode_batch_gradients = None
+
+        self.send_msg(MQTT_TOPIC_EPISODE_DETAIL, batched_msg)
+
     def send_msg(self, topic, msg):
-        log_msg = "[SEND] TOPIC: {0}, PAYLOAD: 'episode': {1}, 'worker_id': {2} 'loss': {3}, 'score': {4} ".format(
-            topic,
-            msg['episode'],
-            msg['worker_id'],
-            msg['loss'],
-            msg['score']
-        )
-        if MODE_PARAMETERS_TRANSFER and topic == MQTT_TOPIC_SUCCESS_DONE:
-            log_msg += "'parameters_length': {0}".format(len(msg['parameters']))
-        elif MODE_GRADIENTS_UPDATE and topic == MQTT_TOPIC_EPISODE_DETAIL:
-            log_msg += "'gradients_length': {0}".format(len(msg['gradients']))
-        elif topic == MQTT_TOPIC_FAIL_DONE:
-            pass
-        else:
-            pass
+        if self.logger.isEnabledFor(logging.INFO):
+            log_msg = "[SEND] TOPIC: %s, PAYLOAD: 'episode': %s, 'worker_id': %s 'loss': %s, 'score': %s "
+            log_args = [topic, msg['episode'], msg['worker_id'], msg['loss'], msg['score']]
+            if MODE_PARAMETERS_TRANSFER and topic == MQTT_TOPIC_SUCCESS_DONE:
+                log_msg += "'parameters_length': %s"
+                log_args.append(len(msg['parameters']))
+            elif MODE_GRADIENTS_UPDATE and topic == MQTT_TOPIC_EPISODE_DETAIL and 'gradients' in msg:
+                log_msg += "'gradients_length': %s"
+                log_args.append(len(msg['gradients']))
 
-        self.logger.info(log_msg)
+            self.logger.info(log_msg, *log_args)
+
+        if self.gradient_compressor is not None and msg.get("gradients") is not None:
+            msg["gradients"] = self.gradient_compressor.compress(msg["gradients"])
+
+        msg = encode_msg(topic, msg)
 
-        msg = pickle.dumps(msg, protocol=-1)
-        msg = zlib.compress(msg)
+        if WORKERS_PER_AGGREGATOR > 0 and topic == MQTT_TOPIC_EPISODE_DETAIL:
+            topic = get_aggregator_topic(get_aggregator_id(self.worker_id))
 
         self.worker_mqtt_client.publish(topic=topic, payload=msg, qos=0, retain=False)
 
+    def get_training_state(self, episode):
+        training_state = self.rl_algorithm.get_training_state()
+        training_state.update({
+            "format": TRAINING_STATE_FORMAT,
+            "episode": episode,
+            "is_success_or_fail_done": self.is_success_or_fail_done,
+            "episode_chief": self.episode_chief,
+            "applied_episode_chief": self.applied_episode_chief,
+            "acked_episode": self.acked_episode,
+            "score_dequeue": self.score_dequeue,
+            "loss_dequeue": self.loss_dequeue,
+            "local_score_ema": self.local_score_ema,
+            "local_loss_ema": self.local_loss_ema,
+            "parameters_history": self.parameters_history,
+            "rng_states": get_rng_states()
+        })
+        return training_state
+
+    def resume(self, resume_episode):
+        """
+        학습 상태를 불러옵니다. is_lockstep_resume()이면 main.py가 정한 resume_episode의 상태를, 그 외에는 자신의 최신 상태를 불러옵니다.
+        이미 SUCCESS/FAIL로 끝난 worker는 마지막 상태를 불러오며 더 학습하지 않습니다.
+
+        Args:
+            resume_episode(int): lockstep일 때 모든 workers가 함께 이어서 학습할 마지막 완료 episode입니다.
+        """
+        filename, training_state = load_checkpoint(self.worker_id, map_location=device)
+        if is_lockstep_resume() and is_training_state(training_state) and not training_state["is_success_or_fail_done"]:
+            filename, training_state = load_checkpoint(self.worker_id, max_episode=resume_episode, map_location=device)
+
+        if not is_training_state(training_state):
+            log_msg = "Worker {0} - No training state at or before episode {1}: start over".format(self.worker_id, resume_episode)
+            self.logger.warning(log_msg)
+            print(log_msg)
+            return
+
+        self.rl_algorithm.set_training_state(training_state)
+        self.is_success_or_fail_done = training_state["is_success_or_fail_done"]
+        self.episode_chief = training_state["episode_chief"]
+        self.applied_episode_chief = training_state.get("applied_episode_chief", training_state["episode_chief"])
+        self.acked_episode = training_state["acked_episode"]
+        self.score_dequeue = training_state["score_dequeue"]
+        self.loss_dequeue = training_state["loss_dequeue"]
+        self.local_score_ema = training_state["local_score_ema"]
+        self.local_loss_ema = training_state["local_loss_ema"]
+        self.parameters_history = training_state["parameters_history"]
+        set_rng_states(training_state["rng_states"])
+
+        self.start_episode = training_state["episode"] + 1
+
+        log_msg = "Worker {0} - Resumed from {1} (episode {2})".format(self.worker_id, filename, training_state["episode"])
+        self.logger.info(log_msg)
+        print(log_msg)
+
     def start_train(self):
-        for episode in range(MAX_EPISODES):
+        if self.is_success_or_fail_done:
+            return
+
+        for episode in range(self.start_episode, MAX_EPISODES):
+            self.apply_pending_processes()
             gradients, loss, score = self.rl_algorithm.on_episode(episode)
-            self.local_losses.append(loss)
-            self.local_scores.append(score)
+            self.local_loss_ema.append(loss)
+            self.local_score_ema.append(score)
 
             self.loss_dequeue.append(loss)
             self.score_dequeue.append(score)
@@ -87,24 +263,12 @@ class Worker:
                 "score": score
             }
 
-            if MODEL_SAVE:
-                files = glob.glob(os.path.join(PROJECT_HOME, "model_save_files", "{0}_*".format(self.worker_id)))
-                for f in files:
-                    os.remove(f)
-
-                torch.save(
-                    self.rl_algorithm.model.state_dict(),
-                    os.path.join(
-                        PROJECT_HOME, "model_save_files",
-                        "{0}_{1}_{2}_{3}.{4}.pt".format(
-                            self.worker_id,
-                            ENVIRONMENT_ID.name,
-                            DEEP_LEARNING_MODEL.value,
-                            RL_ALGORITHM.value,
-                            episode
-                        )
-                    )
-                )
+            if MODE_PARAMETERS_TRANSFER:
+                episode_msg["parameters_version"] = self.parameters_history.latest_version
+
+            if MODE_BOUNDED_STALENESS:
+                # the base of the gradients is the last update applied, not the last ack received
+                episode_msg["episode_chief"] = self.applied_episode_chief
 
             if mean_score_over_recent_100_episodes >= env.WIN_AND_LEARN_FINISH_SCORE and episode > env.WIN_AND_LEARN_FINISH_CONTINUOUS_EPISODES:
                 log_msg = "******* Worker {0} - Solved in episode {1}: Mean score = {2}".format(
@@ -119,6 +283,7 @@ class Worker:
                     parameters = self.rl_algorithm.get_parameters()
                     episode_msg["parameters"] = parameters
 
+                self.flush_episode_batch()
                 self.send_msg(MQTT_TOPIC_SUCCESS_DONE, episode_msg)
                 self.is_success_or_fail_done = True
                 break
@@ -132,45 +297,73 @@ class Worker:
                 self.logger.info(log_msg)
                 print(log_msg)
 
-                if MODE_GRADIENTS_UPDATE:
+                if MODE_GRADIENTS_UPDATE and not MODE_RING_ALLREDUCE:
                     episode_msg["gradients"] = gradients
 
+                self.flush_episode_batch()
                 self.send_msg(MQTT_TOPIC_FAIL_DONE, episode_msg)
                 self.is_success_or_fail_done = True
                 break
 
             else:
-                ema_loss = exp_moving_average(self.local_losses, EMA_WINDOW)[-1]
-                ema_score = exp_moving_average(self.local_scores, EMA_WINDOW)[-1]
-
-                log_msg = "Worker {0}-Ep.{1:>2d}: Loss={2:6.4f} (EMA: {3:6.4f}, Mean: {4:6.4f})".format(
-                    self.worker_id,
-                    episode,
-                    loss,
-                    ema_loss,
-                    mean_loss_over_recent_100_episodes
-                )
-
-                log_msg += ", Score={0:6.4f} (EMA: {1:>6.4f}, Mean: {2:>6.4f})".format(
-                    score,
-                    ema_score,
-                    mean_score_over_recent_100_episodes
-                )
+                ema_loss = self.local_loss_ema.value
+                ema_score = self.local_score_ema.value
+
+                # the per-episode line is only built when it is printed or logged
+                if VERBOSE or self.logger.isEnabledFor(logging.INFO):
+                    log_msg = "Worker {0}-Ep.{1:>2d}: Loss={2:6.4f} (EMA: {3:6.4f}, Mean: {4:6.4f})".format(
+                        self.worker_id,
+                        episode,
+                        loss,
+                        ema_loss,
+                        mean_loss_over_recent_100_episodes
+                    )
 
-                if EPSILON_GREEDY_ACT:
-                    log_msg += ", Epsilon: {0:5.2f}".format(
-                        self.rl_algorithm.epsilon
+                    log_msg += ", Score={0:6.4f} (EMA: {1:>6.4f}, Mean: {2:>6.4f})".format(
+                        score,
+                        ema_score,
+                        mean_score_over_recent_100_episodes
                     )
 
-                self.logger.info(log_msg)
-                if VERBOSE: print(log_msg)
+                    if EPSILON_GREEDY_ACT:
+                        log_msg += ", Epsilon: {0:5.2f}".format(
+                            self.rl_algorithm.epsilon
+                        )
+
+                    self.logger.info(log_msg)
+                    if VERBOSE: print(log_msg)
 
-                if MODE_GRADIENTS_UPDATE:
+                if MODE_GRADIENTS_UPDATE and not MODE_RING_ALLREDUCE:
                     episode_msg["gradients"] = gradients
 
-                self.send_msg(MQTT_TOPIC_EPISODE_DETAIL, episode_msg)
+                if self.is_batching_episodes:
+                    self.add_to_episode_batch(episode_msg)
+                else:
+                    self.send_msg(MQTT_TOPIC_EPISODE_DETAIL, episode_msg)
+
+            if MODE_SYNCHRONIZATION and MODE_BOUNDED_STALENESS:
+                self.acked_episode_barrier.wait_until_with_report(
+                    episode - STALENESS_BOUND, SYNC_BARRIER_REPORT_INTERVAL, self.report_barrier_waiting
+                )
+            elif MODE_SYNCHRONIZATION:
+                self.episode_chief_barrier.wait_until_with_report(
+                    episode, SYNC_BARRIER_REPORT_INTERVAL, self.report_barrier_waiting
+                )
+
+                if MODE_RING_ALLREDUCE and MODE_GRADIENTS_UPDATE:
+                    avg_gradients = self.ring_allreduce.all_reduce(episode, gradients)
+                    if avg_gradients is not None:
+                        self.apply_update(avg_gradients)
+
+            # the updates released by the synchronization are applied before the state is saved
+            self.apply_pending_processes()
+
+            # saved after the episode's synchronization so that a resumed worker continues with the next episode
+            if self.checkpoint_manager is not None:
+                self.checkpoint_manager.save(episode, lambda: self.get_training_state(episode))
 
-            while True:
-                if episode == self.episode_chief:
-                    break
-                time.sleep(0.01)
+        if self.checkpoint_manager is not None:
+            if self.is_success_or_fail_done:
+                # the final state is saved regardless of the checkpoint cadence
+                self.checkpoint_manager.save(episode, lambda: self.get_training_state(episode), force=True)
+            self.checkpoint_manager.close()
@@ -1,8 +1,6 @@
 # -*- coding:utf-8 -*-
-import pickle
+import logging
 import time
-import zlib
-import paho.mqtt.client as mqtt
 
 import sys, os
 
@@ -17,8 +15,13 @@ import sys
 from rl_main.logger import get_logger
 
 from rl_main.chief_workers.worker import Worker
+from rl_main.chief_workers.codec import decode_msg
+from rl_main.chief_workers.ring_allreduce import get_ring_topic
+import rl_main.rl_utils as rl_utils
 
 worker_id = int(sys.argv[1])
+# given by main.py when RESUME
+resume_episode = int(sys.argv[2]) if len(sys.argv) > 2 else None
 logger = get_logger("worker_{0}".format(worker_id))
 
 
@@ -32,54 +35,69 @@ def on_worker_connect(client, userdata, flags, rc):
         logger.info(msg)
         client.subscribe(MQTT_TOPIC_TRANSFER_ACK)
         client.subscribe(MQTT_TOPIC_UPDATE_ACK)
+        if MODE_RING_ALLREDUCE:
+            client.subscribe(get_ring_topic(worker_id))
         print(msg)
 
 
 def on_worker_message(client, userdata, msg):
-    msg_payload = zlib.decompress(msg.payload)
-    msg_payload = pickle.loads(msg_payload)
+    msg_payload = decode_msg(msg.payload)
 
     if msg.topic == MQTT_TOPIC_UPDATE_ACK:
-        log_msg = "[RECV] TOPIC: {0}, PAYLOAD: 'episode_chief': {1}".format(
-            msg.topic,
-            msg_payload['episode_chief']
-        )
-
-        if MODE_GRADIENTS_UPDATE:
-            log_msg += ", avg_grad_length: {0} \n".format(
-                len(msg_payload['avg_gradients'])
-            )
-        else:
-            log_msg += "\n"
-
-        logger.info(log_msg)
-
-        if not worker.is_success_or_fail_done and MODE_GRADIENTS_UPDATE:
-            worker.update_process(msg_payload['avg_gradients'])
+        if logger.isEnabledFor(logging.INFO):
+            log_msg = "[RECV] TOPIC: %s, PAYLOAD: 'episode_chief': %s"
+            log_args = [msg.topic, msg_payload['episode_chief']]
+
+            if MODE_GRADIENTS_UPDATE and MODE_RING_ALLREDUCE:
+                log_msg += ", ring_members: %s \n"
+                log_args.append(msg_payload['ring_members'].tolist())
+            elif MODE_GRADIENTS_UPDATE:
+                log_msg += ", avg_grad_length: %s \n"
+                log_args.append(len(msg_payload['avg_gradients']))
+            else:
+                log_msg += "\n"
+
+            logger.info(log_msg, *log_args)
+
+        if not worker.is_success_or_fail_done and MODE_GRADIENTS_UPDATE and MODE_RING_ALLREDUCE:
+            # must be known before the barrier below releases the training thread
+            worker.ring_allreduce.set_ring_members(msg_payload["episode_chief"], msg_payload["ring_members"])
+        elif not worker.is_success_or_fail_done and MODE_GRADIENTS_UPDATE:
+            worker.update_process(msg_payload['avg_gradients'], msg_payload['episode_chief'])
 
         worker.episode_chief = msg_payload["episode_chief"]
-        print("Update_Ack: " + worker.episode_chief)
+        if MODE_BOUNDED_STALENESS and msg_payload.get("worker_id") == worker_id:
+            worker.acked_episode = msg_payload["episode"]
+        print("Update_Ack: {0}".format(worker.episode_chief))
         
     elif msg.topic == MQTT_TOPIC_TRANSFER_ACK:
-        log_msg = "[RECV] TOPIC: {0}, PAYLOAD: 'episode_chief': {1}".format(
-            msg.topic,
-            msg_payload['episode_chief']
-        )
-
-        if MODE_PARAMETERS_TRANSFER:
-            log_msg += ", parameters_length: {0} \n".format(
-                len(msg_payload['parameters'])
-            )
-        else:
-            log_msg += "\n"
-
-        logger.info(log_msg)
+        if logger.isEnabledFor(logging.INFO):
+            log_msg = "[RECV] TOPIC: %s, PAYLOAD: 'episode_chief': %s"
+            log_args = [msg.topic, msg_payload['episode_chief']]
+
+            if MODE_PARAMETERS_TRANSFER and 'parameters_delta' in msg_payload:
+                log_msg += ", parameters_version: %s, parameters_base_version: %s, parameters_delta_length: %s \n"
+                log_args += [
+                    msg_payload['parameters_version'],
+                    msg_payload['parameters_base_version'],
+                    len(msg_payload['parameters_delta'])
+                ]
+            elif MODE_PARAMETERS_TRANSFER:
+                log_msg += ", parameters_version: %s, parameters_length: %s \n"
+                log_args += [msg_payload['parameters_version'], len(msg_payload['parameters'])]
+            else:
+                log_msg += "\n"
+
+            logger.info(log_msg, *log_args)
 
         if not worker.is_success_or_fail_done and MODE_PARAMETERS_TRANSFER:
-            worker.transfer_process(msg_payload['parameters'])
+            worker.transfer_process(msg_payload)
 
         worker.episode_chief = msg_payload["episode_chief"]
-        print("Transfer_Ack: " + worker.episode_chief)
+        print("Transfer_Ack: {0}".format(worker.episode_chief))
+
+    elif MODE_RING_ALLREDUCE and msg.topic == get_ring_topic(worker_id):
+        worker.ring_allreduce.receive_chunk(msg_payload)
 
     else:
         print("pass")
@@ -87,7 +105,7 @@ def on_worker_message(client, userdata, msg):
 
 
 if __name__ == "__main__":
-    worker_mqtt_client = mqtt.Client("rl_worker_{0}".format(worker_id))
+    worker_mqtt_client = rl_utils.get_transport_client("rl_worker_{0}".format(worker_id))
     worker_mqtt_client.on_connect = on_worker_connect
     worker_mqtt_client.on_message = on_worker_message
     if MQTT_LOG:
@@ -99,11 +117,13 @@ if __name__ == "__main__":
     stderr = sys.stderr
     sys.stderr = sys.stdout
     try:
-        worker = Worker(logger, worker_id, worker_mqtt_client)
+        worker = Worker(logger, worker_id, worker_mqtt_client, resume_episode)
         worker.start_train()
 
         time.sleep(1)
         worker_mqtt_client.loop_stop()
+        # releases this client's reader slots in the local transport rings
+        worker_mqtt_client.disconnect()
     except KeyboardInterrupt as error:
         print("=== {0:>8} is aborted by keyboard interrupt".format('Worker {0}'.format(worker_id)))
     finally:
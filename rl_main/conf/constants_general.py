@@ -1,6 +1,6 @@
 import torch
 
-from rl_main.conf.names import OptimizerName
+from rl_main.conf.names import OptimizerName, MessageCodecName, CompressionName, GradientsCompressionName, TransportName
 
 device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
@@ -11,6 +11,17 @@ PYTHON_PATH = None
 EMA_WINDOW = 10
 VERBOSE = True
 MODEL_SAVE = False
+MODEL_SAVE_INTERVAL_EPISODES = 1  # a worker checkpoints its model every this many episodes (None: only by MODEL_SAVE_INTERVAL_SECONDS)
+MODEL_SAVE_INTERVAL_SECONDS = None  # ...or when this many seconds passed since its last checkpoint (lockstep MODE_SYNCHRONIZATION saves by episode only)
+MODEL_SAVE_CHIEF_INTERVAL_SECONDS = 60.0  # outside lockstep MODE_SYNCHRONIZATION the chief checkpoints at most this often (not per message)
+MODEL_SAVE_KEEP_LAST = 2  # checkpoints kept per worker and for the chief in model_save_files (0: keep all); RESUME rewinds to the oldest worker's latest one in lockstep MODE_SYNCHRONIZATION, otherwise each continues from its own latest
+RESUME = False  # continue from the training states in model_save_files (written with MODEL_SAVE) instead of starting over
+GRAPH_SAVE_INTERVAL = 10.0  # seconds; the chief redraws graphs/loss_score.png at most this often, on a background thread
+RESULTS_FLUSH_ROWS = 1000  # rows the chief buffers before writing save_results/outputs.csv
+RESULTS_FLUSH_INTERVAL = 10.0  # seconds after which buffered result rows are written with the next row
+RESULTS_NPY_LOG = False  # also append the result rows to save_results/outputs.npy (structured numpy array)
+LOG_LEVEL = "INFO"  # level of the logs/*.log loggers; records below it are never formatted
+LOG_QUEUE = True  # format and write log records on a background thread instead of the calling (e.g. MQTT callback) thread
 
 # [MQTT]
 MQTT_SERVER = None
@@ -21,7 +32,21 @@ MQTT_TOPIC_FAIL_DONE = "Fail_Done"
 MQTT_TOPIC_TRANSFER_ACK = "Transfer_Ack"
 MQTT_TOPIC_UPDATE_ACK = "Update_Ack"
 MQTT_TOPIC_ACK = "Ack"
+MQTT_TOPIC_RING_ALLREDUCE = "Ring_AllReduce"  # per-worker topics "Ring_AllReduce/<worker_id>"
+MQTT_TOPIC_AGGREGATED_EPISODE_DETAIL = "Aggregated_Episode_Detail"  # aggregators -> chief; workers -> aggregator use "Episode_Detail/<aggregator_id>"
 MQTT_LOG = False
+MQTT_MESSAGE_CODEC = MessageCodecName.BINARY
+MQTT_ACCEPT_PICKLE_MESSAGES = True  # False rejects pickle payloads, which can execute code when loaded
+MQTT_COMPRESSION = CompressionName.FAST  # NONE, FAST (zlib level 1), DENSE (zlib level MQTT_COMPRESSION_DENSE_LEVEL)
+MQTT_COMPRESSION_THRESHOLD = 4096  # bytes; smaller payload bodies are never compressed
+MQTT_COMPRESSION_DENSE_LEVEL = 9
+
+# [TRANSPORT]
+TRANSPORT = TransportName.MQTT  # MQTT (broker) or LOCAL (shared memory rings, chief and workers on one host)
+LOCAL_TRANSPORT_NAMESPACE = "rl"  # prefix of the shared memory segments; runs on the same host need different namespaces
+LOCAL_TRANSPORT_RING_SIZE = 16 * 1024 * 1024  # bytes per topic ring; a publisher waits while the slowest subscriber is a full ring behind
+LOCAL_TRANSPORT_PUBLISH_TIMEOUT = 60.0  # seconds a publisher waits for ring space before raising an error
+LOCAL_TRANSPORT_POLL_INTERVAL = 0.5  # seconds a subscriber waits for a notification before checking its rings anyway
 
 # MQTT for RIP
 MQTT_SERVER_FOR_RIP = "192.168.0.10"
@@ -33,10 +58,16 @@ MQTT_SUB_RESET_COMPLETE = 'reset_complete_2'
 
 # [WORKER]
 NUM_WORKERS = 1
+SYNC_BARRIER_REPORT_INTERVAL = 60.0  # seconds a worker waits for the chief's ack before logging that it is still waiting
+WORKERS_PER_AGGREGATOR = 0  # workers whose gradients a host-local aggregator sums before the chief (0: workers send to the chief)
+EPISODE_MESSAGE_BATCH_SIZE = 1  # asynchronous mode without aggregators: episodes a worker coalesces into one Episode_Detail message
 
 # [TRANSFER]
 SOFT_TRANSFER = False
 SOFT_TRANSFER_TAU = 0.3
+PARAMETERS_TRANSFER_DELTA = False  # Send parameters as a delta against the version acknowledged by the workers
+PARAMETERS_TRANSFER_DELTA_FP16 = False
+PARAMETERS_TRANSFER_HISTORY = 4  # Number of broadcast versions kept on the chief and workers as delta bases
 
 # [TARGET_UPDATE]
 SOFT_TARGET_UPDATE = False
@@ -52,6 +83,9 @@ HIDDEN_3_SIZE = 128
 CNN_CRITIC_HIDDEN_1_SIZE = 128
 CNN_CRITIC_HIDDEN_2_SIZE = 128
 
+# [ACTOR_CRITIC_MODEL]
+ACTOR_CRITIC_SHARED_TRUNK = False  # actor and critic share one feature trunk (MLP layers or conv stack) instead of two separate towers
+
 # [OPTIMIZATION]
 MAX_EPISODES = 2000
 GAMMA = 0.98 # discount factor
@@ -60,6 +94,16 @@ GAMMA = 0.98 # discount factor
 MODE_SYNCHRONIZATION = True
 MODE_GRADIENTS_UPDATE = True         # Distributed
 MODE_PARAMETERS_TRANSFER = True     # Transfer
+MODE_BOUNDED_STALENESS = False      # With MODE_SYNCHRONIZATION: apply each worker's gradients on arrival
+STALENESS_BOUND = 4                 # Episodes a worker may run ahead of its last acknowledged episode
+SYNC_ROUND_DEADLINE = None          # With MODE_SYNCHRONIZATION: seconds after a round's first message before it may close with a quorum (None: wait for all workers)
+SYNC_QUORUM_FRACTION = 0.5          # Fraction of the active workers needed to close a round after the deadline
+SYNC_FOLD_LATE_MESSAGES = True      # Fold gradients that miss their round into the next round instead of dropping them
+MODE_RING_ALLREDUCE = False         # With MODE_SYNCHRONIZATION and MODE_GRADIENTS_UPDATE: workers average gradients among themselves
+
+# [GRADIENTS_COMPRESSION]
+GRADIENTS_COMPRESSION = GradientsCompressionName.NONE  # Lossy worker -> chief gradients with error feedback
+GRADIENTS_TOP_K_RATIO = 0.01  # TOP_K: fraction of the flattened gradient entries sent per episode
 
 # [TRAINING]
 EPSILON_GREEDY_ACT = False
@@ -71,6 +115,9 @@ OPTIMIZER = OptimizerName.ADAM
 GAE_LAMBDA = 0.95
 LEARNING_RATE = 0.001
 
+# [VECTOR_ENVIRONMENT]
+NUM_ENVS_PER_WORKER = 1  # environment copies a PPO/DQN worker steps together, choosing their actions with one batched forward pass
+
 # [TRAJECTORY_SAMPLING]
 TRAJECTORY_SAMPLING = True
 TRAJECTORY_LIMIT_SIZE = 200
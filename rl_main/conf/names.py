@@ -54,3 +54,26 @@ class RLAlgorithmName(enum.Enum):
 class OptimizerName(enum.Enum):
     NESTEROV = "nesterov"
     ADAM = "Adam"
+
+
+class MessageCodecName(enum.Enum):
+    PICKLE = "pickle"
+    BINARY = "binary"
+
+
+class CompressionName(enum.Enum):
+    NONE = "none"
+    FAST = "fast"
+    DENSE = "dense"
+
+
+class GradientsCompressionName(enum.Enum):
+    NONE = "none"
+    FP16 = "fp16"
+    INT8 = "int8"
+    TOP_K = "top_k"
+
+
+class TransportName(enum.Enum):
+    MQTT = "mqtt"
+    LOCAL = "local"
@@ -1,3 +1,4 @@
+import threading
 import time
 import numpy as np
 
@@ -39,6 +40,7 @@ class EnvironmentRIP(Environment):
         self.is_motor_limit = False
         self.is_limit_complete = False
         self.is_reset_complete = False
+        self.response_event = threading.Event()
 
         self.mqtt_client = mqtt_client
         super(EnvironmentRIP, self).__init__()
@@ -53,20 +55,20 @@ class EnvironmentRIP(Environment):
 
     def __pub(self, topic, payload, require_response=True):
         global PUB_ID
+        self.response_event.clear()
         self.mqtt_client.publish(topic=topic, payload=payload)
         PUB_ID += 1
 
         if require_response:
-            is_sub = False
-            while not is_sub:
-                if self.is_state_changed or self.is_limit_complete or self.is_reset_complete:
-                    is_sub = True
-                time.sleep(0.0001)
+            self.response_event.wait()
 
         self.is_state_changed = False
         self.is_limit_complete = False
         self.is_reset_complete = False
 
+    def notify_response(self):
+        self.response_event.set()
+
     def set_state(self, motor_radian, motor_velocity, pendulum_radian, pendulum_velocity):
         self.is_state_changed = True
         self.state = [pendulum_radian, pendulum_velocity, motor_radian, motor_velocity]
@@ -75,6 +77,7 @@ class EnvironmentRIP(Environment):
         self.current_pendulum_radian = pendulum_radian
         self.current_pendulum_velocity = pendulum_velocity
         self.current_motor_velocity = motor_velocity
+        self.notify_response()
 
     def __pendulum_reset(self):
         self.__pub(
@@ -124,14 +127,7 @@ class EnvironmentRIP(Environment):
         self.is_motor_limit = False
 
         wait_time = 1 if self.episode == 0 else 15  # if self.episode % 10 == 0 else 3
-        previousTime = time.perf_counter()
-        time_done = False
-
-        while not time_done:
-            currentTime = time.perf_counter()
-            if currentTime - previousTime >= wait_time:
-                time_done = True
-            time.sleep(0.0001)
+        time.sleep(wait_time)
 
         self.__pendulum_reset()
         self.wait()
@@ -158,10 +154,9 @@ class EnvironmentRIP(Environment):
         done, info = self.__isDone()
 
         if not done:
-            while True:
-                current_time = time.perf_counter()
-                if current_time - self.previous_time >= 6 / 1000:
-                    break
+            remaining_time = 6 / 1000 - (time.perf_counter() - self.previous_time)
+            if remaining_time > 0:
+                time.sleep(remaining_time)
         else:
             self.wait()
 
@@ -0,0 +1,116 @@
+import numpy as np
+
+
+class VectorEnvironment:
+    """
+    같은 Environment의 N개 복사본을 함께 진행시켜, 한 step마다 N개의 state에 대한 action을 한 번의 batch forward로 구할 수 있도록 합니다.
+    states는 active envs의 state들을 env 순서대로 쌓은 numpy.ndarray입니다.
+    episode가 끝난 env는 step(..., auto_reset=True)이면 바로 reset되어 다음 episode를 시작하고,
+    auto_reset=False이면 reset_finished_envs() 혹은 reset()이 호출될 때까지 inactive가 되어 더 이상 진행하지 않습니다.
+    """
+    def __init__(self, envs):
+        """
+        Args:
+            envs(list): rl_main.environments.Environment 객체들입니다. 첫 env의 속성들을 대표로 사용합니다.
+        """
+        self.envs = envs
+        self.num_envs = len(envs)
+
+        self.n_states = envs[0].n_states
+        self.n_actions = envs[0].n_actions
+        self.state_shape = envs[0].state_shape
+        self.action_shape = envs[0].action_shape
+        self.action_space = envs[0].action_space
+        self.continuous = envs[0].continuous
+
+        self.env_states = [None] * self.num_envs
+        self.active_env_indices = []
+        self.finished_env_indices = []
+
+    @property
+    def action_meanings(self):
+        return self.envs[0].action_meanings
+
+    @property
+    def num_active_envs(self):
+        return len(self.active_env_indices)
+
+    @property
+    def states(self):
+        return np.stack([self.env_states[env_idx] for env_idx in self.active_env_indices])
+
+    def reset(self):
+        """
+        모든 envs를 reset하고 active로 만듭니다.
+
+        Returns:
+             [num_envs, ...] shape의 states를 반환합니다.
+        """
+        for env_idx, env in enumerate(self.envs):
+            self.env_states[env_idx] = env.reset()
+        self.active_env_indices = list(range(self.num_envs))
+        self.finished_env_indices = []
+        return self.states
+
+    def reset_finished_envs(self):
+        """
+        auto_reset=False인 step()에서 episode가 끝난 envs를 reset하여 다시 active로 만듭니다.
+
+        Returns:
+             reset한 envs의 수를 반환합니다.
+        """
+        num_resets = len(self.finished_env_indices)
+        for env_idx in self.finished_env_indices:
+            self.env_states[env_idx] = self.envs[env_idx].reset()
+        self.active_env_indices = sorted(self.active_env_indices + self.finished_env_indices)
+        self.finished_env_indices = []
+        return num_resets
+
+    def step(self, actions, auto_reset=True):
+        """
+        active envs를 한 step씩 진행합니다. i번째 active env에는 actions[i:i+1]을 넘기므로, 각 env는 단일 env일 때와 같은 shape의 action을 받습니다.
+
+        Args:
+            actions(torch.Tensor): [num_active_envs, ...] shape의 actions입니다.
+            auto_reset(bool): True이면 episode가 끝난 env를 바로 reset하고, False이면 finished_env_indices에 남기고 inactive로 만듭니다.
+
+        Returns:
+             (env_indices, next_states, rewards, adjusted_rewards, dones, infos, num_resets)를 반환합니다.
+             env_indices는 진행한 envs의 index이고, next_states는 reset 이전의 다음 state들입니다.
+             num_resets는 auto_reset으로 새로 시작한 episode의 수입니다.
+        """
+        env_indices = self.active_env_indices
+        next_states, rewards, adjusted_rewards, dones, infos = [], [], [], [], []
+        next_active_env_indices = []
+        num_resets = 0
+
+        for i, env_idx in enumerate(env_indices):
+            next_state, reward, adjusted_reward, done, info = self.envs[env_idx].step(actions[i:i + 1])
+
+            next_states.append(next_state)
+            rewards.append(reward)
+            adjusted_rewards.append(adjusted_reward)
+            dones.append(done)
+            infos.append(info)
+
+            if not done:
+                self.env_states[env_idx] = next_state
+                next_active_env_indices.append(env_idx)
+            elif auto_reset:
+                self.env_states[env_idx] = self.envs[env_idx].reset()
+                next_active_env_indices.append(env_idx)
+                num_resets += 1
+            else:
+                self.finished_env_indices.append(env_idx)
+
+        self.active_env_indices = next_active_env_indices
+
+        return env_indices, np.stack(next_states), np.asarray(rewards, dtype=np.float64), \
+            np.asarray(adjusted_rewards, dtype=np.float64), np.asarray(dones, dtype=np.bool_), infos, num_resets
+
+    def render(self):
+        self.envs[0].render()
+
+    def close(self):
+        for env in self.envs:
+            env.close()
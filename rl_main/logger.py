@@ -1,11 +1,36 @@
-import logging, os, sys
-from logging.handlers import RotatingFileHandler
+import atexit
+import logging, os, queue, sys
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 
 from rl_main.utils import PROJECT_HOME
+from rl_main.main_constants import LOG_LEVEL, LOG_QUEUE
+
+queue_listeners = {}
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler.prepare()는 queue에 넣기 전에 호출한 thread에서 메세지를 format합니다.
+    같은 process의 QueueListener로만 전달하므로 record를 그대로 넣어, %-style 인자의 format도 listener thread에서 수행되도록 합니다.
+    따라서 log 호출에 넘기는 인자는 이후에 변경되지 않는 값이어야 합니다.
+    """
+    def prepare(self, record):
+        return record
+
+
+def stop_queue_listeners():
+    for queue_listener in queue_listeners.values():
+        queue_listener.stop()
+    queue_listeners.clear()
+
+
+atexit.register(stop_queue_listeners)
 
 
 def get_logger(name):
     """
+    LOG_QUEUE이면 log record를 queue에 넣기만 하고, format과 파일 기록은 logger별 QueueListener thread가 수행합니다.
+
     Args:
         name(str):생성할 log 파일명입니다.
 
@@ -14,7 +39,10 @@ def get_logger(name):
     """
     logger = logging.getLogger(name)
     logger.propagate = False
-    logger.setLevel(logging.INFO)
+    logger.setLevel(LOG_LEVEL)
+
+    if len(logger.handlers) > 0:
+        return logger
 
     if not os.path.exists(os.path.join(PROJECT_HOME, "logs")):
         os.makedirs(os.path.join(PROJECT_HOME, "logs"))
@@ -30,5 +58,12 @@ def get_logger(name):
         datefmt="%Y-%m-%d %H:%M:%S"
     )
     rotate_handler.setFormatter(formatter)
-    logger.addHandler(rotate_handler)
-    return logger
\ No newline at end of file
+
+    if LOG_QUEUE:
+        log_queue = queue.Queue(-1)
+        logger.addHandler(DeferredQueueHandler(log_queue))
+        queue_listeners[name] = QueueListener(log_queue, rotate_handler)
+        queue_listeners[name].start()
+    else:
+        logger.addHandler(rotate_handler)
+    return logger
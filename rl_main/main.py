@@ -9,12 +9,17 @@ sys.path.append(PROJECT_HOME)
 
 from rl_main.main_constants import *
 from rl_main import rl_utils
+from rl_main.chief_workers.local_transport import unlink_local_transport
+from rl_main.chief_workers.aggregator import get_num_aggregators
+from rl_main.models.checkpoint import get_resume_episode
 import rl_main.utils as utils
 
 
 os.environ["CUDA_VISIBLE_DEVICES"] = CUDA_VISIBLE_DEVICES_NUMBER_LIST
 
 if __name__ == "__main__":
+    utils.check_configuration()
+
     torch.manual_seed(SEED)
 
     if torch.cuda.is_available():
@@ -23,28 +28,58 @@ if __name__ == "__main__":
         torch.backends.cudnn.deterministic = True
 
     utils.make_output_folders()
-    utils.ask_file_removal()
+
+    resume_episode = None
+    if RESUME:
+        # logs, graphs and results of the interrupted run are kept and appended to
+        resume_episode = get_resume_episode()
+        if resume_episode is None:
+            print("*** Nothing to resume: training starts over")
+        else:
+            print("*** Resume after episode {0}".format(resume_episode))
+
+    if resume_episode is None:
+        utils.ask_file_removal()
 
     env = rl_utils.get_environment()
     rl_model = rl_utils.get_rl_model(env, -1)
 
     utils.print_configuration(env, rl_model)
 
+    if TRANSPORT == TransportName.LOCAL:
+        # rings left over from an interrupted run would otherwise be reused
+        unlink_local_transport()
+
     try:
-        chief = Process(target=utils.run_chief, args=())
+        chief = Process(target=utils.run_chief, args=(resume_episode,))
         chief.start()
 
         time.sleep(1.5)
 
+        aggregators = []
+        if WORKERS_PER_AGGREGATOR > 0:
+            for aggregator_id in range(get_num_aggregators()):
+                aggregator = Process(target=utils.run_aggregator, args=(aggregator_id,))
+                aggregators.append(aggregator)
+                aggregator.start()
+
+            time.sleep(1.5)
+
         workers = []
         for worker_id in range(NUM_WORKERS):
-            worker = Process(target=utils.run_worker, args=(worker_id,))
+            worker = Process(target=utils.run_worker, args=(worker_id, resume_episode))
             workers.append(worker)
             worker.start()
 
         for worker in workers:
             worker.join()
 
+        for aggregator in aggregators:
+            aggregator.join()
+
         chief.join()
     except KeyboardInterrupt as error:
         print("=== {0:>8} is aborted by keyboard interrupt".format('Main'))
+    finally:
+        if TRANSPORT == TransportName.LOCAL:
+            unlink_local_transport()
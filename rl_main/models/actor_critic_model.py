@@ -1,24 +1,28 @@
 # https://github.com/ikostrikov/pytorch-a2c-ppo-acktr-gail
-import glob
 
 import numpy as np
 import torch
 import torch.nn as nn
 
 from rl_main.main_constants import *
+from rl_main.models.checkpoint import load_checkpoint, get_model_state_dict
 from rl_main.models.distributions import DistCategorical, DistDiagGaussian
+from rl_main.models.gradient_compression import is_compressed_gradients, accumulate_compressed_gradients
 from torchsummary import summary
 
 import torch.nn.functional as F
 # from torch.distributions import Categorical
 from random import random, randint
 import math
+from collections import namedtuple
 from rl_main.utils import AddBiases, util_init, print_torch
 
 EPS_START = 0.9     # e-greedy threshold start value
 EPS_END = 0.05      # e-greedy threshold end value
 EPS_DECAY = 200     # e-greedy threshold decay
 
+FlatLayoutEntry = namedtuple('FlatLayoutEntry', ('layer_name', 'param_name', 'shape', 'offset', 'numel'))
+
 
 class Flatten(nn.Module):
     def forward(self, x):
@@ -40,12 +44,14 @@ class ActorCriticModel(nn.Module):
                 input_channels=self.input_channels,
                 input_height=self.input_height,
                 input_width=self.input_width,
-                continuous=continuous
+                continuous=continuous,
+                shared_trunk=ACTOR_CRITIC_SHARED_TRUNK
             )
         elif DEEP_LEARNING_MODEL == DeepLearningModelName.ActorCriticMLP:
             self.base = MLPBase(
                 num_inputs=s_size,
-                continuous=continuous
+                continuous=continuous,
+                shared_trunk=ACTOR_CRITIC_SHARED_TRUNK
             )
 
             self.s_size = s_size
@@ -64,7 +70,6 @@ class ActorCriticModel(nn.Module):
         else:
             self.dist = DistCategorical(self.base.output_size, self.a_size)
 
-        self.avg_gradients = {}
         self.weighted_scores = [0, 0, 0, 0]
         self.ema_scores = [0, 0, 0, 0]
         self.id_list = []
@@ -73,22 +78,19 @@ class ActorCriticModel(nn.Module):
         self.sum = 0
         self.device = device
 
+        self.build_flat_layout()
+        self.flat_gradients_buffer = torch.zeros(self.flat_size).to(self.device)
+        self.avg_flat_gradients = torch.zeros(self.flat_size).to(self.device)
+        self.avg_gradients = self.unflatten(self.avg_flat_gradients)
+
         self.reset_average_gradients()
 
         self.steps_done = 0
 
-        files = glob.glob(os.path.join(PROJECT_HOME, "model_save_files", "{0}_{1}_{2}_*".format(
-            self.worker_id,
-            ENVIRONMENT_ID.name,
-            DEEP_LEARNING_MODEL.value,
-        )))
-
         if self.worker_id >= 0:
-            if len(files) > 1:
-                print("Worker ID - {0}: Problem occurs since there are two or more save files".format(self.worker_id))
-            elif len(files) == 1:
-                filename = files[0]
-                self.load_state_dict(torch.load(filename))
+            filename, checkpoint = load_checkpoint(self.worker_id, map_location=self.device)
+            if filename is not None:
+                self.load_state_dict(get_model_state_dict(checkpoint))
                 self.eval()
                 print("Worker ID - {0}: Successful Model Load From {1}".format(self.worker_id, filename))
             else:
@@ -98,9 +100,16 @@ class ActorCriticModel(nn.Module):
         raise NotImplementedError
 
     def act(self, inputs, deterministic=False):
+        action, action_log_probs, _ = self.act_with_critic_value(inputs, deterministic)
+        return action, action_log_probs
+
+    def act_with_critic_value(self, inputs, deterministic=False):
+        """
+        act()와 같지만, 같은 forward에서 계산된 critic value도 함께 반환합니다.
+        """
         if not (type(inputs) is torch.Tensor):
             inputs = torch.tensor([inputs], dtype=torch.float).to(self.device)
-        _, actor_features = self.base(inputs)
+        critic_value, actor_features = self.base(inputs)
 
         dist = self.dist(actor_features)
 
@@ -116,7 +125,7 @@ class ActorCriticModel(nn.Module):
 
         action_log_probs = dist.log_probs(action)
 
-        return action, action_log_probs
+        return action, action_log_probs, critic_value
 
     def get_critic_value(self, inputs):
         critic_value, _ = self.base(inputs)
@@ -136,98 +145,100 @@ class ActorCriticModel(nn.Module):
         dist = self.dist(actor_features)
         return critic_value, dist.probs
 
-    def reset_average_gradients(self):
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            self.avg_gradients[layer_name] = {}
-            for name, param in named_parameters:
-                self.avg_gradients[layer_name][name] = torch.zeros(size=param.size()).to(self.device)
+    def build_flat_layout(self):
+        # The layout is built once: every (layer_name, param_name) pair gets a fixed slice in one flat buffer,
+        # so gradients and parameters can be moved around as a single contiguous tensor.
+        self.flat_layout = []
+        self.flat_layout_parameters = []
+        offset = 0
+
+        named_layers = list(self.base.layers_info.items()) + [("actor_linear", self.dist)]
+        for layer_name, layer in named_layers:
+            for name, param in layer.named_parameters():
+                numel = param.numel()
+                self.flat_layout.append(FlatLayoutEntry(layer_name, name, tuple(param.size()), offset, numel))
+                self.flat_layout_parameters.append(param)
+                offset += numel
+
+        self.flat_size = offset
+        self.flat_segment_numels = torch.tensor([entry.numel for entry in self.flat_layout], dtype=torch.long)
+
+    def flatten(self, nested_tensors):
+        flat_tensor = torch.zeros(self.flat_size).to(self.device)
+        for entry in self.flat_layout:
+            flat_tensor[entry.offset:entry.offset + entry.numel] = nested_tensors[entry.layer_name][entry.param_name].view(-1)
+        return flat_tensor
+
+    def unflatten(self, flat_tensor):
+        nested_tensors = {}
+        for entry in self.flat_layout:
+            if entry.layer_name not in nested_tensors:
+                nested_tensors[entry.layer_name] = {}
+            nested_tensors[entry.layer_name][entry.param_name] = flat_tensor[entry.offset:entry.offset + entry.numel].view(entry.shape)
+        return nested_tensors
+
+    def get_flat_gradients(self):
+        flat_gradients = torch.zeros(self.flat_size).to(self.device)
+        for entry, param in zip(self.flat_layout, self.flat_layout_parameters):
+            if param.grad is not None:
+                flat_gradients[entry.offset:entry.offset + entry.numel] = param.grad.view(-1)
+        return flat_gradients
+
+    def get_flat_parameters(self):
+        return torch.cat([param.data.view(-1) for param in self.flat_layout_parameters])
 
-        named_parameters = self.dist.named_parameters()
-        self.avg_gradients["actor_linear"] = {}
-        for name, param in named_parameters:
-            self.avg_gradients["actor_linear"][name] = torch.zeros(size=param.size()).to(self.device)
+    def reset_average_gradients(self):
+        # avg_gradients only holds views into avg_flat_gradients, so both are reset by a single zero_()
+        self.avg_flat_gradients.zero_()
 
     def reset_weighted_gradients(self):
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            self.weighted_gradients[layer_name] = {}
-            for name, param in named_parameters:
-                self.weighted_gradients[layer_name][name] = torch.zeros(size=param.size()).to(self.device)
-
-        named_parameters = self.dist.named_parameters()
-        self.weighted_gradients["actor_linear"] = {}
-        for name, param in named_parameters:
-            self.weighted_gradients["actor_linear"][name] = torch.zeros(size=param.size()).to(self.device)
+        for entry in self.flat_layout:
+            if entry.layer_name not in self.weighted_gradients:
+                self.weighted_gradients[entry.layer_name] = {}
+            self.weighted_gradients[entry.layer_name][entry.param_name] = torch.zeros(size=entry.shape).to(self.device)
 
     def get_gradients_for_current_parameters(self):
         gradients = {}
-
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            gradients[layer_name] = {}
-            for name, param in named_parameters:
-                gradients[layer_name][name] = param.grad
-
-        named_parameters = self.dist.named_parameters()
-        gradients["actor_linear"] = {}
-        for name, param in named_parameters:
-            gradients["actor_linear"][name] = param.grad
-
+        for entry, param in zip(self.flat_layout, self.flat_layout_parameters):
+            if entry.layer_name not in gradients:
+                gradients[entry.layer_name] = {}
+            gradients[entry.layer_name][entry.param_name] = param.grad
         return gradients
 
     def set_gradients_to_current_parameters(self, gradients):
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            for name, param in named_parameters:
-                param.grad = gradients[layer_name][name]
-
-        named_parameters = self.dist.named_parameters()
-        for name, param in named_parameters:
-            param.grad = gradients["actor_linear"][name]
-
-    def accumulate_gradients(self, gradients):
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            for name, param in named_parameters:
-                self.avg_gradients[layer_name][name] += gradients[layer_name][name]
-
-        named_parameters = self.dist.named_parameters()
-        for name, param in named_parameters:
-            self.avg_gradients["actor_linear"][name] += gradients["actor_linear"][name]
+        if type(gradients) is torch.Tensor:
+            self.flat_gradients_buffer.copy_(gradients)
+            gradients = self.unflatten(self.flat_gradients_buffer)
+
+        for entry, param in zip(self.flat_layout, self.flat_layout_parameters):
+            param.grad = gradients[entry.layer_name][entry.param_name]
+
+    def accumulate_gradients(self, gradients, weight=1.0):
+        if type(gradients) is torch.Tensor:
+            self.avg_flat_gradients += weight * gradients.to(self.device)
+        elif is_compressed_gradients(gradients):
+            accumulate_compressed_gradients(self.avg_flat_gradients, gradients, self.flat_segment_numels, weight)
+        else:
+            for entry in self.flat_layout:
+                self.avg_gradients[entry.layer_name][entry.param_name] += weight * gradients[entry.layer_name][entry.param_name]
 
     def get_average_gradients(self, num_workers):
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            for name, param in named_parameters:
-                self.avg_gradients[layer_name][name] /= num_workers
-        named_parameters = self.dist.named_parameters()
-        for name, param in named_parameters:
-            self.avg_gradients["actor_linear"][name] /= num_workers
+        self.avg_flat_gradients /= num_workers
 
     def get_score_weighted_gradients(self, num_workers, scores, gradients, worker_id, episode):
         self.ema_scores[worker_id] = scores[worker_id][-1]
         self.sum += scores[worker_id][-1]
         self.id_list.append(worker_id)
 
-        if episode == 0:
-            for layer_name, layer in self.base.layers_info.items():
-                named_parameters = layer.to(self.device).named_parameters()
-                for name, param in named_parameters:
-                    self.avg_gradients[layer_name][name] += gradients[layer_name][name]
-
-            named_parameters = self.dist.named_parameters()
-            for name, param in named_parameters:
-                self.avg_gradients["actor_linear"][name] += gradients["actor_linear"][name]
+        if type(gradients) is torch.Tensor:
+            gradients = self.unflatten(gradients.to(self.device))
 
+        if episode == 0:
+            for entry in self.flat_layout:
+                self.avg_gradients[entry.layer_name][entry.param_name] += gradients[entry.layer_name][entry.param_name]
         else:
-            for layer_name, layer in self.base.layers_info.items():
-                named_parameters = layer.to(self.device).named_parameters()
-                for name, param in named_parameters:
-                    self.weighted_gradients[layer_name][name] += self.weighted_scores[self.id_list[self.count]] * gradients[layer_name][name]
-            named_parameters = self.dist.named_parameters()
-            for name, param in named_parameters:
-                self.weighted_gradients["actor_linear"][name] += self.weighted_scores[self.id_list[self.count]] * gradients["actor_linear"][name]
+            for entry in self.flat_layout:
+                self.weighted_gradients[entry.layer_name][entry.param_name] += self.weighted_scores[self.id_list[self.count]] * gradients[entry.layer_name][entry.param_name]
 
         self.count += 1
         if self.count == num_workers:
@@ -238,48 +249,45 @@ class ActorCriticModel(nn.Module):
 
     def get_parameters(self):
         parameters = {}
-
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            parameters[layer_name] = {}
-            for name, param in named_parameters:
-                parameters[layer_name][name] = param.data
-
-        named_parameters = self.dist.named_parameters()
-        parameters["actor_linear"] = {}
-        for name, param in named_parameters:
-            parameters["actor_linear"][name] = param.data
-
+        for entry, param in zip(self.flat_layout, self.flat_layout_parameters):
+            if entry.layer_name not in parameters:
+                parameters[entry.layer_name] = {}
+            parameters[entry.layer_name][entry.param_name] = param.data
         return parameters
 
     def transfer_process(self, parameters, soft_transfer, soft_transfer_tau, scores):
+        if type(parameters) is torch.Tensor:
+            parameters = self.unflatten(parameters.to(self.device))
+
         score_weighted_tau = {}
-        for layer_name, layer in self.base.layers_info.items():
-            named_parameters = layer.to(self.device).named_parameters()
-            for name, param in named_parameters:
+        for entry, param in zip(self.flat_layout, self.flat_layout_parameters):
+            transferred = parameters[entry.layer_name][entry.param_name]
+            if entry.layer_name == "actor_linear":
+                if soft_transfer:
+                    param.data = param.data * soft_transfer_tau + transferred * (1 - soft_transfer_tau)
+                else:
+                    param.data = transferred.clone()
+            else:
                 if soft_transfer:
                     # param.data = param.data * soft_transfer_tau + parameters[layer_name][name] * (1 - soft_transfer_tau)
                     score_weighted_tau[self.worker_id] = (1300 - scores[self.worker_id]) / 400
-                    param.data = param.data * score_weighted_tau[self.worker_id] + parameters[layer_name][name] * (1-score_weighted_tau[self.worker_id])
+                    param.data = param.data * score_weighted_tau[self.worker_id] + transferred * (1-score_weighted_tau[self.worker_id])
                 else:
-                    param.data = parameters[layer_name][name]
-
-        named_parameters = self.dist.named_parameters()
-        for name, param in named_parameters:
-            if soft_transfer:
-                param.data = param.data * soft_transfer_tau + parameters["actor_linear"][name] * (1 - soft_transfer_tau)
-            else:
-                param.data = parameters["actor_linear"][name]
+                    param.data = transferred.clone()
 
 
 class MLPBase(nn.Module):
-    def __init__(self, num_inputs, continuous):
+    """
+    shared_trunk이면 actor와 critic이 하나의 hidden layers를 공유하고 critic_linear만 따로 가지므로, forward마다 hidden layers를 한 번만 계산합니다.
+    """
+    def __init__(self, num_inputs, continuous, shared_trunk=False):
         super(MLPBase, self).__init__()
 
         self.hidden_1_size = HIDDEN_1_SIZE
         self.hidden_2_size = HIDDEN_2_SIZE
         self.hidden_3_size = HIDDEN_3_SIZE
         self.continuous = continuous
+        self.shared_trunk = shared_trunk
 
         init_ = lambda m: util_init(m, nn.init.orthogonal_, lambda x: nn.init.constant_(x, 0), np.sqrt(2))
 
@@ -288,25 +296,39 @@ class MLPBase(nn.Module):
         else:
             activation = nn.LeakyReLU()
 
-        self.actor = nn.Sequential(
-            init_(nn.Linear(num_inputs, self.hidden_1_size)), activation,
-            init_(nn.Linear(self.hidden_1_size, self.hidden_2_size)), activation,
-            init_(nn.Linear(self.hidden_2_size, self.hidden_3_size)), activation,
-        )
+        if self.shared_trunk:
+            self.trunk = nn.Sequential(
+                init_(nn.Linear(num_inputs, self.hidden_1_size)), activation,
+                init_(nn.Linear(self.hidden_1_size, self.hidden_2_size)), activation,
+                init_(nn.Linear(self.hidden_2_size, self.hidden_3_size)), activation,
+            )
+        else:
+            self.actor = nn.Sequential(
+                init_(nn.Linear(num_inputs, self.hidden_1_size)), activation,
+                init_(nn.Linear(self.hidden_1_size, self.hidden_2_size)), activation,
+                init_(nn.Linear(self.hidden_2_size, self.hidden_3_size)), activation,
+            )
 
-        self.critic = nn.Sequential(
-            init_(nn.Linear(num_inputs, self.hidden_1_size)), activation,
-            init_(nn.Linear(self.hidden_1_size, self.hidden_2_size)), activation,
-            init_(nn.Linear(self.hidden_2_size, self.hidden_3_size)), activation,
-        )
+            self.critic = nn.Sequential(
+                init_(nn.Linear(num_inputs, self.hidden_1_size)), activation,
+                init_(nn.Linear(self.hidden_1_size, self.hidden_2_size)), activation,
+                init_(nn.Linear(self.hidden_2_size, self.hidden_3_size)), activation,
+            )
 
         self.critic_linear = init_(nn.Linear(self.hidden_3_size, 1))
 
-        self.layers_info = {'actor':self.actor, 'critic':self.critic, 'critic_linear':self.critic_linear}
+        if self.shared_trunk:
+            self.layers_info = {'trunk': self.trunk, 'critic_linear': self.critic_linear}
+        else:
+            self.layers_info = {'actor':self.actor, 'critic':self.critic, 'critic_linear':self.critic_linear}
 
         self.train()
 
     def forward(self, inputs):
+        if self.shared_trunk:
+            hidden = self.trunk(inputs)
+            return self.critic_linear(hidden), hidden
+
         hidden_critic = self.critic(inputs)
         hidden_actor = self.actor(inputs)
 
@@ -318,12 +340,17 @@ class MLPBase(nn.Module):
 
 
 class CNNBase(nn.Module):
-    def __init__(self, input_channels, input_height, input_width, continuous):
+    """
+    shared_trunk이면 actor와 critic이 conv stack과 첫 Linear layer를 공유하고 critic은 그 위의 Linear layers만 따로 가지므로,
+    forward마다 conv stack을 한 번만 계산합니다.
+    """
+    def __init__(self, input_channels, input_height, input_width, continuous, shared_trunk=False):
         super(CNNBase, self).__init__()
         self.cnn_critic_hidden_1_size = CNN_CRITIC_HIDDEN_1_SIZE
         self.cnn_critic_hidden_2_size = CNN_CRITIC_HIDDEN_2_SIZE
 
         self.continuous = continuous
+        self.shared_trunk = shared_trunk
 
         from rl_main.utils import get_conv2d_size, get_pool2d_size
         h, w = get_conv2d_size(h=input_height, w=input_width, kernel_size=3, padding=0, stride=1)
@@ -345,35 +372,58 @@ class CNNBase(nn.Module):
                                         nn.init.calculate_gain('leaky_relu'))
             activation = nn.LeakyReLU()
 
-        self.actor = nn.Sequential(
-            init_(nn.Conv2d(in_channels=input_channels, out_channels=32, kernel_size=8, padding=0, stride=4)),
-            activation,
-            init_(nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, padding=0, stride=2)),
-            activation,
-            init_(nn.Conv2d(in_channels=64, out_channels=32, kernel_size=3, padding=0, stride=1)),
-            activation,
-            Flatten(),
-            init_(nn.Linear(32 * h * w, self.cnn_critic_hidden_1_size)),
-            activation
-        )
-
-        init_ = lambda m: util_init(m, nn.init.orthogonal_, lambda x: nn.init.constant_(x, 0))
-
-        self.critic = nn.Sequential(
-            init_(nn.Conv2d(in_channels=input_channels, out_channels=32, kernel_size=8, padding=0, stride=4)),
-            activation,
-            init_(nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, padding=0, stride=2)),
-            activation,
-            init_(nn.Conv2d(in_channels=64, out_channels=32, kernel_size=3, padding=0, stride=1)),
-            activation,
-            Flatten(),
-            init_(nn.Linear(32 * h * w, self.cnn_critic_hidden_1_size)),
-            activation,
-            init_(nn.Linear(self.cnn_critic_hidden_1_size, self.cnn_critic_hidden_2_size)),
-            init_(nn.Linear(self.cnn_critic_hidden_2_size, 1))
-        )
-
-        self.layers_info = {'actor': self.actor, 'critic': self.critic}
+        if self.shared_trunk:
+            self.trunk = nn.Sequential(
+                init_(nn.Conv2d(in_channels=input_channels, out_channels=32, kernel_size=8, padding=0, stride=4)),
+                activation,
+                init_(nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, padding=0, stride=2)),
+                activation,
+                init_(nn.Conv2d(in_channels=64, out_channels=32, kernel_size=3, padding=0, stride=1)),
+                activation,
+                Flatten(),
+                init_(nn.Linear(32 * h * w, self.cnn_critic_hidden_1_size)),
+                activation
+            )
+
+            init_ = lambda m: util_init(m, nn.init.orthogonal_, lambda x: nn.init.constant_(x, 0))
+
+            self.critic = nn.Sequential(
+                init_(nn.Linear(self.cnn_critic_hidden_1_size, self.cnn_critic_hidden_2_size)),
+                init_(nn.Linear(self.cnn_critic_hidden_2_size, 1))
+            )
+        else:
+            self.actor = nn.Sequential(
+                init_(nn.Conv2d(in_channels=input_channels, out_channels=32, kernel_size=8, padding=0, stride=4)),
+                activation,
+                init_(nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, padding=0, stride=2)),
+                activation,
+                init_(nn.Conv2d(in_channels=64, out_channels=32, kernel_size=3, padding=0, stride=1)),
+                activation,
+                Flatten(),
+                init_(nn.Linear(32 * h * w, self.cnn_critic_hidden_1_size)),
+                activation
+            )
+
+            init_ = lambda m: util_init(m, nn.init.orthogonal_, lambda x: nn.init.constant_(x, 0))
+
+            self.critic = nn.Sequential(
+                init_(nn.Conv2d(in_channels=input_channels, out_channels=32, kernel_size=8, padding=0, stride=4)),
+                activation,
+                init_(nn.Conv2d(in_channels=32, out_channels=64, kernel_size=4, padding=0, stride=2)),
+                activation,
+                init_(nn.Conv2d(in_channels=64, out_channels=32, kernel_size=3, padding=0, stride=1)),
+                activation,
+                Flatten(),
+                init_(nn.Linear(32 * h * w, self.cnn_critic_hidden_1_size)),
+                activation,
+                init_(nn.Linear(self.cnn_critic_hidden_1_size, self.cnn_critic_hidden_2_size)),
+                init_(nn.Linear(self.cnn_critic_hidden_2_size, 1))
+            )
+
+        if self.shared_trunk:
+            self.layers_info = {'trunk': self.trunk, 'critic': self.critic}
+        else:
+            self.layers_info = {'actor': self.actor, 'critic': self.critic}
 
         self.train()
 
@@ -382,6 +432,10 @@ class CNNBase(nn.Module):
         if len(inputs.size()) == 3:
             inputs = inputs.unsqueeze(0)
 
+        if self.shared_trunk:
+            hidden = self.trunk(inputs)
+            return self.critic(hidden), hidden
+
         hidden_actor = self.actor(inputs)
         hidden_critic = self.critic(inputs)
 
@@ -0,0 +1,254 @@
+# -*- coding:utf-8 -*-
+import copy
+import glob
+import inspect
+import os
+import pickle
+import random
+import re
+import threading
+import time
+import traceback
+
+import numpy as np
+import torch
+
+from rl_main.main_constants import *
+
+CHECKPOINT_EPISODE_PATTERN = re.compile(r"\.(\d+)\.pt$")
+
+# marks a full training state; older save files hold only the model's state_dict
+TRAINING_STATE_FORMAT = "training_state_v1"
+
+# torch >= 2.6 defaults torch.load to weights_only=True, which rejects the python objects in a training state
+# (deque, ExpMovingAverage, ParametersHistory, RNG states); older torch versions have no weights_only argument
+TORCH_LOAD_HAS_WEIGHTS_ONLY = "weights_only" in inspect.signature(torch.load).parameters
+
+
+def is_lockstep_resume():
+    """
+    workers와 chief가 모든 라운드를 함께 지나는 MODE_SYNCHRONIZATION(bounded staleness와 SYNC_ROUND_DEADLINE 제외)에서만
+    모두를 같은 episode로 되돌려 이어서 학습합니다. 그 외의 모드에서는 각자 자신의 최신 checkpoint에서 이어서 학습합니다.
+    """
+    return MODE_SYNCHRONIZATION and not MODE_BOUNDED_STALENESS and SYNC_ROUND_DEADLINE is None
+
+
+def get_keep_last():
+    # in lockstep two aligned checkpoints keep an episode that every owner has saved, even if one owner is a save ahead
+    if is_lockstep_resume() and MODEL_SAVE_KEEP_LAST > 0:
+        return max(MODEL_SAVE_KEEP_LAST, 2)
+    return MODEL_SAVE_KEEP_LAST
+
+
+def get_checkpoint_prefix(owner):
+    return "{0}_{1}_{2}_{3}".format(owner, ENVIRONMENT_ID.name, DEEP_LEARNING_MODEL.value, RL_ALGORITHM.value)
+
+
+def get_checkpoint_episode(filename):
+    return int(CHECKPOINT_EPISODE_PATTERN.search(filename).group(1))
+
+
+def get_checkpoint_files(owner):
+    """
+    Args:
+        owner: checkpoint를 저장한 worker_id 혹은 "chief"입니다.
+
+    Returns:
+         model_save_files의 checkpoint 파일들을 episode 순으로 정렬하여 반환합니다. 작성 중인 임시 파일은 포함하지 않습니다.
+    """
+    files = glob.glob(os.path.join(PROJECT_HOME, "model_save_files", "{0}_{1}_{2}_*.pt".format(
+        owner, ENVIRONMENT_ID.name, DEEP_LEARNING_MODEL.value
+    )))
+    files = [f for f in files if CHECKPOINT_EPISODE_PATTERN.search(f) is not None]
+    return sorted(files, key=get_checkpoint_episode)
+
+
+def load_checkpoint(owner, max_episode=None, map_location=None):
+    """
+    가장 최근 episode의 checkpoint부터 차례로 읽어, 처음으로 정상적으로 읽힌 checkpoint를 반환합니다.
+
+    Args:
+        owner: checkpoint를 저장한 worker_id 혹은 "chief"입니다.
+        max_episode(int): None이 아니면 이 episode 이후의 checkpoint는 사용하지 않습니다.
+        map_location: torch.load의 map_location입니다.
+
+    Returns:
+         (파일명, checkpoint)를 반환합니다. 읽을 수 있는 checkpoint가 없으면 (None, None)을 반환합니다.
+    """
+    for filename in reversed(get_checkpoint_files(owner)):
+        if max_episode is not None and get_checkpoint_episode(filename) > max_episode:
+            continue
+        try:
+            return filename, load_save_file(filename, map_location=map_location)
+        except (EOFError, pickle.UnpicklingError, RuntimeError) as e:
+            # torch reports a truncated zip or legacy archive as RuntimeError
+            print("{0}: Skip unreadable save file {1} ({2})".format(owner, filename, e))
+    return None, None
+
+
+def load_save_file(filename, map_location=None):
+    """
+    model_save_files의 파일은 이 프로젝트가 직접 기록한 것이므로, python 객체까지 모두 복원합니다.
+    """
+    if TORCH_LOAD_HAS_WEIGHTS_ONLY:
+        return torch.load(filename, map_location=map_location, weights_only=False)
+    return torch.load(filename, map_location=map_location)
+
+
+def is_training_state(checkpoint):
+    return isinstance(checkpoint, dict) and checkpoint.get("format") == TRAINING_STATE_FORMAT
+
+
+def get_model_state_dict(checkpoint):
+    return checkpoint["model"] if is_training_state(checkpoint) else checkpoint
+
+
+def get_resume_episode():
+    """
+    RESUME일 때 이어서 학습할 episode를 정합니다.
+    workers마다 checkpoint를 마지막으로 기록한 episode가 다를 수 있으므로, 아직 학습 중이던 workers의 최신 checkpoint 중
+    가장 이른 episode를 반환합니다. 이미 SUCCESS/FAIL로 끝난 workers는 고려하지 않습니다.
+    is_lockstep_resume()일 때에만 모든 workers와 chief가 이 episode로 되돌아가며, 그 외에는 각자의 최신 checkpoint를 사용합니다.
+
+    Returns:
+         이어서 학습할 마지막 완료 episode를 반환합니다. checkpoint가 없는 worker가 있거나 모든 workers가 끝났으면 None을 반환합니다.
+    """
+    resume_episode = None
+    for worker_id in range(NUM_WORKERS):
+        filename, checkpoint = load_checkpoint(worker_id, map_location="cpu")
+        if not is_training_state(checkpoint):
+            print("Worker ID - {0}: There is no training state to resume from".format(worker_id))
+            return None
+
+        if checkpoint["is_success_or_fail_done"]:
+            continue
+
+        if resume_episode is None or checkpoint["episode"] < resume_episode:
+            resume_episode = checkpoint["episode"]
+
+    return resume_episode
+
+
+def get_rng_states():
+    rng_states = {
+        "random": random.getstate(),
+        "numpy": np.random.get_state(),
+        "torch": torch.get_rng_state()
+    }
+    if torch.cuda.is_available():
+        rng_states["torch_cuda"] = torch.cuda.get_rng_state_all()
+    return rng_states
+
+
+def set_rng_states(rng_states):
+    random.setstate(rng_states["random"])
+    np.random.set_state(rng_states["numpy"])
+    torch.set_rng_state(rng_states["torch"])
+    if "torch_cuda" in rng_states and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(rng_states["torch_cuda"])
+
+
+def snapshot_state(state):
+    """
+    tensor들은 CPU로 복사하고 나머지 값들은 deepcopy하여, 학습이 계속되는 동안 다른 thread에서 기록해도 되는 복사본을 만듭니다.
+    """
+    if isinstance(state, torch.Tensor):
+        return state.detach().to("cpu", copy=True)
+    elif isinstance(state, dict):
+        return type(state)((key, snapshot_state(value)) for key, value in state.items())
+    elif isinstance(state, (list, tuple)) and not hasattr(state, "_fields"):
+        return type(state)(snapshot_state(value) for value in state)
+    else:
+        return copy.deepcopy(state)
+
+
+class CheckpointManager:
+    """
+    MODEL_SAVE일 때 worker와 chief의 학습 상태를 model_save_files에 저장합니다.
+    save()는 상태를 CPU 메모리로 복사만 하고 바로 반환하며, 파일 기록은 별도의 thread에서 임시 파일에 쓴 뒤 rename하므로
+    기록 도중 process가 종료되어도 이전 checkpoint는 온전히 남습니다.
+    interval_episodes episode마다 (혹은 interval_seconds초마다) 저장하고, 최근 MODEL_SAVE_KEEP_LAST개만 남깁니다.
+    is_lockstep_resume()이면 모두가 같은 episodes를 저장하도록 interval_episodes의 배수 번째 episode마다만 저장합니다.
+    기록이 밀리면 아직 기록하지 않은 snapshot은 더 최근의 snapshot으로 대체됩니다.
+    """
+    def __init__(self, owner, interval_episodes=MODEL_SAVE_INTERVAL_EPISODES, interval_seconds=MODEL_SAVE_INTERVAL_SECONDS):
+        self.owner = owner
+        self.interval_episodes = interval_episodes
+        self.interval_seconds = interval_seconds
+
+        self.last_saved_episode = None
+        self.last_saved_time = time.time()
+
+        self.condition = threading.Condition()
+        self.pending_snapshot = None
+        self.is_stopped = False
+
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def is_save_due(self, episode):
+        if is_lockstep_resume():
+            # every owner saves the same episodes, so a common episode to resume from is always kept
+            return (episode + 1) % (self.interval_episodes or 1) == 0
+        if self.last_saved_episode is None:
+            return True
+        if self.interval_episodes is not None and episode - self.last_saved_episode >= self.interval_episodes:
+            return True
+        if self.interval_seconds is not None and time.time() - self.last_saved_time >= self.interval_seconds:
+            return True
+        return False
+
+    def save(self, episode, get_state, force=False):
+        """
+        Args:
+            episode(int): 저장할 상태가 마친 episode입니다.
+            get_state(function): 저장할 상태(dict)를 반환하는 함수로, 저장할 때에만 호출됩니다.
+            force(bool): True이면 주기와 무관하게 저장합니다. 이미 저장한 episode는 다시 저장하지 않습니다.
+        """
+        if episode == self.last_saved_episode or not (force or self.is_save_due(episode)):
+            return
+
+        snapshot = snapshot_state(get_state())
+        self.last_saved_episode = episode
+        self.last_saved_time = time.time()
+
+        with self.condition:
+            self.pending_snapshot = (episode, snapshot)
+            self.condition.notify_all()
+
+    def close(self):
+        """
+        아직 기록하지 않은 snapshot을 기록한 후 thread를 종료합니다.
+        """
+        with self.condition:
+            self.is_stopped = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def run(self):
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.pending_snapshot is not None or self.is_stopped)
+                if self.pending_snapshot is None:
+                    return
+                episode, snapshot = self.pending_snapshot
+                self.pending_snapshot = None
+
+            try:
+                self.write(episode, snapshot)
+            except Exception:
+                traceback.print_exc()
+
+    def write(self, episode, snapshot):
+        save_dir = os.path.join(PROJECT_HOME, "model_save_files")
+        filename = os.path.join(save_dir, "{0}.{1}.pt".format(get_checkpoint_prefix(self.owner), episode))
+        temp_filename = os.path.join(save_dir, ".{0}.tmp".format(os.path.basename(filename)))
+
+        with open(temp_filename, "wb") as f:
+            torch.save(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, filename)
+
+        for old_filename in get_checkpoint_files(self.owner)[:-get_keep_last()]:
+            os.remove(old_filename)
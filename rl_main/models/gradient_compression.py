@@ -0,0 +1,93 @@
+import torch
+
+from rl_main.main_constants import *
+
+METHOD_FP16 = 1
+METHOD_INT8 = 2
+METHOD_TOP_K = 3
+
+INT8_MAX = 127.0
+
+
+class GradientCompressor:
+    """
+    Worker에서 chief로 보내는 flat gradient를 손실 압축합니다.
+    압축으로 잃어버린 값(residual)은 worker에 남겨 두었다가 다음 episode의 gradient에 더해서 보냅니다 (error feedback).
+    TOP_K는 크기가 가장 큰 k개의 (index, value)만 보내고, 보내지 않은 나머지는 모두 residual로 누적합니다.
+    """
+    def __init__(self, model, method):
+        self.method = method
+        self.segment_numels = model.flat_segment_numels
+        self.residual = torch.zeros(model.flat_size).to(model.device)
+        self.top_k = max(1, int(model.flat_size * GRADIENTS_TOP_K_RATIO))
+
+    def compress(self, flat_gradients):
+        corrected_gradients = flat_gradients + self.residual
+
+        if self.method == GradientsCompressionName.FP16:
+            compressed_gradients = {
+                "method": METHOD_FP16,
+                "values": corrected_gradients.half()
+            }
+        elif self.method == GradientsCompressionName.INT8:
+            scales = torch.stack([
+                segment.abs().max() for segment in torch.split(corrected_gradients, self.segment_numels.tolist())
+            ]) / INT8_MAX
+            scales[scales == 0.0] = 1.0
+            expanded_scales = scales.repeat_interleave(self.segment_numels.to(scales.device))
+            compressed_gradients = {
+                "method": METHOD_INT8,
+                "values": torch.round(corrected_gradients / expanded_scales).clamp(-INT8_MAX, INT8_MAX).to(torch.int8),
+                "scales": scales
+            }
+        elif self.method == GradientsCompressionName.TOP_K:
+            _, indices = corrected_gradients.abs().topk(self.top_k, sorted=False)
+            compressed_gradients = {
+                "method": METHOD_TOP_K,
+                "indices": indices.int(),
+                "values": corrected_gradients[indices]
+            }
+            corrected_gradients[indices] = 0.0
+            self.residual = corrected_gradients
+            return compressed_gradients
+        else:
+            raise NotImplementedError
+
+        self.residual = corrected_gradients - decompress_gradients(compressed_gradients, self.segment_numels)
+        return compressed_gradients
+
+
+def is_compressed_gradients(gradients):
+    return type(gradients) is dict and "method" in gradients
+
+
+def decompress_gradients(compressed_gradients, segment_numels):
+    flat_gradients = torch.zeros(int(segment_numels.sum().item())).to(compressed_gradients["values"].device)
+    accumulate_compressed_gradients(flat_gradients, compressed_gradients, segment_numels)
+    return flat_gradients
+
+
+def accumulate_compressed_gradients(flat_buffer, compressed_gradients, segment_numels, weight=1.0):
+    method = compressed_gradients["method"]
+    values = compressed_gradients["values"].to(flat_buffer.device)
+
+    if method == METHOD_FP16:
+        flat_buffer += weight * values.float()
+    elif method == METHOD_INT8:
+        scales = weight * compressed_gradients["scales"].to(flat_buffer.device)
+        flat_buffer += values.float() * scales.repeat_interleave(segment_numels.to(flat_buffer.device))
+    elif method == METHOD_TOP_K:
+        indices = compressed_gradients["indices"].to(flat_buffer.device).long()
+        flat_buffer.index_add_(0, indices, weight * values.float())
+    else:
+        raise NotImplementedError
+
+
+def get_gradient_compressor(model):
+    if GRADIENTS_COMPRESSION == GradientsCompressionName.NONE or model is None:
+        gradient_compressor = None
+    elif GRADIENTS_COMPRESSION in (GradientsCompressionName.FP16, GradientsCompressionName.INT8, GradientsCompressionName.TOP_K):
+        gradient_compressor = GradientCompressor(model, GRADIENTS_COMPRESSION)
+    else:
+        gradient_compressor = None
+    return gradient_compressor
@@ -0,0 +1,317 @@
+# -*- coding:utf-8 -*-
+"""
+results/ 아래의 실험 결과 CSV들(outputs_{workers}_{run}.csv, outputs_{workers}_{run}.just_multi.csv)을
+하나의 numpy structured array로 읽어들이고, workers 수에 따른 비교에 필요한 값들을 계산합니다.
+main_constants 없이 실행할 수 있습니다.
+
+    python -m rl_main.results_analysis results/cartpole_195_100 [solve_score] [window]
+"""
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy import stats
+
+RESULTS_COLUMNS = ["episode_chief", "worker_id", "loss", "ema_loss", "score", "ema_score"]
+
+RESULTS_TABLE_DTYPE = np.dtype([
+    ("num_workers", "<i4"),
+    ("run", "<i4"),
+    ("just_multi", "?"),
+    ("episode_chief", "<i8"),
+    ("worker_id", "<i8"),
+    ("loss", "<f8"),
+    ("ema_loss", "<f8"),
+    ("score", "<f8"),
+    ("ema_score", "<f8")
+])
+
+RUN_KEYS = ["num_workers", "just_multi", "run"]
+
+RESULTS_FILE_NAME_PATTERN = re.compile(r"^outputs_(\d+)_(\d+)(\.just_multi)?\.+csv$")
+RESULTS_CACHE_FILE_NAME = ".results_cache.npz"
+
+
+def parse_results_file_name(file_name):
+    """
+    Args:
+        file_name(str): 예) outputs_8_3.csv, outputs_8_3.just_multi.csv
+
+    Returns:
+         (num_workers, run, just_multi)를 반환합니다. 결과 파일이 아니면 None을 반환합니다.
+    """
+    match = RESULTS_FILE_NAME_PATTERN.match(file_name)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2)), match.group(3) is not None
+
+
+def get_results_files(results_dir):
+    results_files = []
+    for file_name in sorted(os.listdir(results_dir)):
+        parsed = parse_results_file_name(file_name)
+        if parsed is not None:
+            results_files.append((os.path.join(results_dir, file_name),) + parsed)
+    return results_files
+
+
+def get_source_signature(file_path):
+    file_stat = os.stat(file_path)
+    return "{0}:{1}:{2}".format(os.path.basename(file_path), file_stat.st_size, file_stat.st_mtime_ns)
+
+
+def load_results_file(results_file):
+    """
+    Args:
+        results_file(tuple): get_results_files()가 반환한 (file_path, num_workers, run, just_multi)입니다.
+
+    Returns:
+         RESULTS_TABLE_DTYPE의 structured array를 반환합니다.
+    """
+    file_path, num_workers, run, just_multi = results_file
+    with open(file_path, "rb") as f:
+        text = f.read().decode("ascii")
+
+    # a whole file is parsed by a single C call instead of line by line
+    text = text.replace("\r", "").strip().replace("\n", ",")
+    values = np.fromstring(text, dtype=np.float64, sep=",") if len(text) > 0 else np.zeros(0)
+    if len(values) % len(RESULTS_COLUMNS) != 0:
+        raise ValueError("{0} does not have {1} columns in every row".format(file_path, len(RESULTS_COLUMNS)))
+    values = values.reshape(-1, len(RESULTS_COLUMNS))
+
+    table = np.zeros(len(values), dtype=RESULTS_TABLE_DTYPE)
+    table["num_workers"] = num_workers
+    table["run"] = run
+    table["just_multi"] = just_multi
+    for idx, column in enumerate(RESULTS_COLUMNS):
+        table[column] = values[:, idx]
+    return table
+
+
+def load_results(results_dir, use_cache=True, max_workers=None):
+    """
+    results_dir의 결과 파일들을 process pool로 나누어 읽고 하나의 table로 합칩니다.
+    읽은 table은 results_dir/.results_cache.npz에 저장되며, 파일 목록, 크기, 수정 시각이 모두 같으면 CSV를 다시 읽지 않습니다.
+
+    Args:
+        results_dir(str): 결과 파일들이 있는 디렉토리입니다.
+        use_cache(bool): False이면 캐시를 읽지도 쓰지도 않습니다.
+        max_workers(int): CSV를 읽을 process 수입니다. None이면 CPU 수를 사용합니다.
+
+    Returns:
+         (num_workers, just_multi, run, episode_chief, worker_id) 순으로 정렬된 RESULTS_TABLE_DTYPE의 structured array를 반환합니다.
+    """
+    results_files = get_results_files(results_dir)
+    sources = np.asarray([get_source_signature(results_file[0]) for results_file in results_files], dtype=np.str_)
+    cache_file_path = os.path.join(results_dir, RESULTS_CACHE_FILE_NAME)
+
+    if use_cache and os.path.exists(cache_file_path):
+        with np.load(cache_file_path) as cache:
+            if np.array_equal(cache["sources"], sources):
+                return cache["table"]
+
+    if len(results_files) == 0:
+        table = np.zeros(0, dtype=RESULTS_TABLE_DTYPE)
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            table = np.concatenate(list(executor.map(load_results_file, results_files)))
+
+    table = table[np.lexsort([table[key] for key in reversed(RUN_KEYS + ["episode_chief", "worker_id"])])]
+
+    if use_cache:
+        # write to a temporary file first so that a concurrent reader never loads a half-written cache
+        temp_file_path = os.path.join(results_dir, ".{0}.tmp.npz".format(RESULTS_CACHE_FILE_NAME.lstrip(".")))
+        np.savez(temp_file_path, table=table, sources=sources)
+        os.replace(temp_file_path, cache_file_path)
+
+    return table
+
+
+def get_run_boundaries(table):
+    """
+    Args:
+        table(np.ndarray): load_results()가 반환한, run 단위로 정렬된 table입니다.
+
+    Returns:
+         각 run의 시작 index 배열을 반환합니다.
+    """
+    if len(table) == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    is_new_run = np.zeros(len(table), dtype=bool)
+    is_new_run[0] = True
+    for key in RUN_KEYS:
+        is_new_run[1:] |= table[key][1:] != table[key][:-1]
+    return np.flatnonzero(is_new_run)
+
+
+def get_episodes_to_solve(table, solve_score=195.0, window=100):
+    """
+    worker 하나의 최근 window개 episode 평균 score(ema_score)가 solve_score 이상이 된 첫 episode_chief를
+    그 run이 문제를 해결하기까지 걸린 episode 수로 봅니다. worker.py의 WIN_AND_LEARN_FINISH 조건과 같습니다.
+
+    Args:
+        table(np.ndarray): load_results()가 반환한 table입니다.
+        solve_score(float): WIN_AND_LEARN_FINISH_SCORE입니다.
+        window(int): WIN_AND_LEARN_FINISH_CONTINUOUS_EPISODES입니다.
+
+    Returns:
+         run별 (num_workers, just_multi, run, episodes_to_solve, solved_worker_id)의 structured array를 반환합니다.
+         해결하지 못한 run의 episodes_to_solve는 nan, solved_worker_id는 -1입니다.
+    """
+    run_starts = get_run_boundaries(table)
+
+    runs = np.zeros(len(run_starts), dtype=[
+        ("num_workers", "<i4"), ("just_multi", "?"), ("run", "<i4"),
+        ("episodes_to_solve", "<f8"), ("solved_worker_id", "<i8")
+    ])
+    for key in RUN_KEYS:
+        runs[key] = table[key][run_starts]
+    runs["episodes_to_solve"] = np.nan
+    runs["solved_worker_id"] = -1
+    if len(table) == 0:
+        return runs
+
+    run_index = np.repeat(np.arange(len(run_starts)), np.diff(np.append(run_starts, len(table))))
+
+    # number of episodes each worker has reported so far, counted within (run, worker)
+    order = np.lexsort([table["episode_chief"], table["worker_id"], run_index])
+    sorted_run_index = run_index[order]
+    sorted_worker_id = table["worker_id"][order]
+    is_new_group = np.ones(len(order), dtype=bool)
+    is_new_group[1:] = (sorted_run_index[1:] != sorted_run_index[:-1]) | (sorted_worker_id[1:] != sorted_worker_id[:-1])
+    group_starts = np.flatnonzero(is_new_group)
+    num_reported = np.empty(len(order), dtype=np.int64)
+    num_reported[order] = np.arange(len(order)) - np.repeat(group_starts, np.diff(np.append(group_starts, len(order))))
+    num_reported += 1
+
+    is_solved = (table["ema_score"] >= solve_score) & (num_reported >= window)
+
+    # the table is sorted by episode_chief within a run, so the first solved row of a run is its solving episode
+    solved_rows = np.flatnonzero(is_solved)
+    solved_runs, first_solved = np.unique(run_index[solved_rows], return_index=True)
+    runs["episodes_to_solve"][solved_runs] = table["episode_chief"][solved_rows[first_solved]]
+    runs["solved_worker_id"][solved_runs] = table["worker_id"][solved_rows[first_solved]]
+    return runs
+
+
+def get_confidence_interval(values, confidence=0.95, axis=0):
+    """
+    nan을 제외한 값들의 평균과 Student t 분포에 따른 신뢰구간의 반폭을 계산합니다.
+
+    Returns:
+         (mean, half_width, count)를 반환합니다. 값이 두 개 미만이면 half_width는 nan입니다.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    is_valid = ~np.isnan(values)
+    count = is_valid.sum(axis=axis)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(is_valid, values, 0.0).sum(axis=axis) / count
+        squared_deviation = np.where(is_valid, values - np.expand_dims(mean, axis), 0.0) ** 2
+        std = np.sqrt(squared_deviation.sum(axis=axis) / (count - 1))
+        half_width = stats.t.ppf((1.0 + confidence) / 2.0, count - 1) * std / np.sqrt(count)
+
+    half_width = np.where(count > 1, half_width, np.nan)
+    return mean, half_width, count
+
+
+def get_scaling_summary(runs, confidence=0.95):
+    """
+    Args:
+        runs(np.ndarray): get_episodes_to_solve()가 반환한 run별 결과입니다.
+        confidence(float): 신뢰구간의 신뢰수준입니다.
+
+    Returns:
+         (num_workers, just_multi)별 해결한 run 수, 전체 run 수, episodes_to_solve의 평균과 신뢰구간 반폭을 반환합니다.
+    """
+    # runs are sorted by (num_workers, just_multi, run), so each setting is a contiguous block
+    setting = runs["num_workers"].astype(np.int64) * 2 + runs["just_multi"]
+    _, setting_starts, setting_index = np.unique(setting, return_index=True, return_inverse=True)
+
+    summary = np.zeros(len(setting_starts), dtype=[
+        ("num_workers", "<i4"), ("just_multi", "?"), ("num_runs", "<i8"), ("num_solved", "<i8"),
+        ("mean_episodes_to_solve", "<f8"), ("ci_half_width", "<f8")
+    ])
+    if len(runs) == 0:
+        return summary
+
+    summary["num_workers"] = runs["num_workers"][setting_starts]
+    summary["just_multi"] = runs["just_multi"][setting_starts]
+
+    # one row per setting, runs padded with nan
+    num_runs = np.bincount(setting_index, minlength=len(setting_starts))
+    episodes_to_solve = np.full((len(setting_starts), num_runs.max()), np.nan)
+    episodes_to_solve[setting_index, np.arange(len(runs)) - setting_starts[setting_index]] = runs["episodes_to_solve"]
+
+    summary["num_runs"] = num_runs
+    summary["mean_episodes_to_solve"], summary["ci_half_width"], summary["num_solved"] = get_confidence_interval(
+        episodes_to_solve, confidence=confidence, axis=1
+    )
+    return summary
+
+
+def get_mean_curve(table, num_workers, just_multi=False, column="ema_score", confidence=0.95):
+    """
+    같은 설정의 runs에 대해 episode_chief별 column 값의 평균 곡선과 신뢰구간을 계산합니다.
+    한 run 안에서는 workers의 값을 평균내며, 먼저 끝난 run은 마지막 값이 이후 episode에도 유지된다고 봅니다.
+
+    Args:
+        table(np.ndarray): load_results()가 반환한 table입니다.
+        num_workers(int): 비교할 workers 수입니다.
+        just_multi(bool): .just_multi.csv 결과를 사용할지 여부입니다.
+        column(str): loss, ema_loss, score, ema_score 중 하나입니다.
+        confidence(float): 신뢰구간의 신뢰수준입니다.
+
+    Returns:
+         (episodes, mean, half_width, count)를 반환합니다.
+    """
+    table = table[(table["num_workers"] == num_workers) & (table["just_multi"] == just_multi)]
+    if len(table) == 0:
+        empty = np.zeros(0)
+        return empty.astype(np.int64), empty, empty, empty.astype(np.int64)
+
+    runs, run_index = np.unique(table["run"], return_inverse=True)
+    episodes = np.arange(table["episode_chief"].max() + 1)
+
+    sums = np.zeros((len(runs), len(episodes)))
+    counts = np.zeros((len(runs), len(episodes)))
+    np.add.at(sums, (run_index, table["episode_chief"]), table[column])
+    np.add.at(counts, (run_index, table["episode_chief"]), 1.0)
+
+    is_reported = counts > 0
+    with np.errstate(invalid="ignore"):
+        curves = sums / counts
+
+    # carry the last reported value forward
+    last_reported = np.maximum.accumulate(np.where(is_reported, episodes, 0), axis=1)
+    curves = curves[np.arange(len(runs))[:, np.newaxis], last_reported]
+    curves[~np.logical_or.accumulate(is_reported, axis=1)] = np.nan
+
+    mean, half_width, count = get_confidence_interval(curves, confidence=confidence, axis=0)
+    return episodes, mean, half_width, count
+
+
+def print_scaling_summary(summary):
+    print("{0:>11} {1:>10} {2:>7} {3:>8} {4:>23}".format(
+        "num_workers", "just_multi", "runs", "solved", "episodes_to_solve"
+    ))
+    for row in summary:
+        print("{0:>11} {1:>10} {2:>7} {3:>8} {4:>12.1f} ± {5:<8.1f}".format(
+            row["num_workers"], str(row["just_multi"]), row["num_runs"], row["num_solved"],
+            row["mean_episodes_to_solve"], row["ci_half_width"]
+        ))
+
+
+if __name__ == "__main__":
+    results_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "results", "cartpole_195_100"
+    )
+    solve_score = float(sys.argv[2]) if len(sys.argv) > 2 else 195.0
+    window = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    results_table = load_results(results_dir)
+    print("{0} rows loaded from {1}".format(len(results_table), results_dir))
+    print_scaling_summary(get_scaling_summary(get_episodes_to_solve(results_table, solve_score, window)))
@@ -25,12 +25,14 @@ from rl_main.environments.mujoco.humanoid import Humanoid_v2
 from rl_main.environments.mujoco.humanoid_stand_up import HumanoidStandUp_v2
 from rl_main.environments.mujoco.inverted_pendulum import InvertedPendulum_v2
 from rl_main.environments.mujoco.walker_2d import Walker2D_v2
+from rl_main.environments.vector_environment import VectorEnvironment
 from rl_main.models.actor_critic_model import ActorCriticModel
 from rl_main.algorithms_rl.DQN_v0 import DQN_v0
 from rl_main.algorithms_rl.Monte_Carlo_Control_v0 import Monte_Carlo_Control_v0
 from rl_main.algorithms_rl.PPO_v0 import PPO_v0
 from rl_main.algorithms_dp.DP_Policy_Iteration import Policy_Iteration
 from rl_main.algorithms_dp.DP_Value_Iteration import Value_Iteration
+from rl_main.chief_workers.local_transport import LocalTransportClient
 
 
 def get_environment(owner="chief"):
@@ -66,6 +68,7 @@ def get_environment(owner="chief"):
                     env.is_motor_limit = True
                 elif info[0] == "reset_complete":
                     env.is_limit_complete = True
+                    env.notify_response()
 
             elif msg.topic == MQTT_SUB_RESET_COMPLETE:
                 env.is_reset_complete = True
@@ -135,6 +138,19 @@ def get_environment(owner="chief"):
     return env
 
 
+def get_vector_environment(env, num_envs, owner="worker"):
+    """
+    Args:
+        env: 첫 번째 env로 사용할 이미 생성된 Environment 객체입니다.
+        num_envs(int): env 복사본의 수입니다. 나머지 num_envs - 1개는 get_environment()로 새로 생성합니다.
+
+    Returns:
+         생성된 VectorEnvironment 객체를 반환합니다.
+    """
+    envs = [env] + [get_environment(owner=owner) for _ in range(num_envs - 1)]
+    return VectorEnvironment(envs)
+
+
 def get_rl_model(env, worker_id):
     if DEEP_LEARNING_MODEL == DeepLearningModelName.ActorCriticMLP or DEEP_LEARNING_MODEL == DeepLearningModelName.ActorCriticCNN:
         model = ActorCriticModel(
@@ -204,3 +220,14 @@ def get_optimizer(parameters, learning_rate):
         optimizer = None
 
     return optimizer
+
+
+def get_transport_client(client_id):
+    if TRANSPORT == TransportName.MQTT:
+        client = mqtt.Client(client_id)
+    elif TRANSPORT == TransportName.LOCAL:
+        client = LocalTransportClient(client_id)
+    else:
+        client = None
+
+    return client
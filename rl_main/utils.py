@@ -3,6 +3,7 @@ import math
 import os
 import subprocess
 import sys
+from collections import deque
 import numpy as np
 import torch
 import torch.nn as nn
@@ -13,12 +14,14 @@ idx = os.getcwd().index("{0}rl".format(os.sep))
 PROJECT_HOME = os.getcwd()[:idx+1] + "rl{0}".format(os.sep)
 sys.path.append(PROJECT_HOME)
 
-from rl_main.conf.names import RLAlgorithmName, DeepLearningModelName
+from rl_main.conf.names import RLAlgorithmName, DeepLearningModelName, TransportName
 
 from rl_main.main_constants import MODE_SYNCHRONIZATION, MODE_GRADIENTS_UPDATE, MODE_PARAMETERS_TRANSFER, \
+    MODE_BOUNDED_STALENESS, STALENESS_BOUND, SYNC_ROUND_DEADLINE, SYNC_QUORUM_FRACTION, TRANSPORT, \
+    MODE_RING_ALLREDUCE, WORKERS_PER_AGGREGATOR, \
     ENVIRONMENT_ID, RL_ALGORITHM, DEEP_LEARNING_MODEL, PROJECT_HOME, PYTHON_PATH, MY_PLATFORM, OPTIMIZER, PPO_K_EPOCH, \
-    HIDDEN_1_SIZE, HIDDEN_2_SIZE, HIDDEN_3_SIZE, device, PPO_EPSILON_CLIP, \
-    PPO_VALUE_LOSS_WEIGHT, PPO_ENTROPY_WEIGHT, MODEL_SAVE, EMA_WINDOW, SEED, GAMMA, EPSILON_GREEDY_ACT, EPSILON_DECAY, \
+    HIDDEN_1_SIZE, HIDDEN_2_SIZE, HIDDEN_3_SIZE, ACTOR_CRITIC_SHARED_TRUNK, NUM_ENVS_PER_WORKER, device, PPO_EPSILON_CLIP, \
+    PPO_VALUE_LOSS_WEIGHT, PPO_ENTROPY_WEIGHT, MODEL_SAVE, RESUME, EMA_WINDOW, SEED, GAMMA, EPSILON_GREEDY_ACT, EPSILON_DECAY, \
     EPSILON_START, EPSILON_DECAY_RATE, EPSILON_END, LEARNING_RATE
 
 torch.manual_seed(0) # set random seed
@@ -41,6 +44,57 @@ def exp_moving_average(values, window):
     return a
 
 
+class ExpMovingAverage:
+    """ Incremental implementation of exp_moving_average
+
+    값 하나를 추가할 때마다 최근 window개의 값만 사용하므로 전체 history 길이와 무관하게 일정한 시간이 걸리며,
+    get_series()는 exp_moving_average(values, window)와 같은 결과를 다시 계산 없이 반환합니다.
+    """
+    def __init__(self, window):
+        self.window = window
+
+        # like np.convolve in exp_moving_average, weights[0] is applied to the newest value
+        self.weights = np.exp(np.linspace(-1., 0., window))
+        self.weights /= self.weights.sum()
+
+        self.recent_values = deque(maxlen=window)
+        self.num_values = 0
+        self.sum = 0.0
+
+        # EMA of the values from index window onwards; the first window entries are all equal to ema_tail[0]
+        self.ema_tail = []
+
+    def __len__(self):
+        return self.num_values
+
+    def append(self, value):
+        self.recent_values.appendleft(value)
+        self.num_values += 1
+        self.sum += value
+
+        if self.num_values > self.window:
+            self.ema_tail.append(float(np.dot(self.weights, self.recent_values)))
+
+    @property
+    def value(self):
+        """
+        Returns:
+             exp_moving_average(values, window)[-1]과 같은 값을 반환합니다.
+        """
+        if self.num_values == 0:
+            return 0.0
+        elif self.num_values <= self.window:
+            return self.sum / self.num_values
+        else:
+            return self.ema_tail[-1]
+
+    def get_series(self):
+        if self.num_values <= self.window:
+            return np.full(self.num_values, self.value)
+        else:
+            return np.concatenate([np.full(self.window, self.ema_tail[0]), self.ema_tail])
+
+
 def get_conv2d_size(h, w, kernel_size, padding, stride):
     return math.floor((h - kernel_size + 2 * padding) / stride + 1), math.floor((w - kernel_size + 2 * padding) / stride + 1)
 
@@ -52,17 +106,29 @@ def get_pool2d_size(h, w, kernel_size, stride):
 def print_configuration(env, rl_model):
     print("\n*** GENERAL ***")
     print(" MODEL SAVE: {0}".format(MODEL_SAVE))
+    print(" RESUME: {0}".format(RESUME))
     print(" PLATFORM: {0}".format(MY_PLATFORM))
     print(" EMA WINDOW: {0}".format(EMA_WINDOW))
     print(" SEED: {0}".format(SEED))
 
     print("\n*** MODE ***")
-    if MODE_SYNCHRONIZATION:
+    if MODE_SYNCHRONIZATION and MODE_BOUNDED_STALENESS:
+        print(" MODE1: [BOUNDED_STALENESS_COMMUNICATION (STALENESS_BOUND: {0})] vs. ASYNCHRONOUS_COMMUNICATION".format(
+            STALENESS_BOUND
+        ))
+    elif MODE_SYNCHRONIZATION and SYNC_ROUND_DEADLINE is not None:
+        print(" MODE1: [SYNCHRONOUS_COMMUNICATION (ROUND_DEADLINE: {0}s, QUORUM: {1})] vs. ASYNCHRONOUS_COMMUNICATION".format(
+            SYNC_ROUND_DEADLINE,
+            SYNC_QUORUM_FRACTION
+        ))
+    elif MODE_SYNCHRONIZATION:
         print(" MODE1: [SYNCHRONOUS_COMMUNICATION] vs. ASYNCHRONOUS_COMMUNICATION")
     else:
         print(" MODE1: SYNCHRONOUS_COMMUNICATION vs. [ASYNCHRONOUS_COMMUNICATION]")
 
-    if MODE_GRADIENTS_UPDATE:
+    if MODE_GRADIENTS_UPDATE and MODE_RING_ALLREDUCE:
+        print(" MODE2: [GRADIENTS_UPDATE (RING_ALLREDUCE)] vs. NO GRADIENTS_UPDATE")
+    elif MODE_GRADIENTS_UPDATE:
         print(" MODE2: [GRADIENTS_UPDATE] vs. NO GRADIENTS_UPDATE")
     else:
         print(" MODE2: GRADIENTS_UPDATE vs. [NO GRADIENTS_UPDATE]")
@@ -72,10 +138,22 @@ def print_configuration(env, rl_model):
     else:
         print(" MODE3: PARAMETERS_TRANSFER vs. [NO PARAMETERS_TRANSFER]")
 
+    if WORKERS_PER_AGGREGATOR > 0:
+        print(" AGGREGATION: [HIERARCHICAL (WORKERS_PER_AGGREGATOR: {0})] vs. DIRECT".format(WORKERS_PER_AGGREGATOR))
+    else:
+        print(" AGGREGATION: HIERARCHICAL vs. [DIRECT]")
+
+    if TRANSPORT == TransportName.LOCAL:
+        print(" TRANSPORT: [LOCAL (SHARED MEMORY)] vs. MQTT")
+    else:
+        print(" TRANSPORT: LOCAL (SHARED MEMORY) vs. [MQTT]")
+
     print("\n*** MY_PLATFORM & ENVIRONMENT ***")
     print(" Platform: " + MY_PLATFORM.value)
     print(" Environment Name: " + ENVIRONMENT_ID.value)
     print(" Action Space: {0} - {1}".format(env.get_n_actions(), env.action_meanings))
+    if RL_ALGORITHM in (RLAlgorithmName.PPO_V0, RLAlgorithmName.DQN_V0):
+        print(" NUM_ENVS_PER_WORKER: {0}".format(NUM_ENVS_PER_WORKER))
 
     print("\n*** RL ALGORITHM ***")
     print(" RL Algorithm: {0}".format(RL_ALGORITHM.value))
@@ -87,6 +165,8 @@ def print_configuration(env, rl_model):
 
     print("\n*** MODEL ***")
     print(" Deep Learning Model: {0}".format(DEEP_LEARNING_MODEL.value))
+    if DEEP_LEARNING_MODEL in (DeepLearningModelName.ActorCriticCNN, DeepLearningModelName.ActorCriticMLP):
+        print(" ACTOR_CRITIC_SHARED_TRUNK: {0}".format(ACTOR_CRITIC_SHARED_TRUNK))
     if DEEP_LEARNING_MODEL == DeepLearningModelName.ActorCriticCNN:
         print(" input_width: {0}, input_height: {1}, input_channels: {2}, a_size: {3}, continuous: {4}".format(
             rl_model.input_width,
@@ -169,7 +249,20 @@ def make_output_folders():
         os.makedirs(os.path.join(PROJECT_HOME, "save_results"))
 
 
-def run_chief():
+def check_configuration():
+    """
+    main_constants에서 함께 사용할 수 없는 설정들을 확인합니다.
+    """
+    if MODE_BOUNDED_STALENESS and WORKERS_PER_AGGREGATOR > 0:
+        # an aggregator forwards the sum of its workers' gradients, so the chief cannot weight each worker by its staleness
+        raise ValueError("MODE_BOUNDED_STALENESS cannot be used with WORKERS_PER_AGGREGATOR > 0")
+
+
+def get_resume_argument(resume_episode):
+    return "" if resume_episode is None else " {0}".format(resume_episode)
+
+
+def run_chief(resume_episode=None):
     try:
         # with subprocess.Popen([PYTHON_PATH, os.path.join(PROJECT_HOME, "rl_main", "chief_workers", "chief_mqtt_main.py")], shell=False, bufsize=1, stdout=sys.stdout, stderr=sys.stdout) as proc:
         #     output = ""
@@ -180,7 +273,7 @@ def run_chief():
         #         if line == "":
         #             break
         #         output += line
-        os.system(PYTHON_PATH + " " + os.path.join(PROJECT_HOME, "rl_main", "chief_workers", "chief_mqtt_main.py"))
+        os.system(PYTHON_PATH + " " + os.path.join(PROJECT_HOME, "rl_main", "chief_workers", "chief_mqtt_main.py") + get_resume_argument(resume_episode))
         sys.stdout = open(os.path.join(PROJECT_HOME, "out_err", "chief_stdout.out"), "wb")
         sys.stderr = open(os.path.join(PROJECT_HOME, "out_err", "chief_stderr.out"), "wb")
     except KeyboardInterrupt:
@@ -188,9 +281,9 @@ def run_chief():
         sys.stdout.flush()
 
 
-def run_worker(worker_id):
+def run_worker(worker_id, resume_episode=None):
     try:
-        os.system(PYTHON_PATH + " " + os.path.join(PROJECT_HOME, "rl_main", "chief_workers", "worker_mqtt_main.py") + " {0}".format(worker_id))
+        os.system(PYTHON_PATH + " " + os.path.join(PROJECT_HOME, "rl_main", "chief_workers", "worker_mqtt_main.py") + " {0}".format(worker_id) + get_resume_argument(resume_episode))
         sys.stdout = open(os.path.join(PROJECT_HOME, "out_err", "worker_{0}_stdout.out").format(worker_id), "wb")
         sys.stderr = open(os.path.join(PROJECT_HOME, "out_err", "worker_{0}_stderr.out").format(worker_id), "wb")
     except KeyboardInterrupt:
@@ -198,6 +291,16 @@ def run_worker(worker_id):
         sys.stderr.flush()
 
 
+def run_aggregator(aggregator_id):
+    try:
+        os.system(PYTHON_PATH + " " + os.path.join(PROJECT_HOME, "rl_main", "chief_workers", "aggregator_mqtt_main.py") + " {0}".format(aggregator_id))
+        sys.stdout = open(os.path.join(PROJECT_HOME, "out_err", "aggregator_{0}_stdout.out").format(aggregator_id), "wb")
+        sys.stderr = open(os.path.join(PROJECT_HOME, "out_err", "aggregator_{0}_stderr.out").format(aggregator_id), "wb")
+    except KeyboardInterrupt:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+
 def util_init(module, weight_init, bias_init, gain=1):
     weight_init(module.weight.data, gain=gain)
     bias_init(module.bias.data)